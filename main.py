@@ -1,26 +1,44 @@
 import logging
 from aiogram import executor
+from aiohttp import web
 from src.bot.config import *
 from src.bot.bot_setup import *
 from src.bot.startup_shutdown import *
 from src.bot.handlers.client_handlers import *
 from src.bot.handlers.admin_handlers import *
-from src.bot.handlers.common_handlers import *
 from src.bot.handlers.callback_handlers import *
 from src.bot.handlers.handlers_my_clients import *
 from src.utils.logging_utils import create_custom_logger
 from src.middlewares.logging_middleware import LoggingMiddleware
 from src.middlewares.forward_to_admin_middleware import ForwardToAdminMiddleware
+from src.middlewares.db_session_middleware import DBSessionMiddleware
+from src.middlewares.query_stats_middleware import QueryStatsMiddleware
+from src.middlewares.metrics_middleware import MetricsMiddleware
+from src.utils.metrics import add_metrics_route
 #from src.middlewares.read_status_middleware import ReadStatusMiddleware
 
 # Create and configure the custom logger
 custom_logger = create_custom_logger()
 logging.basicConfig(level=logging.INFO)
 
+# Update and handler latencies for /metrics. aiogram runs post-process hooks in setup order too,
+# so the update clock starts in the first middleware and stops in the last one (its finisher)
+metrics_middleware = MetricsMiddleware()
+dp.middleware.setup(metrics_middleware)
+
+# SQL statement counts per update and handler, with N+1 detection
+dp.middleware.setup(QueryStatsMiddleware())
+
+# One database unit of work per update, shared by the handlers and the middlewares below
+dp.middleware.setup(DBSessionMiddleware(async_database, database))
+
 # Set up logging middleware
 dp.middleware.setup(LoggingMiddleware(custom_logger))
 dp.middleware.setup(ForwardToAdminMiddleware())
 
+# Must stay the last middleware, see MetricsMiddleware
+dp.middleware.setup(metrics_middleware.finisher())
+
 if __name__ == "__main__":
     try:
         logging.info("Bot is starting...")
@@ -34,6 +52,7 @@ if __name__ == "__main__":
             executor.start_webhook(
                 dispatcher=dp,
                 webhook_path="/",
+                web_app=add_metrics_route(web.Application()),
                 on_startup=on_startup,
                 on_shutdown=on_shutdown,
                 skip_updates=False,
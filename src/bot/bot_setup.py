@@ -4,18 +4,26 @@ logger = logging.getLogger(__name__)
 
 logger.info("bot_setup.py")
 from aiogram import Bot, Dispatcher
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.dispatcher.middlewares import LifetimeControllerMiddleware
 
 from src.db.azure_db import AzureSQLService
 from src.db.aws_db import AWSRDSService
-from .config import TG_BOT_TOKEN, DATABASE_TYPE
+from src.db.async_db import AsyncDatabaseService
+from src.db.write_behind import UserTouchBuffer
+from src.db.message_mapping import MessageMappingStore
+from src.db.connection_snapshots import ConnectionSnapshotCache
+from src.services.iproxyService import IProxyManager
+from src.services.localtonetService import LocaltonetManager
+from src.utils.outbound import OutboundDispatcher
+from .fsm_storage import create_fsm_storage
+from .router import Router
+from src.utils.callback_data import token_registry
+from .config import TG_BOT_TOKEN, DATABASE_TYPE, IPROXY_API_KEY, LOCALTONET_API_KEY, FSM_STORAGE
 
-# Create bot, dispatcher, and middleware
+# Create bot
 bot = Bot(TG_BOT_TOKEN)
-dp = Dispatcher(bot, storage=MemoryStorage())
-lifetime_controller_middleware = LifetimeControllerMiddleware()
-dp.middleware.setup(lifetime_controller_middleware)
+# Forwarding, notifications and admin replies go through the rate-limited send queue
+outbound = OutboundDispatcher(bot)
 
 # Initialize the database based on the DATABASE_TYPE
 logger.info(f"Initializing database for {DATABASE_TYPE}")
@@ -26,8 +34,29 @@ elif DATABASE_TYPE == "aws":
 else:
     raise ValueError("Unsupported DATABASE_TYPE. Please set it to either 'azure' or 'aws'.")
 
+# Handlers talk to the database through the async engine so queries don't block the event loop
+async_database = AsyncDatabaseService(tunnel=getattr(database, 'tunnel', None))
+user_touch_buffer = UserTouchBuffer(async_database)
+# Admin-chat forwards -> original user messages, for routing admin replies
+message_mappings = MessageMappingStore(async_database)
+# Users' connections for re-rendering keyboards without a query per button press
+connection_snapshots = ConnectionSnapshotCache(async_database)
+# One manager per provider, shared by handlers and scheduled syncs so they share its sync lock and memos
+iproxy_manager = IProxyManager(IPROXY_API_KEY, database=database)
+localtonet_manager = LocaltonetManager(LOCALTONET_API_KEY)
+
+# Create dispatcher and middleware; FSM states live outside the process so they survive restarts
+# and are shared between replicas
+fsm_storage = create_fsm_storage(async_database)
+dp = Dispatcher(bot, storage=fsm_storage)
+# Oversized callback data is resolvable on every replica and after a restart (MemoryStorage isn't shared)
+if FSM_STORAGE != 'memory':
+    token_registry.bind(fsm_storage)
+lifetime_controller_middleware = LifetimeControllerMiddleware()
+dp.middleware.setup(lifetime_controller_middleware)
+# Menu texts and callback data are dispatched by table lookup rather than a chain of lambda filters
+router = Router(dp)
+
 #database.create_tables()
 
 # ... rest of your bot setup (import handlers, etc.) ...
-
-client_message_mapping = {}
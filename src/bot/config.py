@@ -18,6 +18,9 @@ ADMIN_CHAT_ID = int(os.getenv('ADMIN_CHAT_ID'))
 EMAIL = os.environ.get("EMAIL")
 PASSWORD = os.environ.get("PASSWORD")
 
+# Point every provider client at the local fake provider (python -m src.dev.fake_provider)
+FAKE_PROVIDER_URL = os.getenv('FAKE_PROVIDER_URL')
+
 # iProxy
 IPROXY_API_KEY = os.environ.get("IPROXY_API_KEY")
 IPROXY_API_KEY = os.environ.get("IPROXY_API_KEY")
@@ -26,12 +29,90 @@ API_SMS_URL = f'https://api.iproxy.online/v1/connections/{ID_PROXY_SMS}/sms_hist
 IPROXY_PATCH_URL = 'https://api.iproxy.online/v1/connections/'
 IPROXY_TOKEN = os.environ.get("IPROXY_TOKEN")
 AUTH_HEADER = {"Authorization": IPROXY_TOKEN}
-BASE_API_URL = 'https://api.iproxy.online/v1/'
+IPROXY_BASE_URL = f"{FAKE_PROVIDER_URL}/iproxy/v1" if FAKE_PROVIDER_URL else os.getenv('IPROXY_BASE_URL', 'https://api.iproxy.online/v1')
+BASE_API_URL = f"{IPROXY_BASE_URL}/"
 
 USER_TIMEZONE = os.getenv('USER_TIMEZONE', 'Europe/Warsaw')
 
+IPROXY_PUSH_URL = f"{FAKE_PROVIDER_URL}/iproxy-rt" if FAKE_PROVIDER_URL else os.getenv('IPROXY_PUSH_URL', 'https://iproxy.online/api-rt')
+# Token of the phone refresh push API; restarting connections is disabled without it
+IPROXY_PUSH_TOKEN = os.environ.get("IPROXY_PUSH_TOKEN")
+
 ### Localtonet ###
 LOCALTONET_API_KEY = os.environ.get("LOCALTONET_API_KEY")
+LOCALTONET_BASE_URL = f"{FAKE_PROVIDER_URL}/localtonet/api" if FAKE_PROVIDER_URL else os.getenv('LOCALTONET_BASE_URL', 'https://localtonet.com/api')
+
+# Sync fan-out: concurrent per-proxy connection fetches, overridable per provider
+SYNC_FANOUT_WIDTH = int(os.getenv('SYNC_FANOUT_WIDTH', 10))
+IPROXY_MAX_CONCURRENCY = int(os.getenv('IPROXY_MAX_CONCURRENCY', SYNC_FANOUT_WIDTH))
+LOCALTONET_MAX_CONCURRENCY = int(os.getenv('LOCALTONET_MAX_CONCURRENCY', SYNC_FANOUT_WIDTH))
+
+# Background sync cadence per provider (seconds) and random spread as a fraction of the interval
+IPROXY_SYNC_INTERVAL = int(os.getenv('IPROXY_SYNC_INTERVAL', 3600))
+LOCALTONET_SYNC_INTERVAL = int(os.getenv('LOCALTONET_SYNC_INTERVAL', 2 * 3600))
+SYNC_JITTER = float(os.getenv('SYNC_JITTER', 0.1))
+# Regular syncs are incremental; a full reconcile (which also catches deletions) runs at least this often
+SYNC_FULL_RECONCILE_INTERVAL = int(os.getenv('SYNC_FULL_RECONCILE_INTERVAL', 24 * 3600))
+
+# How long a Localtonet tunnel expiration date is trusted without re-fetching it (seconds)
+LOCALTONET_EXPIRATION_TTL = int(os.getenv('LOCALTONET_EXPIRATION_TTL', 3600))
+
+# Max age of the in-memory provider inventory before a handler refreshes it live (seconds)
+PROVIDER_INVENTORY_TTL = int(os.getenv('PROVIDER_INVENTORY_TTL', 3 * 3600))
+
+# Provider HTTP clients (seconds)
+PROVIDER_HTTP_TIMEOUT = float(os.getenv('PROVIDER_HTTP_TIMEOUT', 15))
+PROVIDER_HTTP_CONNECT_TIMEOUT = float(os.getenv('PROVIDER_HTTP_CONNECT_TIMEOUT', 5))
+PROVIDER_HTTP_POOL_SIZE = int(os.getenv('PROVIDER_HTTP_POOL_SIZE', 20))
+PROVIDER_DNS_TTL = int(os.getenv('PROVIDER_DNS_TTL', 300))
+# Per-provider rate limit (requests per second, burst) and retries on 429/5xx
+PROVIDER_RATE_LIMIT = float(os.getenv('PROVIDER_RATE_LIMIT', 5))
+PROVIDER_RATE_BURST = int(os.getenv('PROVIDER_RATE_BURST', 10))
+PROVIDER_MAX_RETRIES = int(os.getenv('PROVIDER_MAX_RETRIES', 3))
+PROVIDER_BACKOFF_BASE = float(os.getenv('PROVIDER_BACKOFF_BASE', 0.5))
+PROVIDER_BACKOFF_MAX = float(os.getenv('PROVIDER_BACKOFF_MAX', 30))
+# Circuit breaker: consecutive failures before opening, seconds before a half-open probe
+PROVIDER_BREAKER_THRESHOLD = int(os.getenv('PROVIDER_BREAKER_THRESHOLD', 5))
+PROVIDER_BREAKER_RESET = float(os.getenv('PROVIDER_BREAKER_RESET', 30))
+
+# SQL instrumentation: log every statement and per-update totals, and the N+1 warning threshold
+SQL_DEBUG = os.getenv('SQL_DEBUG', 'false').lower() in ('1', 'true', 'yes')
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv('SQL_N_PLUS_ONE_THRESHOLD', 5))
+
+# Prometheus metrics: served on /metrics next to the webhook; in long polling mode on METRICS_PORT, if set
+METRICS_PORT = os.getenv('METRICS_PORT')
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv('EVENT_LOOP_LAG_INTERVAL', 0.5))
+
+# Outbound Telegram calls: global calls per second, seconds between calls to one private chat / group,
+# calls in flight, RetryAfter retries per call and seconds to drain the queue on shutdown
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', 25))
+OUTBOUND_CHAT_INTERVAL = float(os.getenv('OUTBOUND_CHAT_INTERVAL', 1.0))
+OUTBOUND_GROUP_INTERVAL = float(os.getenv('OUTBOUND_GROUP_INTERVAL', 3.0))
+OUTBOUND_CONCURRENCY = int(os.getenv('OUTBOUND_CONCURRENCY', 10))
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', 3))
+OUTBOUND_DRAIN_TIMEOUT = float(os.getenv('OUTBOUND_DRAIN_TIMEOUT', 10))
+
+# FSM storage: 'redis' (needs REDIS_URL and the redis package), 'sql' (FSMStates table) or 'memory';
+# defaults to redis when REDIS_URL is set and sql otherwise. States idle for FSM_STATE_TTL seconds expire.
+REDIS_URL = os.getenv('REDIS_URL')
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'redis' if REDIS_URL else 'sql').lower()
+FSM_REDIS_PREFIX = os.getenv('FSM_REDIS_PREFIX', 'fsm')
+FSM_STATE_TTL = int(os.getenv('FSM_STATE_TTL', 7 * 86400))
+FSM_FLUSH_INTERVAL = float(os.getenv('FSM_FLUSH_INTERVAL', 0.05))
+
+# Broadcasts: recipients read per batch, seconds between progress updates
+BROADCAST_BATCH_SIZE = int(os.getenv('BROADCAST_BATCH_SIZE', 500))
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv('BROADCAST_PROGRESS_INTERVAL', 5))
+
+# Inline button data: HMAC key (derived from the bot token if unset), seconds payment buttons stay valid,
+# and how many server-side tokens for payloads over Telegram's 64 bytes are kept in memory
+CALLBACK_SECRET = os.getenv('CALLBACK_SECRET')
+CALLBACK_DATA_TTL = int(os.getenv('CALLBACK_DATA_TTL', 86400))
+CALLBACK_TOKEN_CACHE_SIZE = int(os.getenv('CALLBACK_TOKEN_CACHE_SIZE', 20000))
+
+# Per-user connection snapshots that keyboards are re-rendered from: users kept, seconds a snapshot is used
+CONNECTION_SNAPSHOT_CACHE_SIZE = int(os.getenv('CONNECTION_SNAPSHOT_CACHE_SIZE', 2000))
+CONNECTION_SNAPSHOT_TTL = float(os.getenv('CONNECTION_SNAPSHOT_TTL', 600))
 
 # Payment methods
 PM_BINANCE_USDT_TRC20 = os.environ.get("PM_BINANCE_USDT_TRC20")
@@ -54,6 +135,33 @@ SSH_USER = os.getenv('SSH_USER')
 SSH_PKEY = os.getenv('SSH_PKEY')
 USE_SSH = os.getenv('USE_SSH', 'False').lower() == 'true'
 
+# Connection pool
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))
+
+# Async engine (aiomysql/asyncmy for MySQL, or a full URL such as sqlite+aiosqlite:///local.db for local runs)
+ASYNC_DB_DRIVER = os.getenv('ASYNC_DB_DRIVER', 'aiomysql')
+ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL')
+
+# Seconds between write-behind flushes of last_message_at / telegram_chat_id
+USER_TOUCH_FLUSH_INTERVAL = float(os.getenv('USER_TOUCH_FLUSH_INTERVAL', 5))
+
+# In-process identity cache (telegram_user_id -> user row)
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 900))
+
+# Admin client list: clients per page, seconds the total count shown as "page x/y" is reused
+CLIENT_PAGE_SIZE = int(os.getenv('CLIENT_PAGE_SIZE', 5))
+CLIENT_COUNT_TTL = float(os.getenv('CLIENT_COUNT_TTL', 60))
+
+# Admin-chat forwards -> original user messages: entries kept in memory, days kept in the DB,
+# seconds between write-behind flushes and between cleanups of expired rows
+FORWARD_MAPPING_CACHE_SIZE = int(os.getenv('FORWARD_MAPPING_CACHE_SIZE', 5000))
+FORWARD_MAPPING_TTL_DAYS = int(os.getenv('FORWARD_MAPPING_TTL_DAYS', 90))
+FORWARD_MAPPING_FLUSH_INTERVAL = float(os.getenv('FORWARD_MAPPING_FLUSH_INTERVAL', 2))
+FORWARD_MAPPING_CLEANUP_INTERVAL = float(os.getenv('FORWARD_MAPPING_CLEANUP_INTERVAL', 86400))
+
 if DATABASE_TYPE == "azure":
     SQL_CONNECTIONSTRING = URL.create(
         "mssql+pymssql",
@@ -0,0 +1,265 @@
+import asyncio
+import json
+import logging
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher.storage import BaseStorage
+from sqlalchemy import select, delete, and_, or_
+
+from src.bot.config import FSM_STORAGE, REDIS_URL, FSM_REDIS_PREFIX, FSM_STATE_TTL, FSM_FLUSH_INTERVAL
+from src.db.bulk_upsert import bulk_upsert
+from src.db.models.db_models import FSMRecord, current_datetime_utc
+
+logger = logging.getLogger(__name__)
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'__decimal__': str(value)}
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"{type(value).__name__} can't be stored in FSM data")
+
+
+def _decode_object(obj: dict):
+    if len(obj) == 1:
+        if '__datetime__' in obj:
+            return datetime.fromisoformat(obj['__datetime__'])
+        if '__date__' in obj:
+            return date.fromisoformat(obj['__date__'])
+        if '__decimal__' in obj:
+            return Decimal(obj['__decimal__'])
+    return obj
+
+
+def dumps(data) -> str:
+    """Compact JSON of FSM data; datetimes, dates and Decimals survive the round trip through loads()."""
+    return json.dumps(data, default=_encode_value, separators=(',', ':'), ensure_ascii=False)
+
+
+def loads(raw: Optional[str]):
+    return json.loads(raw, object_hook=_decode_object) if raw else {}
+
+
+class JSONSafeStorage(BaseStorage):
+    """Wraps a storage that keeps data as plain JSON (Redis) so handlers can still store datetimes."""
+
+    def __init__(self, storage: BaseStorage):
+        self.storage = storage
+
+    async def close(self):
+        await self.storage.close()
+
+    async def wait_closed(self):
+        await self.storage.wait_closed()
+
+    async def get_state(self, *, chat=None, user=None, default=None):
+        return await self.storage.get_state(chat=chat, user=user, default=default)
+
+    async def set_state(self, *, chat=None, user=None, state=None):
+        await self.storage.set_state(chat=chat, user=user, state=state)
+
+    async def get_data(self, *, chat=None, user=None, default=None) -> Dict:
+        data = await self.storage.get_data(chat=chat, user=user, default=None)
+        return loads(json.dumps(data)) if data else (default or {})
+
+    async def set_data(self, *, chat=None, user=None, data=None):
+        await self.storage.set_data(chat=chat, user=user, data=json.loads(dumps(data or {})))
+
+    async def update_data(self, *, chat=None, user=None, data=None, **kwargs):
+        current = await self.get_data(chat=chat, user=user)
+        current.update(data or {}, **kwargs)
+        await self.set_data(chat=chat, user=user, data=current)
+
+    def has_bucket(self):
+        return self.storage.has_bucket()
+
+    async def get_bucket(self, *, chat=None, user=None, default=None) -> Dict:
+        return await self.storage.get_bucket(chat=chat, user=user, default=default)
+
+    async def set_bucket(self, *, chat=None, user=None, bucket=None):
+        await self.storage.set_bucket(chat=chat, user=user, bucket=bucket)
+
+    async def update_bucket(self, *, chat=None, user=None, bucket=None, **kwargs):
+        await self.storage.update_bucket(chat=chat, user=user, bucket=bucket, **kwargs)
+
+
+_EMPTY = {'state': None, 'data': None, 'bucket': None}
+
+
+class SQLStorage(BaseStorage):
+    """FSM storage in the FSMStates table, shared by every bot replica that uses the database.
+
+    State, data and bucket of a user live in one compact row. Changes are coalesced per user
+    and written in one bulk upsert every `flush_interval` seconds (a handler calling update_data
+    three times costs one write); records that become empty are deleted instead. Reads see
+    unflushed changes. Rows idle for longer than `ttl` are ignored and removed by cleanup().
+    """
+
+    def __init__(self, async_database, ttl: int = FSM_STATE_TTL, flush_interval: float = FSM_FLUSH_INTERVAL):
+        self.async_database = async_database
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self._pending: Dict[Tuple[int, int], dict] = {}
+        self._flushing: Dict[Tuple[int, int], dict] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def _key(self, chat, user) -> Tuple[int, int]:
+        chat, user = self.check_address(chat=chat, user=user)
+        return int(chat), int(user)
+
+    def _cutoff(self):
+        return current_datetime_utc() - timedelta(seconds=self.ttl)
+
+    def _unflushed(self, key) -> Optional[dict]:
+        return self._pending.get(key) or self._flushing.get(key)
+
+    async def _load(self, key) -> dict:
+        record = self._unflushed(key)
+        if record is not None:
+            return record
+        async with self.async_database.get_session() as session:
+            result = await session.execute(
+                select(FSMRecord.state, FSMRecord.data, FSMRecord.bucket).where(
+                    FSMRecord.chat_id == key[0], FSMRecord.user_id == key[1], FSMRecord.updated_at >= self._cutoff()
+                )
+            )
+            row = result.first()
+        if row is None:
+            return _EMPTY
+        return {'state': row.state, 'data': row.data, 'bucket': row.bucket}
+
+    async def _store(self, key, **changes):
+        record = await self._load(key)
+        # Another coroutine may have changed the record while we were reading it
+        record = dict(self._unflushed(key) or record)
+        record.update(changes)
+        self._pending[key] = record
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        # A flush that is running (and may be the caller) reschedules itself for what is left
+        if self._flush_task is None or self._flush_task.done() or self._flush_task is asyncio.current_task():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        self._flushing, self._pending = self._pending, {}
+        now = current_datetime_utc()
+        rows, empty = [], []
+        for (chat_id, user_id), record in self._flushing.items():
+            if record == _EMPTY:
+                empty.append(and_(FSMRecord.chat_id == chat_id, FSMRecord.user_id == user_id))
+            else:
+                rows.append({'chat_id': chat_id, 'user_id': user_id, 'updated_at': now, **record})
+        try:
+            async with self.async_database.Session() as session:
+                if rows:
+                    await session.run_sync(lambda sync_session: bulk_upsert(
+                        sync_session, FSMRecord, rows, ['state', 'data', 'bucket', 'updated_at']
+                    ))
+                if empty:
+                    await session.execute(delete(FSMRecord).where(or_(*empty)))
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Failed to write {len(self._flushing)} FSM records: {e}")
+            # Keep them for the next flush unless they changed meanwhile
+            for key, record in self._flushing.items():
+                self._pending.setdefault(key, record)
+        finally:
+            self._flushing = {}
+            # Changes stored while this flush awaited the database, or kept after it failed
+            if self._pending:
+                self._schedule_flush()
+
+    async def cleanup(self) -> int:
+        """Deletes the records idle for longer than the TTL; returns how many were removed."""
+        async with self.async_database.engine.begin() as conn:
+            result = await conn.execute(delete(FSMRecord).where(FSMRecord.updated_at < self._cutoff()))
+        return result.rowcount
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
+        if self._flush_task is not None and not self._flush_task.done():
+            # Left over by a failed final flush; nothing is going to run it
+            self._flush_task.cancel()
+
+    async def wait_closed(self):
+        pass
+
+    async def get_state(self, *, chat=None, user=None, default=None) -> Optional[str]:
+        record = await self._load(self._key(chat, user))
+        return record['state'] or self.resolve_state(default)
+
+    async def set_state(self, *, chat=None, user=None, state=None):
+        await self._store(self._key(chat, user), state=self.resolve_state(state))
+
+    async def get_data(self, *, chat=None, user=None, default=None) -> Dict:
+        record = await self._load(self._key(chat, user))
+        return loads(record['data']) if record['data'] else (default or {})
+
+    async def set_data(self, *, chat=None, user=None, data=None):
+        await self._store(self._key(chat, user), data=dumps(data) if data else None)
+
+    async def update_data(self, *, chat=None, user=None, data=None, **kwargs):
+        current = await self.get_data(chat=chat, user=user)
+        current.update(data or {}, **kwargs)
+        await self.set_data(chat=chat, user=user, data=current)
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *, chat=None, user=None, default=None) -> Dict:
+        record = await self._load(self._key(chat, user))
+        return loads(record['bucket']) if record['bucket'] else (default or {})
+
+    async def set_bucket(self, *, chat=None, user=None, bucket=None):
+        await self._store(self._key(chat, user), bucket=dumps(bucket) if bucket else None)
+
+    async def update_bucket(self, *, chat=None, user=None, bucket=None, **kwargs):
+        current = await self.get_bucket(chat=chat, user=user)
+        current.update(bucket or {}, **kwargs)
+        await self.set_bucket(chat=chat, user=user, bucket=current)
+
+
+def create_fsm_storage(async_database) -> BaseStorage:
+    """The FSM storage selected by FSM_STORAGE."""
+    if FSM_STORAGE == 'memory':
+        return MemoryStorage()
+    if FSM_STORAGE == 'sql':
+        return SQLStorage(async_database)
+    if FSM_STORAGE == 'redis':
+        if not REDIS_URL:
+            raise ValueError("FSM_STORAGE=redis needs REDIS_URL.")
+        # Imported here so the redis package is only required when it is used
+        from aiogram.contrib.fsm_storage.redis import RedisStorage2
+
+        url = urlparse(REDIS_URL)
+        return JSONSafeStorage(RedisStorage2(
+            host=url.hostname or 'localhost',
+            port=url.port or 6379,
+            db=int(url.path.lstrip('/') or 0),
+            password=url.password,
+            ssl=url.scheme == 'rediss',
+            prefix=FSM_REDIS_PREFIX,
+            state_ttl=FSM_STATE_TTL,
+            data_ttl=FSM_STATE_TTL,
+            bucket_ttl=FSM_STATE_TTL,
+        ))
+    raise ValueError(f"Unsupported FSM_STORAGE '{FSM_STORAGE}'. Use 'redis', 'sql' or 'memory'.")
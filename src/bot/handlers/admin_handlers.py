@@ -6,21 +6,152 @@ from aiogram.types import ContentTypes
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from sqlalchemy.exc import SQLAlchemyError
 
-from src.bot.bot_setup import bot, dp, database
+from src.bot.bot_setup import bot, dp, router, database, async_database, outbound
 from src.db.models.db_models import User
 from src.bot.config import ADMIN_CHAT_ID
 from src.utils.keyboards import admin_main_menu
 from src.db.repositories.user_repositories import UserRepository
-from src.middlewares.forward_to_admin_middleware import forwarded_message_mapping
 from src.db.aws_db import aws_rds_service
+from src.utils.scheduler import scheduler
+from src.services.providerHttpClient import provider_clients_status
+from src.db.instrumentation import handler_totals
+from src.services.broadcast import BroadcastSegment, broadcasts
 
 class AdminStates(StatesGroup):
     waiting_for_message = State()
+    waiting_for_broadcast_message = State()
+    confirming_broadcast = State()
+    waiting_for_client_search = State()
 
 @dp.message_handler(lambda message: message.from_user.id == ADMIN_CHAT_ID, commands=['start'])
 async def admin_start_command(message: types.Message):
     await message.reply("Welcome, admin!", reply_markup=admin_main_menu())
 
+def format_job_status(job: dict) -> str:
+    lines = [f"{job['name']} (every {job['interval'] // 60:.0f} min, {job['runs']} runs, {job['failures']} failed)"]
+    if job['running']:
+        lines.append("Running now")
+    if job['last_started_at']:
+        lines.append(
+            f"Last: {job['last_started_at'].strftime('%d/%m %H:%M:%S')}, "
+            f"{job['last_duration']:.1f}s, {job['last_outcome']}"
+        )
+    if job['next_in'] is not None:
+        lines.append(f"Next in {job['next_in'] / 60:.0f} min")
+    return "\n".join(lines)
+
+@dp.message_handler(lambda message: message.from_user.id == ADMIN_CHAT_ID, commands=['jobs'])
+async def admin_jobs_command(message: types.Message):
+    jobs = scheduler.status()
+    if not jobs:
+        await message.reply("No background jobs are scheduled.")
+        return
+    await message.reply("\n\n".join(format_job_status(job) for job in jobs))
+
+@dp.message_handler(lambda message: message.from_user.id == ADMIN_CHAT_ID, commands=['run_job'])
+async def admin_run_job_command(message: types.Message):
+    name = message.get_args().strip()
+    if not name:
+        names = ", ".join(job.name for job in scheduler.jobs)
+        await message.reply(f"Usage: /run_job <name>\nJobs: {names}")
+        return
+    if scheduler.get_job(name) is None:
+        await message.reply(f"Unknown job: {name}")
+    elif scheduler.run_now(name):
+        await message.reply(f"Job {name} started. Check /jobs for the result.")
+    else:
+        await message.reply(f"Job {name} is already running.")
+
+@dp.message_handler(lambda message: message.from_user.id == ADMIN_CHAT_ID, commands=['providers'])
+async def admin_providers_command(message: types.Message):
+    clients = provider_clients_status()
+    if not clients:
+        await message.reply("No provider has been called yet.")
+        return
+    lines = []
+    for client in clients:
+        line = f"{client['name']}: {client['state']}, {client['failures']} failures, {client['tokens']} tokens"
+        if client['retry_in'] is not None:
+            line += f", probe in {client['retry_in']:.0f}s"
+        if client['last_error'] and client['state'] != 'closed':
+            line += f"\nLast error: {client['last_error']}"
+        lines.append(line)
+    await message.reply("\n\n".join(lines))
+
+@dp.message_handler(lambda message: message.from_user.id == ADMIN_CHAT_ID, commands=['sqlstats'])
+async def admin_sql_stats_command(message: types.Message):
+    if not handler_totals:
+        await message.reply("No SQL statistics yet.")
+        return
+    ranked = sorted(handler_totals.items(), key=lambda item: item[1].statements / item[1].updates, reverse=True)
+    lines = [
+        f"{handler}: {totals.statements / totals.updates:.1f} stmts/update (max {totals.max_statements}), "
+        f"{totals.seconds * 1000 / totals.updates:.1f}ms/update, {totals.updates} updates, "
+        f"{totals.n_plus_one} with repeated statements"
+        for handler, totals in ranked[:15]
+    ]
+    await message.reply("\n".join(lines))
+
+@dp.message_handler(lambda message: message.from_user.id == ADMIN_CHAT_ID, commands=['broadcast'])
+async def admin_broadcast_command(message: types.Message, state: FSMContext):
+    try:
+        segment = BroadcastSegment.parse(message.get_args().strip())
+    except ValueError as e:
+        await message.reply(f"Usage: /broadcast <segment>\n{e}")
+        return
+    async with async_database.get_user_repository() as user_repo:
+        recipients = await user_repo.count_recipients(segment.criteria())
+    if not recipients:
+        await message.reply(f"No {segment} to send to.")
+        return
+    await state.update_data(broadcast_segment=message.get_args().strip(), broadcast_recipients=recipients)
+    await AdminStates.waiting_for_broadcast_message.set()
+    keyboard = types.InlineKeyboardMarkup()
+    keyboard.add(types.InlineKeyboardButton(text="Cancel", callback_data="cancel"))
+    await message.reply(f"Send the message to broadcast to {recipients} {segment}:", reply_markup=keyboard)
+
+@dp.message_handler(state=AdminStates.waiting_for_broadcast_message, content_types=ContentTypes.ANY)
+async def admin_broadcast_message(message: types.Message, state: FSMContext):
+    data = await state.get_data()
+    await state.update_data(broadcast_message_id=message.message_id)
+    await AdminStates.confirming_broadcast.set()
+    keyboard = types.InlineKeyboardMarkup()
+    keyboard.add(
+        types.InlineKeyboardButton(text=f"Send to {data['broadcast_recipients']} users", callback_data="broadcast_confirm"),
+        types.InlineKeyboardButton(text="Cancel", callback_data="cancel"),
+    )
+    await message.reply("Send this message?", reply_markup=keyboard)
+
+@router.callback("broadcast_confirm", state=AdminStates.confirming_broadcast, exact=True)
+async def admin_broadcast_confirm(query: types.CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    await state.finish()
+    segment = BroadcastSegment.parse(data['broadcast_segment'])
+    broadcast = broadcasts.start(async_database, outbound, segment, query.message.chat.id, data['broadcast_message_id'])
+    await query.message.edit_text(f"Broadcast #{broadcast.id} started. /broadcast_status, /broadcast_cancel {broadcast.id}")
+    await bot.answer_callback_query(query.id)
+
+@dp.message_handler(lambda message: message.from_user.id == ADMIN_CHAT_ID, commands=['broadcast_status'])
+async def admin_broadcast_status_command(message: types.Message):
+    latest = broadcasts.latest()
+    if not latest:
+        await message.reply("No broadcasts yet.")
+        return
+    await message.reply("\n\n".join(broadcast.summary() for broadcast in latest))
+
+@dp.message_handler(lambda message: message.from_user.id == ADMIN_CHAT_ID, commands=['broadcast_cancel'])
+async def admin_broadcast_cancel_command(message: types.Message):
+    args = message.get_args().strip()
+    running = broadcasts.running
+    if args.isdigit():
+        broadcast = broadcasts.get(int(args))
+    else:
+        broadcast = running[-1] if running else None
+    if broadcast is None or not broadcast.cancel():
+        await message.reply("No such broadcast is running.")
+    else:
+        await message.reply(f"Broadcast #{broadcast.id} cancelled.")
+
 # @dp.message_handler(lambda message: message.from_user.id == ADMIN_CHAT_ID and message.text == "👥 My Clients")
 # async def admin_my_clients_command(message: types.Message, state: FSMContext):
 #     await show_clients(message, state, is_active=True, page=0)
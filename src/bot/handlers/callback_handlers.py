@@ -1,21 +1,22 @@
+import logging
 from aiogram import types
-from src.bot.bot_setup import bot, dp
+from src.bot.bot_setup import bot, router, iproxy_manager, localtonet_manager
 from src.utils.proxy_utils import send_proxies
-from src.services.iproxyService import IProxyManager
-from src.services.localtonetService import LocaltonetManager
-from src.bot.config import IPROXY_API_KEY, LOCALTONET_API_KEY, PM_BINANCE_PAYID, PM_BINANCE_USDT_TRC20, PM_PEKAOBANK, PM_PRIVATBANK
+from src.services.providerInventory import provider_inventory
+from src.services.providerHttpClient import ProviderHttpError
+from src.bot.config import PM_BINANCE_PAYID, PM_BINANCE_USDT_TRC20, PM_PEKAOBANK, PM_PRIVATBANK
 
-iproxy_manager = IProxyManager(IPROXY_API_KEY)
-localtonet_manager = LocaltonetManager(LOCALTONET_API_KEY)
-
-@dp.callback_query_handler(lambda query: query.data == "my_proxy")
+@router.callback("my_proxy", exact=True)
 async def my_proxy_callback(query: types.CallbackQuery):
-    iproxy_connections = await iproxy_manager.getAllProxies()
-    localtonet_connections = await localtonet_manager.getAllProxies()
-    all_connections = iproxy_connections + localtonet_connections
-
-    user_username = query.from_user.username
-    user_connections = [conn for conn in all_connections if conn.user == user_username]
+    try:
+        user_connections = await provider_inventory.get_user_proxies(
+            [iproxy_manager, localtonet_manager], username=query.from_user.username
+        )
+    except ProviderHttpError as e:
+        logging.warning(f"Proxy list unavailable: {e}")
+        await bot.send_message(chat_id=query.message.chat.id, text="Proxy information is temporarily unavailable, please try again later.")
+        await query.answer()
+        return
 
     if not user_connections:
         await bot.send_message(chat_id=query.message.chat.id, text="You have no proxies\nBuy it directly:\nhttps://t.me/proxybrokerr")
@@ -23,22 +24,25 @@ async def my_proxy_callback(query: types.CallbackQuery):
         await send_proxies(query.message.chat.id, user_connections)
     await query.answer()
 
-@dp.callback_query_handler(lambda c: c.data.startswith('proxy'))
+@router.callback('proxy')
 async def process_proxy_selection(callback_query: types.CallbackQuery):
     _, service_name, connection_id, button_index = callback_query.data.split('_')
     
-    if service_name == 'ipr':
-        proxies = await iproxy_manager.getConnectionsOfProxy(connection_id)
-    elif service_name == 'ltn':
-        proxies = await localtonet_manager.getConnectionsOfProxy(connection_id)
-    else:
+    managers = {'ipr': iproxy_manager, 'ltn': localtonet_manager}
+    if service_name not in managers:
         await bot.send_message(chat_id=callback_query.message.chat.id, text="Invalid service name.")
         return
+    try:
+        proxies = await provider_inventory.get_connections(managers[service_name], connection_id)
+    except ProviderHttpError as e:
+        logging.warning(f"Proxy details unavailable: {e}")
+        await bot.send_message(chat_id=callback_query.message.chat.id, text="Proxy information is temporarily unavailable, please try again later.")
+        return
 
     proxy_info = "\n".join([f"Connection: `{proxy.type}://{proxy.host}:{proxy.port}:{proxy.login}:{proxy.password}`\n\nType:  `{proxy.type}`\nIP:    `{proxy.host}`\nPort:  `{proxy.port}`\nLogin: `{proxy.login}`\nPass:  `{proxy.password}`\n" for proxy in proxies])
     await bot.send_message(chat_id=callback_query.message.chat.id, text=proxy_info, parse_mode='Markdown')
 
-@dp.callback_query_handler(lambda query: query.data.startswith("info_"))
+@router.callback("info_")
 async def handle_info_callback_query(callback_query: types.CallbackQuery):
     callback_data = callback_query.data
     chat_id = callback_query.message.chat.id
@@ -2,11 +2,10 @@ from venv import logger
 from aiogram import types
 from functools import partial
 from aiogram.dispatcher.filters import Command, Text
-import requests
 from sqlalchemy.exc import SQLAlchemyError
 
 #from src.bot.bot_setup import dp, database
-from src.bot.bot_setup import bot, dp, database
+from src.bot.bot_setup import bot, dp, router, database, async_database, connection_snapshots, iproxy_manager
 from src.utils.keyboards import generate_connection_menu_keyboard, info_keyboard, client_main_menu
 from src.utils.helpers import agreement_text
 from src.utils.proxy_utils import send_proxies, get_user_proxies
@@ -20,37 +19,39 @@ from src.bot.handlers.payment_handlers import *
 from src.utils.payment_utils import *
 from src.services.payment_service import *
 from src.db.aws_db import aws_rds_service
-
+from src.utils.callback_data import CONNECTION, RESTART_CONNECTION
+from src.services.payment_session import PaymentSession
 
 @dp.message_handler(lambda message: message.from_user.id != ADMIN_CHAT_ID, commands=['start'])
 async def admin_start_command(message: types.Message):
     await message.reply("Welcome to ProxyBroker Helper!", reply_markup=client_main_menu())
     
-@dp.message_handler(lambda message: message.text == "ℹ️ Info")
+@router.text("ℹ️ Info")
 async def info_command(message: types.Message):
     await bot.send_message(chat_id=message.chat.id, text="Select an option:", reply_markup=info_keyboard())
     
 
-@dp.message_handler(lambda message: message.text == "📜 Agreement")
+@router.text("📜 Agreement")
 async def agreement_command(message: types.Message):
     await bot.send_message(chat_id=message.chat.id, text=agreement_text(), reply_markup=client_main_menu())
     
-@dp.message_handler(lambda message: message.text == "💬 Support")
-async def agreement_command(message: types.Message):
+@router.text("💬 Support")
+async def support_command(message: types.Message):
     await bot.send_message(chat_id=message.chat.id, text="Just type your question in this chat\nПросто напишите свой вопрос в этот чат\nПросто напишіть своє питання у цей чат", reply_markup=client_main_menu())
 
-@dp.message_handler(lambda message: message.text == "🌐 My Connections")
+@router.text("🌐 My Connections")
 async def my_proxy_command(message: types.Message):
     try:
-        user = None
         user_connections = []
 
-        with aws_rds_service.get_repository(UserRepository) as user_repo:
-            user = user_repo.get_or_create_user(message)  # Get or create the user
+        async with async_database.get_user_repository() as user_repo:
+            user = await user_repo.get_or_create_user(message)  # Get or create the user
 
         if user:
-            with aws_rds_service.get_repository(ConnectionRepository) as connection_repo:
-                user_connections = connection_repo.get_user_connections(user['id'])
+            async with async_database.get_connection_repository() as connection_repo:
+                user_connections = await connection_repo.get_user_connections(user['id'])
+        # Release the connection before the replies are sent
+        await async_database.commit_scope()
 
         if not user_connections:
             await bot.send_message(
@@ -68,13 +69,14 @@ async def my_proxy_command(message: types.Message):
         )
 
 
-@dp.callback_query_handler(lambda c: c.data.startswith('connection_'))
-async def handle_connection_callback(callback_query: types.CallbackQuery):
-    connection_id = str(callback_query.data.split('_')[1])
+@router.callback(CONNECTION)
+async def handle_connection_callback(callback_query: types.CallbackQuery, callback_data):
+    connection_id = callback_data.connection_id
     
     try:
-        with aws_rds_service.get_connection_repository() as connection_repo:
-            connection = connection_repo.get_connection_by_id(connection_id)
+        async with async_database.get_connection_repository() as connection_repo:
+            connection = await connection_repo.get_connection_by_id(connection_id)
+        await async_database.commit_scope()
         
         if connection:
             detail_text = (
@@ -103,16 +105,13 @@ async def handle_connection_callback(callback_query: types.CallbackQuery):
     await bot.answer_callback_query(callback_query.id)  # Acknowledge the callback query
 
 # 3. Handle the "Restart Connection" action
-@dp.callback_query_handler(lambda c: c.data.startswith('restart_connection'))
-async def handle_restart_connection(callback_query: types.CallbackQuery):
-    _, connection_id, proxy_id = callback_query.data.split(':')
+@router.callback(RESTART_CONNECTION)
+async def handle_restart_connection(callback_query: types.CallbackQuery, callback_data):
+    proxy_id = callback_data.proxy_id
     
     try:
         # Perform the API request to restart the connection
-        api_url = f"https://iproxy.online/api-rt/phone/{proxy_id}/action_push/refresh1?token=r:e6df3b78e24b910f68a675691f4d4e36"
-        response = requests.get(api_url)
-        
-        if response.status_code == 200:
+        if await iproxy_manager.restartProxy(proxy_id):
             await bot.send_message(chat_id=callback_query.message.chat.id, text="Connection restarted successfully!")
         else:
             await bot.send_message(chat_id=callback_query.message.chat.id, text="Failed to restart the connection.")
@@ -124,29 +123,33 @@ async def handle_restart_connection(callback_query: types.CallbackQuery):
     await bot.answer_callback_query(callback_query.id)  # Acknowledge the callback query
     
     
-@dp.message_handler(lambda message: message.text == "💳 Pay")
+@router.text("💳 Pay")
 async def handle_pay_command(message: types.Message, state: FSMContext):
-    with database.get_user_repository() as user_repository:
-        with database.get_connection_repository() as connection_repository:
-            user = user_repository.get_or_create_user(message)
-            if user is None:
-                await message.answer("Failed to retrieve user information.")
-                return
-
-            user_repository.update_user(user, message)
-
-            connections = connection_repository.get_user_connections(user['id'])
-            if connections:
-                await state.update_data(selected_connection_ids=[])
-                await state.update_data(user_id=user['id'])
-                await state.update_data(telegram_user_id=message.from_user.id)
-                keyboard = generate_connection_selection_keyboard(connections, user_id=user['id'], selected_ids=[])
-                await message.answer("Select the connections you want to pay for:", reply_markup=keyboard)
-            else:
-                await message.answer("You currently have no connections to pay for.")
-            
-            
-
-@dp.message_handler(lambda message: message.text == "👤 Profile")
-async def info_command(message: types.Message):
+    async with async_database.get_user_repository() as user_repository:
+        user = await user_repository.get_or_create_user(message)
+    if user is None:
+        await message.answer("Failed to retrieve user information.")
+        return
+
+    # The only read of the connections until the payment is committed; the checkout works on this snapshot
+    connections = await connection_snapshots.load(user['id'])
+    await async_database.commit_scope()
+
+    if connections:
+        session = PaymentSession(user['id'], message.from_user.id, connections)
+        await state.update_data({
+            PaymentSession.STATE_KEY: session.to_state(),
+            'selected_connection_ids': [],
+            'user_id': user['id'],
+            'telegram_user_id': message.from_user.id,
+        })
+        keyboard = generate_connection_selection_keyboard(connections, user_id=user['id'], selected_ids=[])
+        await message.answer("Select the connections you want to pay for:", reply_markup=keyboard)
+    else:
+        await message.answer("You currently have no connections to pay for.")
+
+
+
+@router.text("👤 Profile")
+async def profile_command(message: types.Message):
     await bot.send_message(chat_id=message.chat.id, text="Your Profile", reply_markup=client_main_menu())
@@ -5,56 +5,65 @@ from aiogram.dispatcher import FSMContext
 from sqlalchemy.exc import SQLAlchemyError
 from aiogram.types import ContentTypes
 
-from src.bot.bot_setup import bot, dp
-from src.bot.config import ADMIN_CHAT_ID
+from src.bot.bot_setup import bot, dp, router, async_database, outbound, message_mappings
+from src.bot.config import ADMIN_CHAT_ID, CLIENT_PAGE_SIZE
 from src.utils.keyboards import admin_main_menu
-from src.db.aws_db import aws_rds_service
 from src.bot.handlers.admin_handlers import AdminStates
-from src.middlewares.forward_to_admin_middleware import forwarded_message_mapping
+from src.utils.callback_data import CLIENT_PAGE, CLIENT
 
-@dp.message_handler(lambda message: message.from_user.id == ADMIN_CHAT_ID and message.text == "My Clients")
+@router.text("My Clients", admin_only=True)
 async def admin_my_clients_command(message: types.Message, state: FSMContext):
     logging.info(f"My Clients command received from user {message.from_user.id}")
-    await show_clients(message, state, is_active=True, page=0)
+    await show_clients(message, state, is_active=True)
 
-async def show_clients(message: types.Message, state: FSMContext, is_active: bool, page: int):
+async def show_clients(message: types.Message, state: FSMContext, is_active: bool, page: int = 0,
+                       after_id: int = 0, before_id: int = 0, search: str = ''):
+    """Shows one page of clients; pages are read with keyset queries, so every page costs the same."""
     try:
-        with aws_rds_service.get_user_repository() as user_repo:
-            if is_active:
-                clients = user_repo.get_active_users()
-            else:
-                clients = user_repo.get_inactive_users()
+        async with async_database.get_user_repository() as user_repo:
+            clients, more = await user_repo.get_clients_page(is_active, CLIENT_PAGE_SIZE, after_id, before_id, search)
+            total = await user_repo.count_clients(is_active, search)
         
-        if not clients:
+        if not clients and not search:
             await message.reply("No clients found.")
             return
 
-        total_pages = ceil(len(clients) / 5)
-        start = page * 5
-        end = start + 5
-        current_page_clients = clients[start:end]
+        total_pages = max(1, ceil(total / CLIENT_PAGE_SIZE))
 
         keyboard = types.InlineKeyboardMarkup()
-        for client in current_page_clients:
+        for client in clients:
             status_emoji = "🟢" if is_active else "🔴"
             keyboard.add(types.InlineKeyboardButton(
                 text=f"{status_emoji} (@{client.username}) {client.first_name} {client.last_name}",
-                callback_data=f"client_{client.id}"
+                callback_data=CLIENT.pack(client.id)
             ))
         
+        # Going back, `more` tells whether there is an earlier page; going forward, a later one
+        has_previous = more if before_id else page > 0
+        has_next = bool(before_id) or more
         nav_buttons = []
-        if page > 0:
-            nav_buttons.append(types.InlineKeyboardButton("◀️ Previous", callback_data=f"change_page-{is_active}-{page-1}"))
-        if page < total_pages - 1:
-            nav_buttons.append(types.InlineKeyboardButton("Next ▶️", callback_data=f"change_page-{is_active}-{page+1}"))
+        if clients and has_previous:
+            nav_buttons.append(types.InlineKeyboardButton(
+                "◀️ Previous", callback_data=CLIENT_PAGE.pack(is_active, page - 1, 0, clients[0].id, search)
+            ))
+        if clients and has_next:
+            nav_buttons.append(types.InlineKeyboardButton(
+                "Next ▶️", callback_data=CLIENT_PAGE.pack(is_active, page + 1, clients[-1].id, 0, search)
+            ))
         if nav_buttons:
             keyboard.row(*nav_buttons)
         
         switch_text = "Show Inactive Clients" if is_active else "Show Active Clients"
-        keyboard.add(types.InlineKeyboardButton(switch_text, callback_data=f"switch_clients-{not is_active}-0"))
+        keyboard.add(types.InlineKeyboardButton(switch_text, callback_data=CLIENT_PAGE.pack(not is_active, 0, 0, 0, search)))
+        keyboard.add(types.InlineKeyboardButton("🔍 Search", callback_data="search_clients"))
 
         client_type = "Active" if is_active else "Inactive"
-        text = f"{client_type} clients (Page {page + 1}/{total_pages}):"
+        if search:
+            text = f"{client_type} clients matching '{search}' (Page {page + 1}/{total_pages}):"
+            if not clients:
+                text = f"No {client_type.lower()} clients matching '{search}'."
+        else:
+            text = f"{client_type} clients (Page {page + 1}/{total_pages}):"
         
         data = await state.get_data()
         client_list_message_id = data.get('client_list_message_id')
@@ -77,52 +86,74 @@ async def show_clients(message: types.Message, state: FSMContext, is_active: boo
         await message.reply("An error occurred while fetching clients.")
 
 
-@dp.callback_query_handler(lambda c: c.data.startswith('change_page'))
-async def change_page(callback_query: types.CallbackQuery, state: FSMContext):
-    logging.info(f"callback_query.data: {callback_query.data}")
-    _, is_active, page = callback_query.data.split('-')
-    is_active = is_active.lower() == 'true'
-    page = int(page)
-    await show_clients(callback_query.message, state, is_active, page)
-    await bot.answer_callback_query(callback_query.id)
-
-@dp.callback_query_handler(lambda c: c.data.startswith('switch_clients'))
-async def switch_clients(callback_query: types.CallbackQuery, state: FSMContext):
-    _, is_active, page = callback_query.data.split('-')
-    is_active = is_active.lower() == 'true'
-    page = int(page)
-    await show_clients(callback_query.message, state, is_active, page)
+# Paging and switching between active and inactive clients
+@router.callback(CLIENT_PAGE)
+async def change_page(callback_query: types.CallbackQuery, state: FSMContext, callback_data):
+    await show_clients(callback_query.message, state, callback_data.is_active, callback_data.page,
+                       callback_data.after_id, callback_data.before_id, callback_data.search)
     await bot.answer_callback_query(callback_query.id)
 
-@dp.callback_query_handler(lambda c: c.data.startswith('show_inactive_clients_'))
+@router.callback('show_inactive_clients_')
 async def show_inactive_clients(callback_query: types.CallbackQuery, state: FSMContext):
-    page = int(callback_query.data.split('_')[-1])
-    await show_clients(callback_query.message, state, is_active=False, page=page)
+    await show_clients(callback_query.message, state, is_active=False)
 
-@dp.callback_query_handler(lambda c: c.data == 'show_active_clients')
+@router.callback('show_active_clients', exact=True)
 async def show_active_clients(callback_query: types.CallbackQuery, state: FSMContext):
-    await show_clients(callback_query.message, state, is_active=True, page=0)
+    await show_clients(callback_query.message, state, is_active=True)
     await bot.answer_callback_query(callback_query.id)
 
-@dp.callback_query_handler(lambda query: query.from_user.id == ADMIN_CHAT_ID and query.data.startswith("client_"))
-async def admin_client_selected(query: types.CallbackQuery, state: FSMContext):
-    client_id = int(query.data.split("_")[1])
+@router.callback("search_clients", exact=True, admin_only=True)
+async def search_clients(query: types.CallbackQuery):
+    await AdminStates.waiting_for_client_search.set()
+    await query.message.answer("Type the beginning of a username, first or last name:")
+    await query.answer()
 
-    with aws_rds_service.get_user_repository() as user_repo:
-        client = user_repo.get_user_by_id(client_id)
+@dp.message_handler(lambda message: message.from_user.id == ADMIN_CHAT_ID, state=AdminStates.waiting_for_client_search)
+async def handle_client_search(message: types.Message, state: FSMContext):
+    search = message.text.strip()
+    await state.reset_state(with_data=False)
+    # The results go in a new message below the search term rather than into the old list
+    await state.update_data(client_list_message_id=None)
+    if not search:
+        return
 
-    if client:
-        await state.update_data(selected_client_id=client.id)
-        await AdminStates.waiting_for_message.set()
+    async with async_database.get_user_repository() as user_repo:
+        clients, more = await user_repo.get_clients_page(True, 1, search=search)
+        if not clients:
+            clients, more = await user_repo.get_clients_page(False, 1, search=search)
 
-        keyboard = types.InlineKeyboardMarkup()
-        keyboard.add(types.InlineKeyboardButton(text="Cancel", callback_data="cancel"))
+    # A single match goes straight to messaging the client
+    if len(clients) == 1 and not more:
+        await prompt_message_to_client(message, state, clients[0])
+        return
+    await show_clients(message, state, is_active=bool(clients and clients[0].is_active), search=search)
+
+async def prompt_message_to_client(message: types.Message, state: FSMContext, client, edit: bool = False):
+    await state.update_data(selected_client_id=client.id)
+    await AdminStates.waiting_for_message.set()
 
-        await query.message.edit_text("Please enter the message you want to send to the client:", reply_markup=keyboard)
+    keyboard = types.InlineKeyboardMarkup()
+    keyboard.add(types.InlineKeyboardButton(text="Cancel", callback_data="cancel"))
+
+    text = f"Please enter the message you want to send to {client.first_name} {client.last_name} (@{client.username}):"
+    if edit:
+        await message.edit_text(text, reply_markup=keyboard)
+    else:
+        await message.answer(text, reply_markup=keyboard)
+
+@router.callback(CLIENT, admin_only=True)
+async def admin_client_selected(query: types.CallbackQuery, state: FSMContext, callback_data):
+    client_id = callback_data.client_id
+
+    async with async_database.get_user_repository() as user_repo:
+        client = await user_repo.get_user_by_id(client_id)
+
+    if client:
+        await prompt_message_to_client(query.message, state, client, edit=True)
     else:
         await query.message.edit_text("Client not found.")
 
-@dp.callback_query_handler(lambda query: query.data == "cancel", state="*")
+@router.callback("cancel", state="*", exact=True)
 async def handle_cancel(query: types.CallbackQuery, state: FSMContext):
     if query.from_user.id == ADMIN_CHAT_ID:
         data = await state.get_data()
@@ -148,8 +179,8 @@ async def admin_send_message_to_client(message: types.Message, state: FSMContext
         await state.finish()
         return
 
-    with aws_rds_service.get_user_repository() as user_repo:
-        client = user_repo.get_user_by_id(client_id)
+    async with async_database.get_user_repository() as user_repo:
+        client = await user_repo.get_user_by_id(client_id)
 
     if not client:
         await message.reply("Client not found in the database.")
@@ -158,28 +189,28 @@ async def admin_send_message_to_client(message: types.Message, state: FSMContext
 
     try:
         if message.content_type == 'text':
-            await bot.send_message(chat_id=client.telegram_chat_id, text=message.text)
+            await outbound.send('send_message', client.telegram_chat_id, text=message.text)
         elif message.content_type == 'photo':
             photo = message.photo[-1]
-            await bot.send_photo(chat_id=client.telegram_chat_id, photo=photo.file_id, caption=message.caption)
+            await outbound.send('send_photo', client.telegram_chat_id, photo=photo.file_id, caption=message.caption)
         elif message.content_type == 'document':
-            await bot.send_document(chat_id=client.telegram_chat_id, document=message.document.file_id, caption=message.caption)
+            await outbound.send('send_document', client.telegram_chat_id, document=message.document.file_id, caption=message.caption)
         elif message.content_type == 'sticker':
-            await bot.send_sticker(chat_id=client.telegram_chat_id, sticker=message.sticker.file_id)
+            await outbound.send('send_sticker', client.telegram_chat_id, sticker=message.sticker.file_id)
         elif message.content_type == 'audio':
-            await bot.send_audio(chat_id=client.telegram_chat_id, audio=message.audio.file_id, caption=message.caption)
+            await outbound.send('send_audio', client.telegram_chat_id, audio=message.audio.file_id, caption=message.caption)
         elif message.content_type == 'video':
-            await bot.send_video(chat_id=client.telegram_chat_id, video=message.video.file_id, caption=message.caption)
+            await outbound.send('send_video', client.telegram_chat_id, video=message.video.file_id, caption=message.caption)
         elif message.content_type == 'voice':
-            await bot.send_voice(chat_id=client.telegram_chat_id, voice=message.voice.file_id, caption=message.caption)
+            await outbound.send('send_voice', client.telegram_chat_id, voice=message.voice.file_id, caption=message.caption)
         elif message.content_type == 'contact':
-            await bot.send_contact(chat_id=client.telegram_chat_id, phone_number=message.contact.phone_number, first_name=message.contact.first_name, last_name=message.contact.last_name)
+            await outbound.send('send_contact', client.telegram_chat_id, phone_number=message.contact.phone_number, first_name=message.contact.first_name, last_name=message.contact.last_name)
         elif message.content_type == 'location':
-            await bot.send_location(chat_id=client.telegram_chat_id, latitude=message.location.latitude, longitude=message.location.longitude)
+            await outbound.send('send_location', client.telegram_chat_id, latitude=message.location.latitude, longitude=message.location.longitude)
         elif message.content_type == 'venue':
-            await bot.send_venue(chat_id=client.telegram_chat_id, latitude=message.venue.location.latitude, longitude=message.venue.location.longitude, title=message.venue.title, address=message.venue.address)
+            await outbound.send('send_venue', client.telegram_chat_id, latitude=message.venue.location.latitude, longitude=message.venue.location.longitude, title=message.venue.title, address=message.venue.address)
         else:
-            await bot.send_message(chat_id=client.telegram_chat_id, text="Unsupported content type.")
+            await outbound.send('send_message', client.telegram_chat_id, text="Unsupported content type.")
         
         await message.reply(
             f"Message sent to {client.first_name} {client.last_name} "
@@ -200,41 +231,40 @@ async def admin_send_message_to_client(message: types.Message, state: FSMContext
     await state.finish()
 
 
-#@dp.message_handler(lambda message: message.reply_to_message and message.from_user.id == ADMIN_CHAT_ID)
-@dp.message_handler(content_types=ContentTypes.ANY)
+# Only admin replies: other messages are no longer swallowed by a catch-all
+@dp.message_handler(lambda message: message.reply_to_message and message.from_user.id == ADMIN_CHAT_ID, content_types=ContentTypes.ANY)
 async def handle_admin_reply(message: types.Message):
-    if message.reply_to_message and message.from_user.id == ADMIN_CHAT_ID:
-        original_message = forwarded_message_mapping.get(message.reply_to_message.message_id)
-        if original_message:
-            original_user_chat_id = original_message.chat.id
-            try:
-                if message.content_type == 'text':
-                    await bot.send_message(chat_id=original_user_chat_id, text=message.text)
-                elif message.content_type == 'photo':
-                    photo = message.photo[-1]
-                    await bot.send_photo(chat_id=original_user_chat_id, photo=photo.file_id, caption=message.caption)
-                elif message.content_type == 'document':
-                    await bot.send_document(chat_id=original_user_chat_id, document=message.document.file_id, caption=message.caption)
-                elif message.content_type == 'sticker':
-                    await bot.send_sticker(chat_id=original_user_chat_id, sticker=message.sticker.file_id)
-                elif message.content_type == 'audio':
-                    await bot.send_audio(chat_id=original_user_chat_id, audio=message.audio.file_id, caption=message.caption)
-                elif message.content_type == 'video':
-                    await bot.send_video(chat_id=original_user_chat_id, video=message.video.file_id, caption=message.caption)
-                elif message.content_type == 'voice':
-                    await bot.send_voice(chat_id=original_user_chat_id, voice=message.voice.file_id, caption=message.caption)
-                elif message.content_type == 'contact':
-                    await bot.send_contact(chat_id=original_user_chat_id, phone_number=message.contact.phone_number, first_name=message.contact.first_name, last_name=message.contact.last_name)
-                elif message.content_type == 'location':
-                    await bot.send_location(chat_id=original_user_chat_id, latitude=message.location.latitude, longitude=message.location.longitude)
-                elif message.content_type == 'venue':
-                    await bot.send_venue(chat_id=original_user_chat_id, latitude=message.venue.location.latitude, longitude=message.venue.location.longitude, title=message.venue.title, address=message.venue.address)
-                else:
-                    await bot.send_message(chat_id=original_user_chat_id, text="Unsupported content type.")
-                
-                await message.reply("Your reply has been sent to the user.")
-            except Exception as e:
-                logging.exception(f"Error sending reply to user: {e}")
-                await message.reply("Failed to send the reply to the user.")
-        else:
-            await message.reply("The original user message could not be found.")
\ No newline at end of file
+    original_message = await message_mappings.get(message.reply_to_message.message_id)
+    if original_message:
+        original_user_chat_id = original_message.user_chat_id
+        try:
+            if message.content_type == 'text':
+                await outbound.send('send_message', original_user_chat_id, text=message.text)
+            elif message.content_type == 'photo':
+                photo = message.photo[-1]
+                await outbound.send('send_photo', original_user_chat_id, photo=photo.file_id, caption=message.caption)
+            elif message.content_type == 'document':
+                await outbound.send('send_document', original_user_chat_id, document=message.document.file_id, caption=message.caption)
+            elif message.content_type == 'sticker':
+                await outbound.send('send_sticker', original_user_chat_id, sticker=message.sticker.file_id)
+            elif message.content_type == 'audio':
+                await outbound.send('send_audio', original_user_chat_id, audio=message.audio.file_id, caption=message.caption)
+            elif message.content_type == 'video':
+                await outbound.send('send_video', original_user_chat_id, video=message.video.file_id, caption=message.caption)
+            elif message.content_type == 'voice':
+                await outbound.send('send_voice', original_user_chat_id, voice=message.voice.file_id, caption=message.caption)
+            elif message.content_type == 'contact':
+                await outbound.send('send_contact', original_user_chat_id, phone_number=message.contact.phone_number, first_name=message.contact.first_name, last_name=message.contact.last_name)
+            elif message.content_type == 'location':
+                await outbound.send('send_location', original_user_chat_id, latitude=message.location.latitude, longitude=message.location.longitude)
+            elif message.content_type == 'venue':
+                await outbound.send('send_venue', original_user_chat_id, latitude=message.venue.location.latitude, longitude=message.venue.location.longitude, title=message.venue.title, address=message.venue.address)
+            else:
+                await outbound.send('send_message', original_user_chat_id, text="Unsupported content type.")
+            
+            await message.reply("Your reply has been sent to the user.")
+        except Exception as e:
+            logging.exception(f"Error sending reply to user: {e}")
+            await message.reply("Failed to send the reply to the user.")
+    else:
+        await message.reply("The original user message could not be found.")
\ No newline at end of file
@@ -3,14 +3,18 @@ from datetime import datetime, timedelta
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 
-from src.bot.bot_setup import dp, database
+from src.bot.bot_setup import dp, router, database, async_database
 from src.bot.config import ADMIN_CHAT_ID, PM_BINANCE_USDT_TRC20, PM_PEKAOBANK, PM_PRIVATBANK
 from src.db.repositories.payment_repositories import PaymentRepository
 from src.db.repositories.user_repositories import UserRepository
-from src.utils.keyboards import generate_connection_selection_for_period_keyboard, generate_connection_selection_keyboard, generate_days_keyboard
+from src.utils.keyboards import generate_connection_selection_for_period_keyboard, generate_connection_selection_keyboard, generate_days_keyboard, edit_reply_markup
 from src.db.models.db_models import CryptoPayment, Payment
-from src.utils.payment_utils import calculate_total_payment_amount, send_payment_confirmation_message_to_admin, calculate_payment_amount, send_payment_status_message_to_user
-from src.db.repositories.connection_repositories import ConnectionRepository
+from src.utils.payment_utils import calculate_total_payment_amount, calculate_selection_amount, send_payment_confirmation_message_to_admin, calculate_payment_amount, send_payment_status_message_to_user
+from src.db.repositories.connection_repositories import ConnectionRepository, AsyncConnectionRepository
+from src.db.repositories.payment_repositories import AsyncPaymentRepository
+from src.db.repositories.user_repositories import AsyncUserRepository
+from src.services.payment_session import PaymentSession, StalePaymentSession
+from src.utils.callback_data import SELECT_CONNECTION_FOR_PAYMENT, PAY_SELECTED, TOGGLE_CONNECTION, CHANGE_DAYS, PAYMENT_DECISION
 import logging
 
 class PaymentStates(StatesGroup):
@@ -19,38 +23,46 @@ class PaymentStates(StatesGroup):
 class AdminPaymentStates(StatesGroup):
     waiting_for_admin_confirmation = State()
 
+SESSION_EXPIRED_TEXT = "Your payment session has expired. Press 💳 Pay to start again."
+
 
 # Selecting connections for payment
-@dp.callback_query_handler(lambda c: c.data.startswith('select_connection_for_payment:'))
-async def handle_select_connection_for_payment_callback(callback_query: types.CallbackQuery, state: FSMContext):
-    _, connection_id, user_id = callback_query.data.split(':')
-    connection_id = str(connection_id)
+# The current selection is carried by the buttons and the connections by the checkout's PaymentSession,
+# so toggling only reads the FSM data
+@router.callback(SELECT_CONNECTION_FOR_PAYMENT)
+async def handle_select_connection_for_payment_callback(callback_query: types.CallbackQuery, state: FSMContext, callback_data):
+    payment_session = PaymentSession.from_state(await state.get_data())
+    if payment_session is None:
+        await callback_query.answer(SESSION_EXPIRED_TEXT, show_alert=True)
+        return
 
-    async with state.proxy() as data:
-        selected_connection_ids = data.get('selected_connection_ids', [])
-        if connection_id in selected_connection_ids:
-            selected_connection_ids.remove(connection_id)
-        else:
-            selected_connection_ids.append(connection_id)
-        data['selected_connection_ids'] = selected_connection_ids
+    selected_connection_ids = list(callback_data.selected)
+    if callback_data.connection_id in selected_connection_ids:
+        selected_connection_ids.remove(callback_data.connection_id)
+    else:
+        selected_connection_ids.append(callback_data.connection_id)
+    # Buttons of an older checkout may name connections this session doesn't have
+    selected_connection_ids = [record.id for record in payment_session.select(selected_connection_ids)]
 
     try:
-        with database.get_session() as session:
-            connection_repository = ConnectionRepository(session)
-            user_connections = connection_repository.get_user_connections(user_id)
-        updated_keyboard = generate_connection_selection_keyboard(user_connections, selected_connection_ids, user_id)
-        await callback_query.message.edit_reply_markup(reply_markup=updated_keyboard)
+        updated_keyboard = generate_connection_selection_keyboard(payment_session.connections, selected_connection_ids, payment_session.user_id)
+        await edit_reply_markup(callback_query.message, updated_keyboard)
     except Exception as e:
         logging.exception(f"Error handling select connection callback: {e}")
     finally:
         await callback_query.answer()
 
-@dp.callback_query_handler(lambda c: c.data == 'pay_selected_connections')
-async def handle_pay_selected_connections_callback(callback_query: types.CallbackQuery, state: FSMContext):
-    async with state.proxy() as data:
-        selected_connection_ids = data.get('selected_connection_ids', [])
+@router.callback(PAY_SELECTED)
+async def handle_pay_selected_connections_callback(callback_query: types.CallbackQuery, state: FSMContext, callback_data):
+    payment_session = PaymentSession.from_state(await state.get_data())
+    if payment_session is None:
+        await callback_query.answer(SESSION_EXPIRED_TEXT, show_alert=True)
+        return
+    # Buttons of an older checkout may name connections this session doesn't have
+    selected_connection_ids = [record.id for record in payment_session.select(callback_data.connection_ids)]
 
     if selected_connection_ids:
+        await state.update_data(selected_connection_ids=selected_connection_ids)
         payment_methods_keyboard = types.InlineKeyboardMarkup()
         payment_methods_keyboard.add(
             types.InlineKeyboardButton(text="Crypto", callback_data="payment_method:crypto"),
@@ -60,29 +72,28 @@ async def handle_pay_selected_connections_callback(callback_query: types.Callbac
     else:
         await callback_query.answer("Please select at least one connection.")
 
-@dp.callback_query_handler(lambda c: c.data.startswith('payment_method:'))
+@router.callback('payment_method:')
 async def handle_payment_method_selection(callback_query: types.CallbackQuery, state: FSMContext):
     payment_method = callback_query.data.split(':')[1]
     await state.update_data(payment_method=payment_method)
 
     async with state.proxy() as data:
+        payment_session = PaymentSession.from_state(data)
         selected_connection_ids = data.get('selected_connection_ids', [])
         selected_connection_days = {connection_id: 0 for connection_id in selected_connection_ids}  # Default to 30 days
 
-    with database.get_session() as session:
-        connection_repository = ConnectionRepository(session)
-        selected_connections = [
-            connection_repository.get_connection_by_id(connection_id)
-            for connection_id in selected_connection_ids
-        ]
+    if payment_session is None:
+        await callback_query.answer(SESSION_EXPIRED_TEXT, show_alert=True)
+        return
+    selected_connections = payment_session.select(selected_connection_ids)
 
-        total_amount, payment_items = calculate_total_payment_amount(selected_connections, selected_connection_days)
-        current_end_dates = {connection.id: connection.expiration_date for connection in selected_connections}
-        connection_logins = {connection.id: connection.login for connection in selected_connections}
-        new_end_dates = {connection.id: connection.expiration_date + timedelta(days=selected_connection_days[connection.id]) for connection in selected_connections}
+    total_amount, payment_items = calculate_total_payment_amount(selected_connections, selected_connection_days)
+    current_end_dates = {connection.id: connection.expiration_date for connection in selected_connections}
+    connection_logins = {connection.id: connection.login for connection in selected_connections}
+    new_end_dates = {connection.id: connection.expiration_date + timedelta(days=selected_connection_days[connection.id]) for connection in selected_connections}
 
     await state.update_data(
-        days=selected_connection_days, total_amount=total_amount,
+        selected_connection_days=selected_connection_days, total_amount=total_amount,
         current_end_dates=current_end_dates, new_end_dates=new_end_dates,
         connection_logins=connection_logins
     )
@@ -97,7 +108,7 @@ async def handle_payment_method_selection(callback_query: types.CallbackQuery, s
 
 
 
-@dp.callback_query_handler(lambda c: c.data.startswith('select_period:'))
+@router.callback('select_period:')
 async def handle_period_selection_callback(callback_query: types.CallbackQuery, state: FSMContext):
     _, connection_id, days = callback_query.data.split(':')
     connection_id = str(connection_id)
@@ -118,18 +129,12 @@ async def update_total_price(callback_query: types.CallbackQuery, state: FSMCont
         current_end_dates = data.get('current_end_dates', {})
         connection_logins = data.get('connection_logins', {})
 
-    with database.get_session() as session:
-        connection_repository = ConnectionRepository(session)
-        selected_connections = [
-            connection_repository.get_connection_by_id(connection_id)
-            for connection_id in selected_connection_ids
-        ]
-
-        total_amount, payment_items = calculate_total_payment_amount(selected_connections, selected_connection_days)
-        new_end_dates = {
-            connection.id: current_end_dates.get(connection.id, datetime.now()) + timedelta(days=selected_connection_days.get(connection.id, 0))
-            for connection in selected_connections
-        }
+    # Everything needed is in the FSM data already, re-rendering costs no queries
+    total_amount = calculate_selection_amount(selected_connection_ids, selected_connection_days)
+    new_end_dates = {
+        connection_id: current_end_dates.get(connection_id, datetime.now()) + timedelta(days=selected_connection_days.get(connection_id, 0))
+        for connection_id in selected_connection_ids
+    }
 
     await state.update_data(total_amount=total_amount, current_end_dates=current_end_dates, new_end_dates=new_end_dates)
 
@@ -137,7 +142,7 @@ async def update_total_price(callback_query: types.CallbackQuery, state: FSMCont
         selected_connection_days, total_amount, current_end_dates, new_end_dates,
         connection_logins, selected_connection_ids
     )
-    await callback_query.message.edit_reply_markup(reply_markup=keyboard)
+    await edit_reply_markup(callback_query.message, keyboard)
     await callback_query.answer()
 
 
@@ -146,7 +151,7 @@ async def update_total_price(callback_query: types.CallbackQuery, state: FSMCont
 
 
 
-@dp.callback_query_handler(lambda c: c.data.startswith('select_connection_for_period:'))
+@router.callback('select_connection_for_period:')
 async def handle_select_connection_for_period_callback(callback_query: types.CallbackQuery, state: FSMContext):
     _, connection_id, user_id = callback_query.data.split(':')
     connection_id = str(connection_id)
@@ -158,9 +163,9 @@ async def handle_select_connection_for_period_callback(callback_query: types.Cal
 
     await update_total_price(callback_query, state)
 
-@dp.callback_query_handler(lambda c: c.data.startswith('change_days:'))
-async def handle_change_days_callback(callback_query: types.CallbackQuery, state: FSMContext):
-    change_value = int(callback_query.data.split(':')[1])
+@router.callback(CHANGE_DAYS)
+async def handle_change_days_callback(callback_query: types.CallbackQuery, state: FSMContext, callback_data):
+    change_value = callback_data.days
 
     async with state.proxy() as data:
         selected_connection_days = data.get('selected_connection_days', {})
@@ -173,10 +178,9 @@ async def handle_change_days_callback(callback_query: types.CallbackQuery, state
     await update_total_price(callback_query, state)
     
     
-@dp.callback_query_handler(lambda c: c.data.startswith('toggle_connection:'))
-async def handle_toggle_connection_callback(callback_query: types.CallbackQuery, state: FSMContext):
-    connection_id = callback_query.data.split(':')[1]
-    connection_id = str(connection_id)
+@router.callback(TOGGLE_CONNECTION)
+async def handle_toggle_connection_callback(callback_query: types.CallbackQuery, state: FSMContext, callback_data):
+    connection_id = callback_data.connection_id
 
     async with state.proxy() as data:
         selected_connection_ids = data.get('selected_connection_ids', [])
@@ -193,27 +197,20 @@ async def handle_toggle_connection_callback(callback_query: types.CallbackQuery,
         # Ensure new_end_dates contains all necessary data
         new_end_dates = data.get('new_end_dates', {conn_id: current_end_dates.get(conn_id, datetime.now()) for conn_id in connection_logins.keys()})
 
-    with database.get_session() as session:
-        connection_repository = ConnectionRepository(session)
-        selected_connections = [
-            connection_repository.get_connection_by_id(connection_id)
-            for connection_id in selected_connection_ids
-        ]
+    # Update new_end_dates for selected connections
+    for connection_id in selected_connection_ids:
+        new_end_dates[connection_id] = current_end_dates[connection_id] + timedelta(days=selected_connection_days.get(connection_id, 0))
 
-        # Update new_end_dates for selected connections
-        for connection in selected_connections:
-            new_end_dates[connection.id] = current_end_dates[connection.id] + timedelta(days=selected_connection_days.get(connection.id, 0))
-
-    total_amount, payment_items = calculate_total_payment_amount(selected_connections, selected_connection_days)
+    total_amount = calculate_selection_amount(selected_connection_ids, selected_connection_days)
 
     keyboard = generate_days_keyboard(
         selected_connection_days, total_amount, current_end_dates, new_end_dates,
         connection_logins, selected_connection_ids
     )
-    await callback_query.message.edit_reply_markup(reply_markup=keyboard)
+    await edit_reply_markup(callback_query.message, keyboard)
     await callback_query.answer()
 
-@dp.callback_query_handler(lambda c: c.data == 'reset_days')
+@router.callback('reset_days', exact=True)
 async def handle_reset_days_callback(callback_query: types.CallbackQuery, state: FSMContext):
     async with state.proxy() as data:
         selected_connection_ids = data.get('selected_connection_ids', [])
@@ -223,36 +220,26 @@ async def handle_reset_days_callback(callback_query: types.CallbackQuery, state:
     await update_total_price(callback_query, state)
 
 
-@dp.callback_query_handler(lambda c: c.data.startswith('confirm_period'))
+@router.callback('confirm_period')
 async def handle_period_confirmation_callback(callback_query: types.CallbackQuery, state: FSMContext):
     async with state.proxy() as data:
+        payment_session = PaymentSession.from_state(data)
         selected_connection_ids = data.get('selected_connection_ids', [])
         selected_connection_days = data.get('selected_connection_days', {})
         payment_method = data.get('payment_method')
 
-    user_id = callback_query.from_user.id
-    with database.get_session() as session:
-        user_repository = UserRepository(session)
-        user = user_repository.get_user_by_telegram_user_id(user_id)
-
-        if not user:
-            await callback_query.message.answer("User not found. Please register first.")
-            return
-
-        connection_repository = ConnectionRepository(session)
-        selected_connections = [
-            connection_repository.get_connection_by_id(connection_id)
-            for connection_id in selected_connection_ids
-        ]
+    if payment_session is None:
+        await callback_query.message.answer(SESSION_EXPIRED_TEXT)
+        return
 
-        total_amount, payment_items = calculate_total_payment_amount(selected_connections, selected_connection_days)
+    # Priced from the session; the connections are checked against the database with the TXID
+    total_amount = calculate_selection_amount(selected_connection_ids, selected_connection_days)
 
     if total_amount <= 0:
         await callback_query.message.answer("Total amount should be more than 0. Please select valid periods.")
         return
 
     await state.update_data(
-        user_id=user_id,
         selected_connection_ids=selected_connection_ids,
         selected_connection_days=selected_connection_days,
         total_amount=total_amount
@@ -280,13 +267,13 @@ async def handle_period_confirmation_callback(callback_query: types.CallbackQuer
     await PaymentStates.waiting_for_txid.set()
     await callback_query.answer()
     
-@dp.callback_query_handler(lambda c: c.data == 'cancel_payment')
+@router.callback('cancel_payment', exact=True)
 async def handle_cancel_payment(callback_query: types.CallbackQuery, state: FSMContext):
     await state.finish()
     await callback_query.message.answer("Payment process canceled. You can start again by selecting connections.")
     await callback_query.answer()
 
-@dp.callback_query_handler(lambda c: c.data == 'cancel_payment', state=PaymentStates.waiting_for_txid)
+@router.callback('cancel_payment', state=PaymentStates.waiting_for_txid, exact=True)
 async def handle_cancel_payment_during_txid(callback_query: types.CallbackQuery, state: FSMContext):
     await state.finish()
     await callback_query.message.answer("Payment process canceled. You can start again by selecting connections.")
@@ -297,69 +284,55 @@ async def handle_cancel_payment_during_txid(callback_query: types.CallbackQuery,
 async def handle_txid_input(message: types.Message, state: FSMContext):
     txid = message.text
     async with state.proxy() as data:
-        user_id = data.get("user_id")
+        payment_session = PaymentSession.from_state(data)
         payment_method = data.get("payment_method")
         selected_connection_ids = data.get("selected_connection_ids")
         selected_connection_days = data.get("selected_connection_days")
         total_amount = data.get("total_amount")
 
-    with database.get_session() as session:
-        payment_repository = PaymentRepository(session)
-        connection_repository = ConnectionRepository(session)
-        user_repository = UserRepository(session)
+    async with async_database.get_session() as session:
+        payment_repository = AsyncPaymentRepository(session)
+        connection_repository = AsyncConnectionRepository(session)
+        user_repository = AsyncUserRepository(session)
 
-        user = user_repository.get_user_by_telegram_user_id(user_id)
+        user = await user_repository.get_user_by_id(payment_session.user_id) if payment_session else None
         if not user:
-            await message.answer("User not found.")
+            await message.answer(SESSION_EXPIRED_TEXT if payment_session is None else "User not found.")
             await state.finish()
             return
 
-        selected_connections = [
-            connection_repository.get_connection_by_id(connection_id)
-            for connection_id in selected_connection_ids
-        ]
+        # The only point of the checkout that reads the connections again
+        try:
+            selected_connections = await payment_session.revalidate(connection_repository, selected_connection_ids)
+        except StalePaymentSession as e:
+            await message.answer(str(e))
+            await state.finish()
+            return
         payment_items = [
             (connection, calculate_payment_amount(selected_connection_days.get(connection.id, 0)))
             for connection in selected_connections
         ]
 
-        payments = []
-        for connection, amount in payment_items:
-            days = selected_connection_days.get(connection.id, 0)
-            end_date = connection.expiration_date + timedelta(days=days)
-            payment = Payment(
-                user_id=user.id,
-                connection_id=connection.id,
-                amount=amount,
-                start_date=connection.expiration_date,
-                end_date=end_date,
-                payment_method=payment_method,
-                status='pending'
-            )
-            session.add(payment)
-            session.commit()  # Commit to get the payment.id
-
-            if payment_method == 'crypto':
-                crypto_payment = CryptoPayment(payment_id=payment.id, txid=txid)
-                session.add(crypto_payment)
-
-            payments.append(payment)
-
-        session.commit()  # Commit all changes to the database
-
-        if payments:
-            await send_payment_confirmation_message_to_admin(payments, txid, selected_connection_days)
-            await message.answer("Payment initiated. Awaiting confirmation. Thank you!")
-        else:
-            await message.answer("No payments were processed. Please try again.")
+        # All payments and their crypto rows are written in a single commit
+        payments = await payment_repository.create_payments(user, payment_items, txid, selected_connection_days, payment_method)
 
-        # Clear the state to prevent duplicate payments
-        await state.finish()
+    # Commit before notifying the admin so the transaction isn't held across Telegram requests
+    await async_database.commit_scope()
 
+    if payments:
+        await send_payment_confirmation_message_to_admin(payments, txid, selected_connection_days)
+        await message.answer("Payment initiated. Awaiting confirmation. Thank you!")
+    else:
+        await message.answer("No payments were processed. Please try again.")
+
+    # Clear the state to prevent duplicate payments
+    await state.finish()
 
-@dp.callback_query_handler(lambda c: c.data.startswith('confirm_payment:') or c.data.startswith('decline_payment:'))
-async def handle_admin_action(callback_query: types.CallbackQuery, state: FSMContext):
-    action, payment_id = callback_query.data.split(':')
+
+@router.callback(PAYMENT_DECISION)
+async def handle_admin_action(callback_query: types.CallbackQuery, state: FSMContext, callback_data):
+    action = 'confirm_payment' if callback_data.confirm else 'decline_payment'
+    payment_id = callback_data.payment_id
     
     # Save the action and payment_id in the state
     await state.update_data(action=action, payment_id=payment_id)
@@ -388,9 +361,8 @@ async def handle_admin_final_confirmation(callback_query: types.CallbackQuery, s
         action = data.get('action')
         payment_id = data.get('payment_id')
 
-    with database.get_session() as session:
-        payment_repository = PaymentRepository(session)
-        payment = payment_repository.get_payment_by_id(int(payment_id))
+    async with async_database.get_payment_repository() as payment_repository:
+        payment = await payment_repository.get_payment_by_id(int(payment_id))
 
         if not payment:
             await callback_query.message.reply("Payment not found.", reply=True)
@@ -398,21 +370,24 @@ async def handle_admin_final_confirmation(callback_query: types.CallbackQuery, s
             return
 
         if action == "confirm_payment":
-            crypto_payment = session.query(CryptoPayment).filter_by(payment_id=int(payment_id)).first()
+            crypto_payment = await payment_repository.get_crypto_payment(int(payment_id))
             if not crypto_payment or not crypto_payment.txid:
                 await callback_query.message.reply("TXID not found. Please initiate the payment first.", reply=True)
                 return
             try:
-                payment_repository.confirm_payment(payment, crypto_payment.txid)
+                await payment_repository.confirm_payment(payment, crypto_payment.txid)
             except ValueError as e:
                 await callback_query.message.reply(f"Error: {str(e)}", reply=True)
                 return
             decision_text = f"✅ Payment {payment_id} confirmed."
         elif action == "decline_payment":
-            payment_repository.decline_payment(payment)
+            await payment_repository.decline_payment(payment)
             decision_text = f"❌ Payment {payment_id} declined."
 
-        await send_payment_status_message_to_user(payment.user_payments, payment)
+        # The decision is committed before the user and the admin are notified
+        await async_database.commit_scope()
+
+        await send_payment_status_message_to_user(payment.user, payment)
 
         # Retrieve the stored original message text and append the new decision
         original_message_text = admin_state_data.get('original_message_text', '')
@@ -440,10 +415,10 @@ async def handle_admin_final_confirmation(callback_query: types.CallbackQuery, s
             if pid != int(payment_id):  # Skip the current payment to avoid re-processing
                 markup.add(
                     types.InlineKeyboardButton(
-                        text=f"Confirm Payment {pid}", callback_data=f"confirm_payment:{pid}"
+                        text=f"Confirm Payment {pid}", callback_data=PAYMENT_DECISION.pack(pid, True)
                     ),
                     types.InlineKeyboardButton(
-                        text=f"Decline Payment {pid}", callback_data=f"decline_payment:{pid}"
+                        text=f"Decline Payment {pid}", callback_data=PAYMENT_DECISION.pack(pid, False)
                     ),
                 )
 
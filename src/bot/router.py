@@ -0,0 +1,193 @@
+import inspect
+import logging
+from typing import Callable, Dict, Optional
+
+from aiogram import Dispatcher, types
+from aiogram.dispatcher.filters.state import State, StatesGroup
+from aiogram.dispatcher.filters.builtin import StateFilter
+from aiogram.dispatcher.handler import current_handler
+
+from src.bot.config import ADMIN_CHAT_ID
+from src.utils.callback_data import CallbackSchema, CallbackDataError, StaleCallbackData, token_registry
+
+logger = logging.getLogger(__name__)
+
+ANY_STATE = '*'
+
+
+class RouteConflict(ValueError):
+    """Two handlers were registered for the same menu text or callback data."""
+
+
+def _state_key(state) -> Optional[str]:
+    if isinstance(state, State):
+        return state.state
+    if inspect.isclass(state) and issubclass(state, StatesGroup):
+        raise TypeError("Register a route per state, not for a whole StatesGroup")
+    return state
+
+
+class Route:
+    """A handler plus what it needs from the update data."""
+
+    __slots__ = ('handler', 'admin_only', 'key', 'schema', '_params')
+
+    def __init__(self, handler: Callable, admin_only: bool, key: str, schema: Optional[CallbackSchema] = None):
+        self.handler = handler
+        self.admin_only = admin_only
+        self.key = key
+        self.schema = schema
+        spec = inspect.getfullargspec(inspect.unwrap(handler))
+        # None means the handler takes **kwargs and gets all of the data
+        self._params = None if spec.varkw else set(spec.args[1:] + spec.kwonlyargs)
+
+    def accepts(self, user_id: Optional[int]) -> bool:
+        return not self.admin_only or user_id == ADMIN_CHAT_ID
+
+    async def __call__(self, obj, data: dict):
+        if self._params is not None:
+            data = {name: value for name, value in data.items() if name in self._params}
+        return await self.handler(obj, **data)
+
+    def __repr__(self):
+        return f"<Route {self.key!r} -> {self.handler.__qualname__}>"
+
+
+async def _reject_callback(query: types.CallbackQuery, callback_error: CallbackDataError):
+    if isinstance(callback_error, StaleCallbackData):
+        text = "This button has expired, please open the menu again."
+    else:
+        text = "This button is not valid."
+    await query.answer(text, show_alert=True)
+
+
+def resolved_handler(data: dict):
+    """The handler an update is processed by, seen through the router's entry point; for middlewares."""
+    route = data.get('route')
+    return route.handler if isinstance(route, Route) else current_handler.get(None)
+
+
+class _TrieNode:
+    __slots__ = ('children', 'prefix_routes', 'exact_routes')
+
+    def __init__(self):
+        self.children: Dict[str, '_TrieNode'] = {}
+        # state -> route
+        self.prefix_routes: Dict[Optional[str], Route] = {}
+        self.exact_routes: Dict[Optional[str], Route] = {}
+
+
+def _pick(routes: Dict[Optional[str], Route], state: Optional[str]) -> Optional[Route]:
+    return routes.get(state) or routes.get(ANY_STATE)
+
+
+class Router:
+    """Table-driven dispatch of reply-keyboard texts and inline button callback data.
+
+    Menu texts are looked up in a dict and callback data in a prefix trie (the longest
+    registered prefix wins, an exact registration beats any prefix), so resolving an update
+    costs one lookup however many handlers there are, instead of running every lambda filter
+    registered before the right one. Routes are keyed by FSM state like aiogram handlers:
+    without `state` they only match when the user has no state, `state='*'` matches any.
+
+    Registering a second handler for the same text or callback key and state raises
+    RouteConflict at import time, rather than leaving one of them silently unreachable.
+    Updates without a route fall through to the handlers registered on the dispatcher.
+    """
+
+    def __init__(self, dp: Dispatcher):
+        self.dp = dp
+        self._texts: Dict[str, Dict[Optional[str], Route]] = {}
+        self._callbacks = _TrieNode()
+        self._rejected = Route(_reject_callback, False, '')
+        # Registered before any handler module is imported, so routed updates skip the chain
+        dp.register_message_handler(self._dispatch, self._match_message, state=ANY_STATE)
+        dp.register_callback_query_handler(self._dispatch, self._match_callback, state=ANY_STATE)
+
+    @staticmethod
+    def _add(routes: Dict[Optional[str], Route], state, route: Route, what: str):
+        state = _state_key(state)
+        existing = routes.get(state)
+        if existing is not None:
+            raise RouteConflict(
+                f"{what} {route.key!r} (state {state!r}) is already handled by {existing.handler.__qualname__}, "
+                f"can't register {route.handler.__qualname__}"
+            )
+        routes[state] = route
+
+    def text(self, text: str, state=None, admin_only: bool = False):
+        """Decorator routing messages whose text is exactly `text`."""
+        def decorator(handler):
+            self._add(self._texts.setdefault(text, {}), state, Route(handler, admin_only, text), "Menu text")
+            return handler
+        return decorator
+
+    def callback(self, data, state=None, exact: bool = False, admin_only: bool = False):
+        """Decorator routing callback queries whose data starts with `data`, or equals it if `exact`.
+
+        With a CallbackSchema the data is decoded before the handler runs and passed to it as
+        `callback_data`; invalid or expired buttons are answered with an alert instead.
+        """
+        schema = data if isinstance(data, CallbackSchema) else None
+        key = schema.prefix if schema else data
+
+        def decorator(handler):
+            node = self._callbacks
+            for char in key:
+                node = node.children.setdefault(char, _TrieNode())
+            routes = node.exact_routes if exact else node.prefix_routes
+            route = Route(handler, admin_only, key, schema)
+            self._add(routes, state, route, "Callback data" if exact else "Callback prefix")
+            return handler
+        return decorator
+
+    def resolve_text(self, text: Optional[str], state: Optional[str]) -> Optional[Route]:
+        routes = self._texts.get(text)
+        return _pick(routes, state) if routes else None
+
+    def resolve_callback(self, data: Optional[str], state: Optional[str]) -> Optional[Route]:
+        if not data:
+            return None
+        node, best = self._callbacks, None
+        for char in data:
+            node = node.children.get(char)
+            if node is None:
+                return best
+            best = _pick(node.prefix_routes, state) or best
+        return _pick(node.exact_routes, state) or best
+
+    async def _current_state(self) -> Optional[str]:
+        # Shares StateFilter's per-update cache, so the storage is read at most once per update
+        try:
+            return StateFilter.ctx_state.get()
+        except LookupError:
+            chat, user = types.Chat.get_current(), types.User.get_current()
+            state = await self.dp.storage.get_state(chat=chat and chat.id, user=user and user.id)
+            StateFilter.ctx_state.set(state)
+            return state
+
+    async def _match_message(self, message: types.Message):
+        # Plain chat messages aren't menu texts and don't cost a state read
+        if message.text not in self._texts:
+            return False
+        route = self.resolve_text(message.text, await self._current_state())
+        if route is None or not route.accepts(message.from_user.id):
+            return False
+        return {'route': route}
+
+    async def _match_callback(self, query: types.CallbackQuery):
+        route = self.resolve_callback(query.data, await self._current_state())
+        if route is None or not route.accepts(query.from_user.id):
+            return False
+        if route.schema is None:
+            return {'route': route}
+        await token_registry.load(query.data)
+        try:
+            return {'route': route, 'callback_data': route.schema.unpack(query.data)}
+        except CallbackDataError as e:
+            logger.info(f"Rejected callback data {query.data!r} from {query.from_user.id}: {e}")
+            return {'route': self._rejected, 'callback_error': e}
+
+    @staticmethod
+    async def _dispatch(obj, route: Route, **data):
+        return await route(obj, data)
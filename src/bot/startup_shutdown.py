@@ -1,12 +1,21 @@
 import logging
-from src.bot.config import ADMIN_CHAT_ID, WEBHOOK_URL
-from src.bot.bot_setup import bot, dp
+from src.bot.config import ADMIN_CHAT_ID, WEBHOOK_URL, METRICS_PORT
+from src.bot.bot_setup import bot, dp, async_database, user_touch_buffer, outbound, message_mappings, fsm_storage
 from aiogram import Dispatcher
 from src.middlewares.forward_to_admin_middleware import ForwardToAdminMiddleware
-from src.utils.background_tasks import sync_proxy_connections
+from src.utils.background_tasks import register_sync_jobs, register_cleanup_jobs
+from src.utils.scheduler import scheduler
+from src.services.providerHttpClient import close_provider_clients
+from src.utils.metrics import event_loop_monitor, start_metrics_server
+from src.services.broadcast import broadcasts
+from src.db.models.db_models import RUNTIME_MODELS, RUNTIME_INDEXES
 import asyncio
 
+metrics_runner = None
+
 async def on_startup(dp):
+    await async_database.create_missing_tables(RUNTIME_MODELS)
+    await async_database.create_missing_indexes(RUNTIME_INDEXES)
     if WEBHOOK_URL:  # If WEBHOOK_URL is set, use webhook mode
         await bot.send_message(chat_id=ADMIN_CHAT_ID, text='Bot has been started with WEBHOOK')
         logging.info("Bot has been started with WEBHOOK")
@@ -14,11 +23,33 @@ async def on_startup(dp):
         await bot.set_webhook(url=WEBHOOK_URL)
     else:  # If WEBHOOK_URL is not set, use long polling mode
         await bot.send_message(chat_id=ADMIN_CHAT_ID, text='Bot has been started (long polling)')
-    asyncio.create_task(sync_proxy_connections())
+        if METRICS_PORT:
+            # The webhook app serves /metrics itself; polling needs a server of its own
+            global metrics_runner
+            metrics_runner = await start_metrics_server(int(METRICS_PORT))
+    event_loop_monitor.start()
+    register_sync_jobs()
+    register_cleanup_jobs(message_mappings, fsm_storage)
+    scheduler.start()
+    user_touch_buffer.start()
+    message_mappings.start()
 
 async def on_shutdown(dp):
-    # Close the ForwardToAdminMiddleware
+    await scheduler.stop()
+    await broadcasts.stop()
+    await event_loop_monitor.stop()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    # Close the ForwardToAdminMiddleware (flushes the user touch buffer)
     for middleware in dp.middleware.applications:
         if isinstance(middleware, ForwardToAdminMiddleware):
             await middleware.close()
+    # Let queued forwards and notifications go out before the session closes
+    await outbound.stop()
+    await message_mappings.stop()
+    # Writes pending FSM changes (SQLStorage) before the engine is disposed
+    await dp.storage.close()
+    await dp.storage.wait_closed()
     await bot.send_message(chat_id=ADMIN_CHAT_ID, text='Bot has been stopped')
+    await close_provider_clients()
+    await async_database.close()
@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine.url import URL, make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+
+from src.bot.config import (
+    DATABASE_TYPE, DATABASE_NAME, DATABASE_USERNAME, DATABASE_PASSWORD, DATABASE_HOST, DB_PORT,
+    ASYNC_DB_DRIVER, ASYNC_DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT
+)
+from src.db.repositories.user_repositories import AsyncUserRepository
+from src.db.repositories.connection_repositories import AsyncConnectionRepository
+from src.db.repositories.payment_repositories import AsyncPaymentRepository
+from src.db.session_scope import get_current_scope, enter_scope, exit_scope, run_after_commit, drop_after_commit
+from src.db.instrumentation import instrument_engine
+from src.utils.metrics import DB_POOL_CHECKOUT_SECONDS, register_pool_gauges
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseScope:
+    """Unit of work of one update, opened by AsyncDatabaseService.open_scope().
+
+    Nothing is checked out until the first get_session(): updates that never touch the
+    database cost no connection, and a handler can end() the transaction before waiting on
+    the network so the connection isn't held across it. The next get_session() begins anew.
+    """
+
+    def __init__(self, async_database: 'AsyncDatabaseService'):
+        self.async_database = async_database
+        self.connection = None
+        self.session: Optional[AsyncSession] = None
+        self.tokens = None
+        self._lock = asyncio.Lock()
+
+    async def get_session(self) -> AsyncSession:
+        async with self._lock:
+            if self.session is None:
+                started = time.perf_counter()
+                connection = await self.async_database.engine.connect()
+                DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+                try:
+                    await connection.begin()
+                except:
+                    await connection.close()
+                    raise
+                self.connection = connection
+                self.session = self.async_database.Session(bind=connection, join_transaction_mode="rollback_only")
+            return self.session
+
+    async def end(self, failed=False):
+        """Commits (or rolls back) the work done so far and returns the connection to the pool."""
+        session, connection = self.session, self.connection
+        self.session = self.connection = None
+        if session is not None:
+            try:
+                if failed:
+                    await connection.rollback()
+                else:
+                    await session.flush()
+                    if connection.in_transaction():
+                        await connection.commit()
+            except:
+                drop_after_commit()
+                await connection.rollback()
+                raise
+            finally:
+                await session.close()
+                await connection.close()
+
+        if failed:
+            drop_after_commit()
+        else:
+            run_after_commit()
+
+
+class AsyncDatabaseService:
+    """Non-blocking counterpart of AWSRDSService used by the bot handlers.
+
+    Sessions are created from an AsyncEngine so a slow query only suspends the
+    coroutine that issued it instead of the whole event loop.
+    """
+
+    def __init__(self, url=None, tunnel=None):
+        logger.info("Initializing AsyncDatabaseService.")
+        self.tunnel = tunnel
+        self.url = make_url(url or self._build_url())
+        self.engine = instrument_engine(self._create_engine(self.url))
+        self.Session = async_sessionmaker(self.engine, expire_on_commit=False)
+        register_pool_gauges(self.engine, 'async')
+
+    def _build_url(self):
+        if ASYNC_DATABASE_URL:
+            return ASYNC_DATABASE_URL
+
+        if DATABASE_TYPE != "aws":
+            raise ValueError("Async engine needs ASYNC_DATABASE_URL for DATABASE_TYPE other than 'aws'.")
+
+        host, port = DATABASE_HOST, DB_PORT
+        if self.tunnel is not None:
+            # Reuse the SSH tunnel opened by the sync service instead of starting a second one
+            host, port = "127.0.0.1", self.tunnel.local_bind_port
+
+        return URL.create(
+            f"mysql+{ASYNC_DB_DRIVER}",
+            username=DATABASE_USERNAME,
+            password=DATABASE_PASSWORD,
+            host=host,
+            port=int(port),
+            database=DATABASE_NAME,
+        )
+
+    def _create_engine(self, url):
+        if url.get_backend_name() == "sqlite":
+            logger.info("Using aiosqlite engine for local run.")
+            return create_async_engine(url)
+
+        return create_async_engine(
+            url,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=3600,
+            pool_pre_ping=True,
+        )
+
+    async def open_scope(self) -> DatabaseScope:
+        """Opens a unit of work bound to the current task context.
+
+        Repositories created while the scope is open share its session and connection, which
+        are only checked out on first use; their commit() calls only flush, and the transaction
+        is committed or rolled back by commit_scope() or once by close_scope().
+        """
+        scope = DatabaseScope(self)
+        scope.tokens = enter_scope(scope)
+        return scope
+
+    async def commit_scope(self):
+        """Commits the enclosing update scope now and gives its connection back to the pool.
+
+        Call it before awaiting a provider or Telegram request so the transaction isn't held
+        open across it. Outside of a scope repositories commit themselves and this does nothing.
+        """
+        scope = get_current_scope()
+        if scope is not None:
+            await scope.end()
+
+    async def close_scope(self, scope: DatabaseScope, failed=False):
+        try:
+            await scope.end(failed=failed)
+        except Exception as e:
+            logger.error(f"Failed to finish database scope: {e}")
+        finally:
+            exit_scope(scope.tokens)
+
+    @asynccontextmanager
+    async def session_scope(self):
+        """Context-manager form of open_scope/close_scope for code running outside of an update."""
+        scope = await self.open_scope()
+        failed = False
+        try:
+            yield await scope.get_session()
+        except:
+            failed = True
+            raise
+        finally:
+            await self.close_scope(scope, failed=failed)
+
+    @asynccontextmanager
+    async def get_session(self):
+        scope = get_current_scope()
+        if scope is not None:
+            # Inside an update scope: reuse its session, the scope owns commit/rollback/close
+            yield await scope.get_session()
+            return
+
+        session = self.Session()
+        try:
+            yield session
+        except:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+    @asynccontextmanager
+    async def get_repository(self, repo_class):
+        async with self.get_session() as session:
+            yield repo_class(session)
+
+    def get_user_repository(self):
+        return self.get_repository(AsyncUserRepository)
+
+    def get_connection_repository(self):
+        return self.get_repository(AsyncConnectionRepository)
+
+    def get_payment_repository(self):
+        return self.get_repository(AsyncPaymentRepository)
+
+    async def create_tables(self):
+        logger.info("Creating database tables.")
+        from src.db.models.db_models import Base
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    async def create_missing_tables(self, models):
+        """Creates the tables of `models` that don't exist yet, with their indexes; existing tables are left alone."""
+        from src.db.models.db_models import Base
+        tables = [model.__table__ for model in models]
+        async with self.engine.begin() as conn:
+            await conn.run_sync(lambda sync_conn: Base.metadata.create_all(sync_conn, tables=tables, checkfirst=True))
+
+    async def create_missing_indexes(self, indexes):
+        """Creates the `indexes` the deployed tables don't have yet; create_all() skips existing tables."""
+        def create(sync_conn):
+            inspector = inspect(sync_conn)
+            existing = {}
+            for index in indexes:
+                table = index.table.name
+                if table not in existing:
+                    existing[table] = {row['name'] for row in inspector.get_indexes(table)}
+                if index.name not in existing[table]:
+                    logger.info(f"Creating index {index.name} on {table}.")
+                    index.create(sync_conn)
+
+        async with self.engine.begin() as conn:
+            await conn.run_sync(create)
+
+    async def check_connection(self):
+        try:
+            async with self.engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+            return True
+        except SQLAlchemyError:
+            logger.error("Async database connection check failed.")
+            return False
+
+    async def close(self):
+        logger.info("Disposing async database engine.")
+        await self.engine.dispose()
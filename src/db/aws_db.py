@@ -17,6 +17,9 @@ from src.bot.config import (
 from src.db.repositories.user_repositories import UserRepository
 from src.db.repositories.connection_repositories import ConnectionRepository
 from src.db.base import Base
+from src.db.session_scope import current_scope_id
+from src.db.instrumentation import instrument_engine
+from src.utils.metrics import register_pool_gauges
 
 logger = logging.getLogger(__name__)
 
@@ -52,7 +55,10 @@ class AWSRDSService:
                 self.engine, self.tunnel = self.get_local_db_connection()
             else:
                 self.engine, _ = self.get_ec2_db_connection()
-            self.Session = scoped_session(sessionmaker(bind=self.engine))
+            instrument_engine(self.engine)
+            register_pool_gauges(self.engine, 'sync')
+            # Keyed by the update scope rather than the thread: all updates share the event loop thread
+            self.Session = scoped_session(sessionmaker(bind=self.engine), scopefunc=current_scope_id)
         except Exception as e:
             logger.error(f"Failed to connect to the database: {str(e)}")
             raise
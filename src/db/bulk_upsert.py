@@ -0,0 +1,87 @@
+from typing import Dict, Iterable, List
+
+from sqlalchemy import text
+
+# SQL Server accepts at most 2100 parameters per statement
+MSSQL_MAX_PARAMS = 2000
+DEFAULT_CHUNK_SIZE = 500
+
+
+def _chunks(rows: List[dict], size: int) -> Iterable[List[dict]]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def bulk_upsert(session, model, rows: List[Dict], update_columns: List[str], chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Inserts rows or updates `update_columns` of the rows whose primary key already exists.
+
+    Uses the dialect's native upsert: ON DUPLICATE KEY UPDATE on MySQL, MERGE on SQL Server and
+    ON CONFLICT DO UPDATE on SQLite/PostgreSQL. All rows must have the same keys.
+    """
+    if not rows:
+        return 0
+
+    table = model.__table__
+    dialect = session.get_bind().dialect.name
+
+    if dialect == 'mssql':
+        return _merge_mssql(session, table, rows, update_columns)
+
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        for chunk in _chunks(rows, chunk_size):
+            stmt = insert(table).values(chunk)
+            stmt = stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in update_columns})
+            session.execute(stmt)
+    elif dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        index_elements = [column.name for column in table.primary_key.columns]
+        for chunk in _chunks(rows, chunk_size):
+            stmt = insert(table).values(chunk)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=index_elements,
+                set_={column: stmt.excluded[column] for column in update_columns},
+            )
+            session.execute(stmt)
+    else:
+        raise ValueError(f"bulk_upsert does not support the '{dialect}' dialect")
+
+    return len(rows)
+
+
+def _merge_mssql(session, table, rows: List[Dict], update_columns: List[str]) -> int:
+    preparer = session.get_bind().dialect.identifier_preparer
+    columns = list(rows[0].keys())
+    key_columns = [column.name for column in table.primary_key.columns]
+
+    quoted = {column: preparer.quote(column) for column in columns}
+    on_clause = " AND ".join(f"target.{quoted[c]} = source.{quoted[c]}" for c in key_columns)
+    set_clause = ", ".join(f"target.{quoted[c]} = source.{quoted[c]}" for c in update_columns)
+    insert_columns = ", ".join(quoted[c] for c in columns)
+    source_columns = ", ".join(f"source.{quoted[c]}" for c in columns)
+
+    rows_per_statement = max(1, MSSQL_MAX_PARAMS // len(columns))
+    for chunk in _chunks(rows, rows_per_statement):
+        params = {}
+        values = []
+        for row_index, row in enumerate(chunk):
+            placeholders = []
+            for column_index, column in enumerate(columns):
+                name = f"p{row_index}_{column_index}"
+                params[name] = row[column]
+                placeholders.append(f":{name}")
+            values.append(f"({', '.join(placeholders)})")
+
+        statement = (
+            f"MERGE INTO {preparer.format_table(table)} WITH (HOLDLOCK) AS target "
+            f"USING (VALUES {', '.join(values)}) AS source ({insert_columns}) "
+            f"ON {on_clause} "
+            + (f"WHEN MATCHED THEN UPDATE SET {set_clause} " if set_clause else "")
+            + f"WHEN NOT MATCHED THEN INSERT ({insert_columns}) VALUES ({source_columns});"
+        )
+        session.execute(text(statement), params)
+
+    return len(rows)
@@ -0,0 +1,57 @@
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, NamedTuple, Tuple
+
+from src.bot.config import CONNECTION_SNAPSHOT_CACHE_SIZE, CONNECTION_SNAPSHOT_TTL
+
+
+class ConnectionRecord(NamedTuple):
+    """The fields of a ProxyConnections row that keyboards and price calculations need."""
+
+    id: str
+    login: str
+    connection_type: Optional[str]
+    expiration_date: Optional[datetime]
+
+    @classmethod
+    def from_connection(cls, connection) -> 'ConnectionRecord':
+        return cls(connection.id, connection.login, connection.connection_type, connection.expiration_date)
+
+
+class ConnectionSnapshotCache:
+    """Bounded LRU + TTL cache of user id -> their connections as ConnectionRecords.
+
+    load() always reads the database and is used where a flow starts (the "💳 Pay" command),
+    so a flow never starts on stale data; the pay flow then keeps its records in the FSM data
+    as a PaymentSession, which every button press of the checkout renders from.
+    """
+
+    def __init__(self, async_database, maxsize: int = CONNECTION_SNAPSHOT_CACHE_SIZE, ttl: float = CONNECTION_SNAPSHOT_TTL):
+        self.async_database = async_database
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: 'OrderedDict[int, Tuple[float, Tuple[ConnectionRecord, ...]]]' = OrderedDict()
+
+    async def get(self, user_id: int) -> Tuple[ConnectionRecord, ...]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            return await self.load(user_id)
+        self._entries.move_to_end(user_id)
+        return entry[1]
+
+    async def load(self, user_id: int) -> Tuple[ConnectionRecord, ...]:
+        async with self.async_database.get_connection_repository() as connection_repository:
+            connections = await connection_repository.get_user_connections(user_id)
+        records = tuple(ConnectionRecord.from_connection(connection) for connection in connections)
+        self._entries[user_id] = (time.monotonic() + self.ttl, records)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return records
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,112 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+
+from src.bot.config import SQL_DEBUG, SQL_N_PLUS_ONE_THRESHOLD
+from src.utils.metrics import DB_STATEMENT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_current_stats: ContextVar[Optional['QueryStats']] = ContextVar('query_stats', default=None)
+
+# Literal parameter lists (IN (?, ?, ?) after expansion) collapse to one placeholder
+_PARAM_LIST = re.compile(r"(\?|%s|%\(\w+\)s|:\w+)(\s*,\s*(\?|%s|%\(\w+\)s|:\w+))+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """Normalises a SQL statement so the same query with different parameters has one shape."""
+    return _PARAM_LIST.sub('?', _WHITESPACE.sub(' ', statement)).strip()
+
+
+class QueryStats:
+    """Statements issued while handling one update."""
+
+    __slots__ = ('statements', 'seconds', 'shapes', 'handler')
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+        self.handler: Optional[str] = None
+
+    def repeated_shapes(self, threshold: int = SQL_N_PLUS_ONE_THRESHOLD) -> List[tuple]:
+        """(shape, count) of the statements run at least `threshold` times, the likely N+1s."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+class HandlerQueryTotals:
+    __slots__ = ('updates', 'statements', 'seconds', 'max_statements', 'n_plus_one')
+
+    def __init__(self):
+        self.updates = 0
+        self.statements = 0
+        self.seconds = 0.0
+        self.max_statements = 0
+        self.n_plus_one = 0
+
+
+# Handler name -> totals since start
+handler_totals: Dict[str, HandlerQueryTotals] = {}
+
+
+def start_tracking() -> QueryStats:
+    stats = QueryStats()
+    _current_stats.set(stats)
+    return stats
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current_stats.get()
+
+
+def finish_tracking(stats: QueryStats, update_id=None):
+    """Folds the stats of an update into the per-handler totals and reports repeated statements."""
+    _current_stats.set(None)
+    handler = stats.handler or 'unhandled'
+    totals = handler_totals.setdefault(handler, HandlerQueryTotals())
+    totals.updates += 1
+    totals.statements += stats.statements
+    totals.seconds += stats.seconds
+    totals.max_statements = max(totals.max_statements, stats.statements)
+
+    repeated = stats.repeated_shapes()
+    if repeated:
+        totals.n_plus_one += 1
+        for shape, count in repeated:
+            logger.warning(f"Possible N+1 in {handler} (update {update_id}): {count}x {shape[:300]}")
+    if SQL_DEBUG and stats.statements:
+        logger.info(f"{handler} (update {update_id}): {stats.statements} statements in {stats.seconds * 1000:.1f}ms")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    elapsed = time.perf_counter() - started.pop() if started else 0.0
+    DB_STATEMENT_SECONDS.observe(elapsed)
+
+    stats = _current_stats.get()
+    if stats is None:
+        return
+    stats.seconds += elapsed
+    stats.statements += 1
+    stats.shapes[statement_shape(statement)] += 1
+    if SQL_DEBUG:
+        logger.debug(f"[{stats.handler or 'update'}] {statement}")
+
+
+def instrument_engine(engine):
+    """Times the statements of `engine` (sync or async) and counts them into the stats of the current update."""
+    sync_engine = getattr(engine, 'sync_engine', engine)
+    if not event.contains(sync_engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(sync_engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(sync_engine, 'after_cursor_execute', _after_cursor_execute)
+    return engine
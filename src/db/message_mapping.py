@@ -0,0 +1,136 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select, delete, insert
+
+from src.bot.config import (
+    ADMIN_CHAT_ID, FORWARD_MAPPING_CACHE_SIZE, FORWARD_MAPPING_TTL_DAYS, FORWARD_MAPPING_FLUSH_INTERVAL
+)
+from src.db.models.db_models import ForwardedMessage, current_datetime_utc
+
+logger = logging.getLogger(__name__)
+
+
+class ForwardRecord:
+    """Where a message forwarded to the admin chat came from."""
+
+    __slots__ = ('user_chat_id', 'user_message_id')
+
+    def __init__(self, user_chat_id: int, user_message_id: Optional[int]):
+        self.user_chat_id = user_chat_id
+        self.user_message_id = user_message_id
+
+
+class MessageMappingStore:
+    """Admin-chat message id -> ForwardRecord, so admin replies can be routed back to the user.
+
+    A bounded LRU serves recent forwards; every mapping is also written behind to the
+    ForwardedMessages table, which answers misses (older forwards, or any forward after a
+    restart) and is trimmed to `ttl_days` by cleanup().
+    """
+
+    def __init__(self, async_database, maxsize: int = FORWARD_MAPPING_CACHE_SIZE, ttl_days: int = FORWARD_MAPPING_TTL_DAYS,
+                 flush_interval: float = FORWARD_MAPPING_FLUSH_INTERVAL):
+        self.async_database = async_database
+        self.maxsize = maxsize
+        self.ttl_days = ttl_days
+        self.flush_interval = flush_interval
+        self._entries: 'OrderedDict[Tuple[int, int], ForwardRecord]' = OrderedDict()
+        self._pending: List[dict] = []
+        self._task = None
+
+    def remember(self, admin_message_id: int, user_chat_id: int, user_message_id: Optional[int] = None,
+                 admin_chat_id: int = ADMIN_CHAT_ID):
+        self._cache((admin_chat_id, admin_message_id), ForwardRecord(user_chat_id, user_message_id))
+        self._pending.append({
+            'admin_chat_id': admin_chat_id,
+            'admin_message_id': admin_message_id,
+            'user_chat_id': user_chat_id,
+            'user_message_id': user_message_id,
+            'created_at': current_datetime_utc(),
+        })
+
+    async def get(self, admin_message_id: int, admin_chat_id: int = ADMIN_CHAT_ID) -> Optional[ForwardRecord]:
+        key = (admin_chat_id, admin_message_id)
+        record = self._entries.get(key)
+        if record is not None:
+            self._entries.move_to_end(key)
+            return record
+
+        try:
+            async with self.async_database.get_session() as session:
+                result = await session.execute(
+                    select(ForwardedMessage.user_chat_id, ForwardedMessage.user_message_id).where(
+                        ForwardedMessage.admin_chat_id == admin_chat_id,
+                        ForwardedMessage.admin_message_id == admin_message_id,
+                        ForwardedMessage.created_at >= self._cutoff(),
+                    )
+                )
+                row = result.first()
+        except Exception as e:
+            logger.error(f"Failed to look up forwarded message {admin_message_id}: {e}")
+            return None
+        if row is None:
+            return None
+        record = ForwardRecord(row.user_chat_id, row.user_message_id)
+        self._cache(key, record)
+        return record
+
+    def _cache(self, key: Tuple[int, int], record: ForwardRecord):
+        self._entries[key] = record
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _cutoff(self):
+        return current_datetime_utc() - timedelta(days=self.ttl_days)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, []
+        try:
+            async with self.async_database.engine.begin() as conn:
+                await conn.execute(insert(ForwardedMessage), pending)
+        except Exception as e:
+            logger.error(f"Failed to store {len(pending)} forwarded message mappings: {e}")
+            # Retry with the next flush, but don't grow without bound while the DB is away
+            retry = pending + self._pending
+            dropped = len(retry) - self.maxsize
+            if dropped > 0:
+                logger.warning(f"Dropping {dropped} oldest forwarded message mappings; replies to them can't be routed")
+                retry = retry[dropped:]
+            self._pending = retry
+            return 0
+        return len(pending)
+
+    async def cleanup(self) -> int:
+        """Deletes the mappings older than the TTL; returns how many were removed."""
+        async with self.async_database.engine.begin() as conn:
+            result = await conn.execute(delete(ForwardedMessage).where(ForwardedMessage.created_at < self._cutoff()))
+        return result.rowcount
+
+    def __len__(self):
+        return len(self._entries)
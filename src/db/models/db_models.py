@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DECIMAL, BigInteger, Text, Enum as SQLAEnum
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DECIMAL, BigInteger, Text, Index, Enum as SQLAEnum
 from sqlalchemy.dialects.mssql import SMALLDATETIME
 from sqlalchemy.dialects.mysql import DATETIME as MYSQLDATETIME
 from sqlalchemy.orm import relationship
@@ -74,10 +74,13 @@ class Admin(Base):
 
 class User(Base):
     __tablename__ = 'Users'
+    # Keyset pagination of the admin client list (is_active = ? AND id > ? ORDER BY id)
+    __table_args__ = (Index('ix_Users_is_active_id', 'is_active', 'id'),)
     id = Column(Integer, primary_key=True, autoincrement=True)
-    username = Column(String(255), unique=False, nullable=True)
-    first_name = Column(String(255), nullable=True)
-    last_name = Column(String(255), nullable=True)
+    # Indexed for the admin's prefix search (LIKE 'abc%')
+    username = Column(String(255), unique=False, nullable=True, index=True)
+    first_name = Column(String(255), nullable=True, index=True)
+    last_name = Column(String(255), nullable=True, index=True)
     user_type = Column(String(255), default=UserType.TELEGRAM.value)
     telegram_user_id = Column(BigInteger, unique=False, nullable=True)
     telegram_chat_id = Column(BigInteger, unique=False, nullable=True)
@@ -346,4 +349,43 @@ class ConnectionDataChange(Base):
         elif self.user:
             return f"User: {self.user.username}"
         else:
-            return "N/A"
\ No newline at end of file
+            return "N/A"
+class ProviderSyncWatermark(Base):
+    __tablename__ = 'ProviderSyncWatermarks'
+    service_name = Column(String(50), primary_key=True)
+    proxy_id = Column(String(255), primary_key=True)
+    # Highest connection updatedTimestamp (provider milliseconds) already written to the DB
+    high_water_mark = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTimeType, default=current_datetime_utc)
+    # Last full reconcile of the proxy, which also catches deleted connections
+    reconciled_at = Column(DateTimeType, nullable=True)
+
+
+class ForwardedMessage(Base):
+    __tablename__ = 'ForwardedMessages'
+    # Copy of a user's message in the admin chat -> the original, so admin replies reach the user
+    admin_chat_id = Column(BigInteger, primary_key=True)
+    admin_message_id = Column(BigInteger, primary_key=True)
+    user_chat_id = Column(BigInteger, nullable=False)
+    user_message_id = Column(BigInteger, nullable=True)
+    created_at = Column(DateTimeType, default=current_datetime_utc, index=True)
+
+
+class FSMRecord(Base):
+    __tablename__ = 'FSMStates'
+    # aiogram FSM state, data and throttling bucket of one user in one chat (SQLStorage)
+    chat_id = Column(BigInteger, primary_key=True)
+    user_id = Column(BigInteger, primary_key=True)
+    state = Column(String(255), nullable=True)
+    data = Column(Text, nullable=True)
+    bucket = Column(Text, nullable=True)
+    updated_at = Column(DateTimeType, default=current_datetime_utc, index=True)
+
+
+# Tables added after the initial schema, which the deployed database may not have yet;
+# created on startup by AsyncDatabaseService.create_missing_tables()
+RUNTIME_MODELS = [ProviderSyncWatermark, ForwardedMessage, FSMRecord]
+
+# Indexes added to existing tables after the initial schema; created on startup by
+# AsyncDatabaseService.create_missing_indexes() where they are missing
+RUNTIME_INDEXES = list(User.__table__.indexes)
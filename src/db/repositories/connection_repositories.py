@@ -1,5 +1,6 @@
 from typing import List, Optional
-from sqlalchemy.orm import joinedload
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
 from src.db.models.db_models import DBProxyConnection
 
 class ConnectionRepository:
@@ -27,3 +28,50 @@ class ConnectionRepository:
         """Retrieves a connection by its ID and returns it as a dictionary."""
         connection = self.session.query(DBProxyConnection).filter_by(id=connection_id).first()
         return connection.to_dict() if connection else None
+
+
+class AsyncConnectionRepository:
+    """Async version of ConnectionRepository. Relationships are loaded eagerly since AsyncSession cannot lazy-load."""
+
+    def __init__(self, session):
+        self.session = session
+
+    async def get_user_connections(self, user_id: int, include_deleted: bool = False) -> List[DBProxyConnection]:
+        """Retrieves connections associated with a user.
+
+        Args:
+            user_id (int): The ID of the user.
+            include_deleted (bool): If True, include deleted connections. Default is False.
+
+        Returns:
+            List[DBProxyConnection]: A list of connections associated with the user.
+        """
+        query = select(DBProxyConnection).options(selectinload(DBProxyConnection.proxy)).filter_by(user_id=user_id)
+
+        if not include_deleted:
+            query = query.filter_by(deleted=False)
+
+        result = await self.session.execute(query)
+        return list(result.scalars())
+
+    async def get_connections_by_ids(self, connection_ids: List[str]) -> List[DBProxyConnection]:
+        """Retrieves several connections in one query, keeping the order of connection_ids."""
+        if not connection_ids:
+            return []
+        result = await self.session.execute(
+            select(DBProxyConnection)
+            .options(selectinload(DBProxyConnection.proxy))
+            .filter(DBProxyConnection.id.in_(connection_ids))
+        )
+        connections = {connection.id: connection for connection in result.scalars()}
+        return [connections[connection_id] for connection_id in connection_ids if connection_id in connections]
+
+    async def get_connection_by_id(self, connection_id: str) -> Optional[dict]:
+        """Retrieves a connection by its ID and returns it as a dictionary."""
+        result = await self.session.execute(
+            select(DBProxyConnection)
+            .options(selectinload(DBProxyConnection.user), selectinload(DBProxyConnection.host))
+            .filter_by(id=connection_id)
+        )
+        connection = result.scalars().first()
+        return connection.to_dict() if connection else None
@@ -1,4 +1,8 @@
+import logging
 from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
 from src.db.models.db_models import CryptoPayment, Payment, DBProxyConnection
 
 class PaymentRepository:
@@ -72,3 +76,86 @@ class PaymentRepository:
         self.session.commit()
 
 
+class AsyncPaymentRepository:
+    """Async version of PaymentRepository."""
+
+    def __init__(self, session):
+        self.session = session
+
+    async def create_payments(self, user, payment_items, txid, days, payment_method) -> Optional[List[Payment]]:
+        """Creates pending Payment records (plus CryptoPayment rows for crypto) in one transaction.
+
+        `days` maps connection ID to the number of paid days.
+        """
+        payments = []
+        try:
+            for connection, amount in payment_items:
+                start_date = connection.expiration_date or datetime.now()
+                payment = Payment(
+                    user=user,
+                    connection=connection,
+                    amount=amount,
+                    payment_date=datetime.now(),
+                    status='pending',
+                    payment_method=payment_method,
+                    start_date=start_date,
+                    end_date=start_date + timedelta(days=days.get(connection.id, 0))
+                )
+                self.session.add(payment)
+                payments.append(payment)
+
+            # Flush once to get all payment IDs for the crypto rows
+            await self.session.flush()
+
+            if payment_method == 'crypto':
+                self.session.add_all([CryptoPayment(payment_id=payment.id, txid=txid) for payment in payments])
+
+            await self.session.commit()
+            return payments
+
+        except Exception as e:
+            logging.exception(f"Error creating payments: {e}")
+            await self.session.rollback()
+            return None
+
+    async def get_payment_by_id(self, payment_id: int) -> Optional[Payment]:
+        """Gets a payment by its ID together with its user and connection."""
+        result = await self.session.execute(
+            select(Payment)
+            .options(
+                selectinload(Payment.user),
+                selectinload(Payment.connection).selectinload(DBProxyConnection.proxy),
+            )
+            .filter_by(id=payment_id)
+        )
+        return result.scalars().first()
+
+    async def get_crypto_payment(self, payment_id: int) -> Optional[CryptoPayment]:
+        result = await self.session.execute(select(CryptoPayment).filter_by(payment_id=payment_id))
+        return result.scalars().first()
+
+    async def confirm_payment(self, payment: Payment, txid: str):
+        """Confirms a payment and extends the proxy connection expiration date."""
+        if payment.status != 'confirmed':
+            payment.status = 'confirmed'
+            payment.connection.expiration_date = payment.end_date
+
+            if payment.payment_method == 'crypto':
+                crypto_payment = await self.get_crypto_payment(payment.id)
+                if not crypto_payment:
+                    self.session.add(CryptoPayment(payment_id=payment.id, txid=txid))
+                else:
+                    crypto_payment.txid = txid
+
+            await self.session.commit()
+
+    async def decline_payment(self, payment: Payment):
+        """Declines a payment and handles associated records."""
+        payment.status = 'declined'
+
+        if payment.payment_method == 'crypto':
+            crypto_payment = await self.get_crypto_payment(payment.id)
+            if crypto_payment:
+                await self.session.delete(crypto_payment)
+
+        await self.session.commit()
@@ -8,6 +8,9 @@ from typing import List
 
 from src.db.models.db_models import User, UserType, DBProxy, UserHistory
 from src.bot.config import USER_TIMEZONE
+from src.db.user_cache import CachedUser, user_identity_cache, client_count_cache
+from src.db.session_scope import after_commit
+from sqlalchemy import select, update, func, or_
 from sqlalchemy.orm.exc import NoResultFound
     
 USER_TIMEZONE = 'Europe/Warsaw'
@@ -218,4 +221,203 @@ class UserRepository:
                 setattr(user, field, new_value)  # Update the user attribute
 
         user.last_message_at = user_data.get('last_message_at', datetime.now(pytz.utc))
-        self.session.commit()
\ No newline at end of file
+        self.session.commit()
+
+
+def user_to_dict(user: User) -> dict:
+    return {
+        'id': user.id,
+        'telegram_user_id': user.telegram_user_id,
+        'telegram_chat_id': user.telegram_chat_id,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'joined_at': user.joined_at,
+        'last_message_at': user.last_message_at,
+        'user_type': user.user_type
+    }
+
+
+class AsyncUserRepository:
+    """Async version of UserRepository, bound to an AsyncSession.
+
+    Lookups by telegram_user_id go through the identity cache first, so returning users cost no SELECT.
+    """
+
+    def __init__(self, session, cache=user_identity_cache):
+        self.session = session
+        self.cache = cache
+
+    async def get_or_create_user(self, message, user_type=UserType.TELEGRAM.value) -> Optional[dict]:
+        """Gets or creates the user of a message.
+
+        For existing users only profile changes are written here; `last_message_at` and
+        `telegram_chat_id` are bumped through UserTouchBuffer by ForwardToAdminMiddleware.
+        """
+        try:
+            user_data = self._extract_user_data(message, user_type)
+
+            cached = self.cache.get(user_data['telegram_user_id'])
+            if cached is not None:
+                if cached.matches_profile(user_data):
+                    return self._with_touch(cached.to_dict(), user_data)
+                # Profile changed: fall through to the DB to write it back and log history
+                self.cache.invalidate(cached.telegram_user_id)
+
+            result = await self.session.execute(
+                select(User).filter_by(telegram_user_id=user_data['telegram_user_id'])
+            )
+            user = result.scalars().first()
+
+            if not user:
+                user = User(**user_data)
+                self.session.add(user)
+                await self.session.commit()
+            elif self._update_user_and_log_history(user, user_data):
+                await self.session.commit()
+
+            # Inside an update scope the commit above only flushed; a rolled back user must not be cached
+            entry = CachedUser.from_user(user)
+            after_commit(lambda: self.cache.put(entry))
+            return self._with_touch(user_to_dict(user), user_data)
+
+        except Exception as e:
+            logging.exception(f"Error getting or creating user: {e}")
+            await self.session.rollback()
+            return None
+
+    @staticmethod
+    def _with_touch(user_dict: dict, user_data: dict) -> dict:
+        # The DB copy may lag behind UserTouchBuffer, the message itself is authoritative
+        user_dict['telegram_chat_id'] = user_data['telegram_chat_id']
+        user_dict['last_message_at'] = user_data['last_message_at']
+        return user_dict
+
+    async def get_active_users(self) -> List[User]:
+        result = await self.session.execute(select(User).filter_by(is_active=True))
+        return list(result.scalars())
+
+    async def get_inactive_users(self) -> List[User]:
+        result = await self.session.execute(select(User).filter_by(is_active=False))
+        return list(result.scalars())
+
+    @staticmethod
+    def _client_criteria(is_active: bool, search: Optional[str]) -> list:
+        criteria = [User.is_active == is_active]
+        if search:
+            # A prefix pattern, so the username / first_name / last_name indexes serve it
+            escaped = search.lstrip('@').replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            pattern = f"{escaped}%"
+            criteria.append(or_(
+                User.username.like(pattern, escape='\\'),
+                User.first_name.like(pattern, escape='\\'),
+                User.last_name.like(pattern, escape='\\'),
+            ))
+        return criteria
+
+    async def get_clients_page(self, is_active: bool, limit: int, after_id: int = 0, before_id: int = 0,
+                               search: Optional[str] = None) -> Tuple[List[User], bool]:
+        """One page of the admin client list, keyset-paginated by id.
+
+        Returns the users after `after_id` (or the page before `before_id`) in id order, and
+        whether there are more in that direction.
+        """
+        query = select(User).where(*self._client_criteria(is_active, search))
+        if before_id:
+            query = query.where(User.id < before_id).order_by(User.id.desc())
+        else:
+            query = query.where(User.id > after_id).order_by(User.id)
+        result = await self.session.execute(query.limit(limit + 1))
+        users = list(result.scalars())
+        more = len(users) > limit
+        users = users[:limit]
+        if before_id:
+            users.reverse()
+        return users, more
+
+    async def count_clients(self, is_active: bool, search: Optional[str] = None) -> int:
+        """Size of the admin client list; cached briefly since it's only shown as the page count."""
+        key = (is_active, search or '')
+        count = client_count_cache.get(key)
+        if count is None:
+            result = await self.session.execute(
+                select(func.count(User.id)).where(*self._client_criteria(is_active, search))
+            )
+            count = result.scalar_one()
+            client_count_cache.put(key, count)
+        return count
+
+    async def get_user_by_id(self, user_id: int) -> Optional[User]:
+        """Gets a user by ID."""
+        return await self.session.get(User, user_id)
+
+    async def get_recipients_batch(self, criteria: list, after_id: int, limit: int) -> list:
+        """(id, telegram_user_id, telegram_chat_id) of active users matching `criteria`, keyset-paginated by id."""
+        result = await self.session.execute(
+            select(User.id, User.telegram_user_id, User.telegram_chat_id)
+            .where(User.is_active == True, User.telegram_chat_id.isnot(None), User.id > after_id, *criteria)
+            .order_by(User.id)
+            .limit(limit)
+        )
+        return list(result)
+
+    async def count_recipients(self, criteria: list) -> int:
+        result = await self.session.execute(
+            select(func.count(User.id))
+            .where(User.is_active == True, User.telegram_chat_id.isnot(None), *criteria)
+        )
+        return result.scalar_one()
+
+    async def deactivate_users(self, recipients: list) -> int:
+        """Marks the users of `recipients` (rows of get_recipients_batch) inactive in one UPDATE."""
+        if not recipients:
+            return 0
+        result = await self.session.execute(
+            update(User).where(User.id.in_([recipient.id for recipient in recipients])).values(is_active=False)
+        )
+        await self.session.commit()
+        # Cached rows still say is_active=True
+        for recipient in recipients:
+            self.cache.invalidate(recipient.telegram_user_id)
+        client_count_cache.clear()
+        return result.rowcount
+
+    async def get_user_by_telegram_user_id(self, telegram_user_id: int) -> Optional[User]:
+        """Gets a user by Telegram user ID."""
+        result = await self.session.execute(select(User).filter_by(telegram_user_id=telegram_user_id))
+        return result.scalars().first()
+
+    def _extract_user_data(self, message, user_type) -> dict:
+        """Extracts user data from the message."""
+        return {
+            'telegram_user_id': message.from_user.id,
+            'telegram_chat_id': message.chat.id,
+            'username': message.from_user.username,
+            'first_name': message.from_user.first_name,
+            'last_name': message.from_user.last_name,
+            'joined_at': message.date.astimezone(pytz.utc),
+            'last_message_at': message.date.astimezone(pytz.utc),
+            'user_type': user_type
+        }
+
+    def _update_user_and_log_history(self, user, user_data) -> bool:
+        """Updates profile attributes and logs changes to UserHistory. Returns True if anything changed; the caller commits."""
+        changed = False
+        for field in ['username', 'first_name', 'last_name', 'user_type']:
+            old_value = getattr(user, field)
+            new_value = user_data.get(field)
+
+            if old_value != new_value:
+                self.session.add(UserHistory(
+                    user_id=user.id,
+                    timestamp=datetime.now(pytz.utc),
+                    action=f"{field}_changed",
+                    details=json.dumps({
+                        "old_value": old_value,
+                        "new_value": new_value
+                    })
+                ))
+                setattr(user, field, new_value)
+                changed = True
+
+        return changed
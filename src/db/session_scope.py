@@ -0,0 +1,75 @@
+import itertools
+import threading
+from contextvars import ContextVar
+from typing import Any, Callable, List, Optional
+
+# Task-local replacements for the thread-local registry used by scoped_session.
+# Every aiogram update runs in its own task context, so values set here are private to that update.
+_scope_id: ContextVar[Optional[int]] = ContextVar("db_scope_id", default=None)
+_current_scope: ContextVar[Optional[Any]] = ContextVar("db_current_scope", default=None)
+_after_commit: ContextVar[Optional[List[Callable[[], None]]]] = ContextVar("db_after_commit", default=None)
+_scope_counter = itertools.count(1)
+
+
+def current_scope_id():
+    """scopefunc for scoped_session: one session per open update scope, per thread otherwise."""
+    scope_id = _scope_id.get()
+    if scope_id is not None:
+        return ("scope", scope_id)
+    return ("thread", threading.get_ident())
+
+
+def get_current_scope():
+    """Returns the enclosing update scope (an async_db.DatabaseScope), if any."""
+    return _current_scope.get()
+
+
+def enter_scope(scope):
+    """Binds the scope to the current context and returns the tokens needed by exit_scope."""
+    return _scope_id.set(next(_scope_counter)), _current_scope.set(scope), _after_commit.set([])
+
+
+def exit_scope(tokens):
+    scope_token, current_scope_token, after_commit_token = tokens
+    _after_commit.reset(after_commit_token)
+    _current_scope.reset(current_scope_token)
+    _scope_id.reset(scope_token)
+
+
+def after_commit(callback: Callable[[], None]):
+    """Runs `callback` once the data written so far is committed.
+
+    Inside an update scope a repository's commit() only flushes, so caches must not be filled
+    until close_scope() commits; if the scope rolls back the callbacks are dropped. Outside of
+    a scope the caller's commit was real and the callback runs right away.
+    """
+    callbacks = _after_commit.get()
+    if callbacks is None:
+        callback()
+    else:
+        callbacks.append(callback)
+
+
+def run_after_commit():
+    """Runs the callbacks collected by after_commit() in the current scope."""
+    callbacks = _after_commit.get()
+    while callbacks:
+        callbacks.pop(0)()
+
+
+def drop_after_commit():
+    """Forgets the callbacks collected so far; their writes were rolled back."""
+    callbacks = _after_commit.get()
+    if callbacks:
+        callbacks.clear()
+
+
+def detach_scope():
+    """Forgets the enclosing update scope in the current context.
+
+    Tasks created from a handler inherit a copy of its context; call this first in such a task
+    so it opens its own sessions instead of borrowing the update's, which closes with the update.
+    """
+    _current_scope.set(None)
+    _scope_id.set(None)
+    _after_commit.set(None)
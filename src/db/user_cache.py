@@ -0,0 +1,132 @@
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+from src.bot.config import USER_CACHE_SIZE, USER_CACHE_TTL, CLIENT_COUNT_TTL
+
+
+class CachedUser:
+    """Compact snapshot of a Users row, enough to serve returning users without a SELECT."""
+
+    __slots__ = (
+        'id', 'telegram_user_id', 'telegram_chat_id', 'username', 'first_name', 'last_name',
+        'user_type', 'joined_at', 'is_active', 'is_admin', 'expires_at',
+    )
+
+    PROFILE_FIELDS = ('username', 'first_name', 'last_name', 'user_type')
+
+    def __init__(self, id, telegram_user_id, telegram_chat_id, username, first_name, last_name,
+                 user_type, joined_at, is_active, is_admin, expires_at=0.0):
+        self.id = id
+        self.telegram_user_id = telegram_user_id
+        self.telegram_chat_id = telegram_chat_id
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+        self.user_type = user_type
+        self.joined_at = joined_at
+        self.is_active = is_active
+        self.is_admin = is_admin
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_user(cls, user) -> 'CachedUser':
+        return cls(
+            id=user.id,
+            telegram_user_id=user.telegram_user_id,
+            telegram_chat_id=user.telegram_chat_id,
+            username=user.username,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            user_type=user.user_type,
+            joined_at=user.joined_at,
+            is_active=user.is_active,
+            is_admin=user.is_admin,
+        )
+
+    def matches_profile(self, user_data: dict) -> bool:
+        return all(getattr(self, field) == user_data.get(field) for field in self.PROFILE_FIELDS)
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'telegram_user_id': self.telegram_user_id,
+            'telegram_chat_id': self.telegram_chat_id,
+            'username': self.username,
+            'first_name': self.first_name,
+            'last_name': self.last_name,
+            'joined_at': self.joined_at,
+            'last_message_at': None,
+            'user_type': self.user_type
+        }
+
+
+class UserIdentityCache:
+    """Bounded LRU + TTL cache of telegram_user_id -> CachedUser."""
+
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: 'OrderedDict[int, CachedUser]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, telegram_user_id: int) -> Optional[CachedUser]:
+        entry = self._entries.get(telegram_user_id)
+        if entry is None or entry.expires_at < time.monotonic():
+            if entry is not None:
+                del self._entries[telegram_user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(telegram_user_id)
+        self.hits += 1
+        return entry
+
+    def put(self, entry: CachedUser):
+        if entry.telegram_user_id is None:
+            return
+        entry.expires_at = time.monotonic() + self.ttl
+        self._entries[entry.telegram_user_id] = entry
+        self._entries.move_to_end(entry.telegram_user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, telegram_user_id: int):
+        self._entries.pop(telegram_user_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+user_identity_cache = UserIdentityCache()
+
+
+class CountCache:
+    """Short-lived counts keyed by query parameters, for totals that are only displayed."""
+
+    def __init__(self, ttl: float = CLIENT_COUNT_TTL, maxsize: int = 256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: 'OrderedDict[Hashable, Tuple[float, int]]' = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[int]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def put(self, key: Hashable, count: int):
+        self._entries[key] = (time.monotonic() + self.ttl, count)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+# (is_active, search) -> number of clients on the admin client list
+client_count_cache = CountCache()
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Tuple
+
+from sqlalchemy import update, case
+
+from src.bot.config import USER_TOUCH_FLUSH_INTERVAL
+from src.db.models.db_models import User
+
+logger = logging.getLogger(__name__)
+
+FLUSH_CHUNK_SIZE = 500
+
+
+class UserTouchBuffer:
+    """Write-behind buffer for the per-message `last_message_at` / `telegram_chat_id` bumps.
+
+    Touches are coalesced in memory per telegram_user_id (the newest one wins) and written
+    every few seconds with a single UPDATE ... CASE statement per chunk of users.
+    """
+
+    def __init__(self, async_database, flush_interval: float = USER_TOUCH_FLUSH_INTERVAL):
+        self.async_database = async_database
+        self.flush_interval = flush_interval
+        self._pending: Dict[int, Tuple[int, datetime]] = {}
+        self._task = None
+
+    def touch(self, telegram_user_id: int, chat_id: int, last_message_at: datetime):
+        current = self._pending.get(telegram_user_id)
+        if current is None or current[1] <= last_message_at:
+            self._pending[telegram_user_id] = (chat_id, last_message_at)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+
+        pending, self._pending = self._pending, {}
+        items = list(pending.items())
+        flushed = 0
+        try:
+            async with self.async_database.engine.begin() as conn:
+                for start in range(0, len(items), FLUSH_CHUNK_SIZE):
+                    chunk = dict(items[start:start + FLUSH_CHUNK_SIZE])
+                    await conn.execute(
+                        update(User)
+                        .where(User.telegram_user_id.in_(list(chunk)))
+                        .values(
+                            telegram_chat_id=case(
+                                {user_id: chat_id for user_id, (chat_id, _) in chunk.items()},
+                                value=User.telegram_user_id,
+                            ),
+                            last_message_at=case(
+                                {user_id: touched_at for user_id, (_, touched_at) in chunk.items()},
+                                value=User.telegram_user_id,
+                            ),
+                        )
+                    )
+                    flushed += len(chunk)
+        except Exception as e:
+            logger.error(f"Failed to flush {len(items)} user touches: {e}")
+            # Put them back unless a newer touch arrived meanwhile
+            for user_id, value in items:
+                self._pending.setdefault(user_id, value)
+            return 0
+
+        logger.debug(f"Flushed {flushed} user touches")
+        return flushed
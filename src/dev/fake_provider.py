@@ -0,0 +1,335 @@
+"""Local stand-in for the iProxy and Localtonet APIs.
+
+Serves a synthetic fleet on the endpoints the provider managers use, with configurable
+latency, error injection and churn, so syncs and user flows can be exercised without
+touching the real providers. Point the bot at it with FAKE_PROVIDER_URL:
+
+    python -m src.dev.fake_provider --proxies 1000 --latency 40 --error-rate 0.01 --churn 0.05
+    FAKE_PROVIDER_URL=http://127.0.0.1:8081 python main.py
+"""
+import argparse
+import asyncio
+import logging
+import random
+import string
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+IPROXY_PREFIX = '/iproxy/v1'
+IPROXY_PUSH_PREFIX = '/iproxy-rt'
+LOCALTONET_PREFIX = '/localtonet/api'
+
+
+def _millis(moment: datetime) -> int:
+    return int(moment.timestamp() * 1000)
+
+
+def _secret(rng: random.Random, length: int = 10) -> str:
+    return ''.join(rng.choice(string.ascii_letters + string.digits) for _ in range(length))
+
+
+class FakeFleet:
+    """In-memory provider state: iProxy phones with their proxies and Localtonet tokens with their tunnels.
+
+    `proxies` is the number of phones (and Localtonet auth tokens), each with
+    `connections_per_proxy` connections (tunnels). churn() mutates a fraction of them.
+    """
+
+    def __init__(self, proxies: int = 100, connections_per_proxy: int = 1, users: Optional[int] = None,
+                 seed: int = 42):
+        self.rng = random.Random(seed)
+        self.connections_per_proxy = connections_per_proxy
+        self.users = users or max(1, proxies * connections_per_proxy // 2)
+        self._next_id = 1
+        self.now = datetime.now().replace(microsecond=0)
+
+        self.iproxy_phones: Dict[str, dict] = {}
+        self.iproxy_connections: Dict[str, List[dict]] = {}
+        self.localtonet_tunnels: Dict[str, List[dict]] = {}  # authToken -> tunnels
+        self.expirations: Dict[str, datetime] = {}
+        self.restarts = Counter()
+
+        for _ in range(proxies):
+            self._add_phone()
+            self._add_token()
+
+    # Building
+
+    def _new_id(self) -> str:
+        self._next_id += 1
+        return str(self._next_id)
+
+    def _username(self) -> str:
+        return f"user{self.rng.randrange(self.users)}"
+
+    def _add_phone(self):
+        phone_id = f"phone{self._new_id()}"
+        expires = self.now + timedelta(days=self.rng.randint(1, 60))
+        self.iproxy_phones[phone_id] = {
+            'id': phone_id,
+            'name': f"Phone {phone_id} - {expires.strftime('%d/%m/%Y')}",
+            'description': f"@{self._username()}",
+            'planDetails': {'message': f"Pro active till {(self.now + timedelta(days=365)).strftime('%d.%m.%Y')}"},
+            'deviceModel': self.rng.choice(['Pixel 6', 'Galaxy A52', 'Redmi Note 10']),
+            'active': True,
+        }
+        self.iproxy_connections[phone_id] = [self._iproxy_connection(phone_id) for _ in range(self.connections_per_proxy)]
+
+    def _iproxy_connection(self, phone_id: str) -> dict:
+        created = _millis(self.now - timedelta(days=self.rng.randint(0, 90)))
+        return {
+            'id': f"conn{self._new_id()}",
+            'userId': 'owner',
+            'createdTimestamp': created,
+            'updatedTimestamp': created,
+            'name': f"proxy-{phone_id}",
+            'description': f"@{self._username()}",
+            'ip': f"10.{self.rng.randrange(256)}.{self.rng.randrange(256)}.{self.rng.randrange(1, 255)}",
+            'port': self.rng.randint(10000, 60000),
+            'login': _secret(self.rng, 8),
+            'password': _secret(self.rng),
+            'type': self.rng.choice(['http', 'socks5']),
+            'connectionId': phone_id,
+            'active': True,
+        }
+
+    def _add_token(self):
+        token = _secret(self.rng, 32)
+        self.localtonet_tunnels[token] = [self._tunnel(token) for _ in range(self.connections_per_proxy)]
+
+    def _tunnel(self, token: str) -> dict:
+        tunnel_id = self._new_id()
+        username = self._username()
+        self.expirations[tunnel_id] = self.now + timedelta(days=self.rng.randint(1, 60))
+        return {
+            'id': int(tunnel_id),
+            'authToken': token,
+            'authTokenName': f"device-{token[:6]}",
+            'authenticationUsername': username,
+            'authenticationPassword': _secret(self.rng),
+            'externalUserId': f"tg---{username}",
+            'serverIp': f"172.16.{self.rng.randrange(256)}.{self.rng.randrange(1, 255)}",
+            'serverPort': self.rng.randint(10000, 60000),
+            'protocolType': 'ProxyServer',
+            'guidId': _secret(self.rng, 16),
+            'status': 1,
+        }
+
+    # Churn
+
+    def churn(self, rate: float):
+        """Changes about `rate` of the connections: mostly edits, plus some removals and additions."""
+        stamp = _millis(datetime.now())
+        for phone_id, connections in self.iproxy_connections.items():
+            for connection in list(connections):
+                if self.rng.random() >= rate:
+                    continue
+                roll = self.rng.random()
+                if roll < 0.7:
+                    connection['password'] = _secret(self.rng)
+                    connection['updatedTimestamp'] = stamp
+                elif roll < 0.85:
+                    connection['description'] = f"@{self._username()}"
+                    connection['updatedTimestamp'] = stamp
+                else:
+                    connections.remove(connection)
+                    replacement = self._iproxy_connection(phone_id)
+                    replacement['updatedTimestamp'] = stamp
+                    connections.append(replacement)
+
+        for token, tunnels in self.localtonet_tunnels.items():
+            for tunnel in list(tunnels):
+                if self.rng.random() >= rate:
+                    continue
+                if self.rng.random() < 0.8:
+                    tunnel['authenticationPassword'] = _secret(self.rng)
+                else:
+                    tunnels.remove(tunnel)
+                    tunnels.append(self._tunnel(token))
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(c) for c in self.iproxy_connections.values())
+
+
+class FakeProviderServer:
+    """aiohttp app serving a FakeFleet with injected latency, errors and throttling."""
+
+    def __init__(self, fleet: FakeFleet, latency_ms: float = 0.0, latency_jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0, churn_rate: float = 0.0,
+                 churn_interval: float = 0.0):
+        self.fleet = fleet
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.churn_rate = churn_rate
+        self.churn_interval = churn_interval
+        self.requests = Counter()
+        self.rng = random.Random()
+        self._churn_task: Optional[asyncio.Task] = None
+
+    # Middleware
+
+    @web.middleware
+    async def _chaos(self, request: web.Request, handler):
+        if request.path.startswith('/_fake'):
+            return await handler(request)
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+        self.requests[route] += 1
+        self.requests['total'] += 1
+
+        if self.latency_ms or self.latency_jitter_ms:
+            delay = self.latency_ms + self.rng.uniform(-self.latency_jitter_ms, self.latency_jitter_ms)
+            await asyncio.sleep(max(0.0, delay) / 1000)
+        if self.throttle_rate and self.rng.random() < self.throttle_rate:
+            self.requests['throttled'] += 1
+            return web.json_response({'error': 'Too many requests'}, status=429, headers={'Retry-After': '1'})
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.requests['errors'] += 1
+            return web.json_response({'error': 'Injected failure'}, status=503)
+        return await handler(request)
+
+    # iProxy
+
+    async def iproxy_connections(self, request):
+        return web.json_response({'result': list(self.fleet.iproxy_phones.values())})
+
+    async def iproxy_connection(self, request):
+        phone = self.fleet.iproxy_phones.get(request.match_info['connection_id'])
+        if phone is None:
+            return web.json_response({'error': 'Not found'}, status=404)
+        return web.json_response({'result': phone})
+
+    async def iproxy_proxies(self, request):
+        connection_id = request.match_info['connection_id']
+        if connection_id not in self.fleet.iproxy_phones:
+            return web.json_response({'error': 'Not found'}, status=404)
+        return web.json_response({'result': self.fleet.iproxy_connections.get(connection_id, [])})
+
+    async def iproxy_restart(self, request):
+        self.fleet.restarts[request.match_info['phone_id']] += 1
+        return web.json_response({'ok': True})
+
+    # Localtonet
+
+    @staticmethod
+    def _ltn(result=None, errors=None):
+        return web.json_response({'hasError': bool(errors), 'errors': errors or [], 'result': result})
+
+    async def get_tunnels(self, request):
+        return self._ltn([tunnel for tunnels in self.fleet.localtonet_tunnels.values() for tunnel in tunnels])
+
+    async def get_tunnels_by_auth_token(self, request):
+        tunnels = self.fleet.localtonet_tunnels.get(request.match_info['token'])
+        if tunnels is None:
+            return self._ltn(errors=['AuthToken not found.'])
+        return self._ltn(tunnels)
+
+    async def get_expiration_date(self, request):
+        expiration = self.fleet.expirations.get(request.match_info['tunnel_id'])
+        if expiration is None:
+            return self._ltn(errors=['Tunnel not found.'])
+        # Seven fractional digits, like the real API
+        return self._ltn({'expirationDate': expiration.strftime('%Y-%m-%d %H:%M:%S.%f') + '0'})
+
+    async def set_expiration_date(self, request):
+        payload = await request.json()
+        tunnel_id = str(payload.get('tunnelId'))
+        if tunnel_id not in self.fleet.expirations:
+            return self._ltn(errors=['Tunnel not found.'])
+        self.fleet.expirations[tunnel_id] = datetime.fromisoformat(payload['expirationDate'])
+        return self._ltn({})
+
+    # Control
+
+    async def stats(self, request):
+        return web.json_response({'requests': dict(self.requests), 'connections': self.fleet.connection_count})
+
+    async def churn(self, request):
+        rate = float(request.query.get('rate', self.churn_rate or 0.05))
+        self.fleet.churn(rate)
+        return web.json_response({'churned': rate})
+
+    async def _churn_loop(self):
+        while True:
+            await asyncio.sleep(self.churn_interval)
+            self.fleet.churn(self.churn_rate)
+
+    async def _on_startup(self, app):
+        if self.churn_rate and self.churn_interval:
+            self._churn_task = asyncio.create_task(self._churn_loop())
+
+    async def _on_cleanup(self, app):
+        if self._churn_task is not None:
+            self._churn_task.cancel()
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._chaos])
+        app.add_routes([
+            web.get(f'{IPROXY_PREFIX}/connections', self.iproxy_connections),
+            web.get(f'{IPROXY_PREFIX}/connections/{{connection_id}}', self.iproxy_connection),
+            web.get(f'{IPROXY_PREFIX}/connections/{{connection_id}}/proxies', self.iproxy_proxies),
+            web.get(f'{IPROXY_PUSH_PREFIX}/phone/{{phone_id}}/action_push/refresh1', self.iproxy_restart),
+            web.get(f'{LOCALTONET_PREFIX}/GetTunnels', self.get_tunnels),
+            web.get(f'{LOCALTONET_PREFIX}/GetTunnelsByAuthToken/{{token}}', self.get_tunnels_by_auth_token),
+            web.get(f'{LOCALTONET_PREFIX}/GetExpirationDateByTunnelId/{{tunnel_id}}', self.get_expiration_date),
+            web.post(f'{LOCALTONET_PREFIX}/SetExpirationDateForTunnel', self.set_expiration_date),
+            web.get('/_fake/stats', self.stats),
+            web.post('/_fake/churn', self.churn),
+        ])
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> web.AppRunner:
+        """Starts the server in the running loop (for benchmarks); returns the runner, see base_url()."""
+        runner = web.AppRunner(self.create_app())
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        self._address = runner.addresses[0]
+        return runner
+
+    def base_url(self) -> str:
+        host, port = self._address[:2]
+        return f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake iProxy/Localtonet provider API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--proxies', type=int, default=100, help="phones / Localtonet auth tokens")
+    parser.add_argument('--connections-per-proxy', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.0, help="mean response latency, ms")
+    parser.add_argument('--latency-jitter', type=float, default=0.0, help="+/- latency spread, ms")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument('--churn', type=float, default=0.0, help="fraction of connections changed per churn tick")
+    parser.add_argument('--churn-interval', type=float, default=60.0, help="seconds between churn ticks")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    fleet = FakeFleet(args.proxies, args.connections_per_proxy, seed=args.seed)
+    server = FakeProviderServer(
+        fleet,
+        latency_ms=args.latency,
+        latency_jitter_ms=args.latency_jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        churn_rate=args.churn,
+        churn_interval=args.churn_interval,
+    )
+    logger.info(f"Serving {len(fleet.iproxy_phones)} phones / {fleet.connection_count} connections")
+    web.run_app(server.create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import logging
+import sys
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram import types
+
+
+class DBSessionMiddleware(BaseMiddleware):
+    """Opens one database unit of work per update.
+
+    Handlers and the other middlewares get the same session (and the same pooled connection)
+    through AsyncDatabaseService.get_repository, so an update costs at most a single checkout,
+    taken on its first query; updates that never query the database don't check one out.
+    """
+
+    def __init__(self, async_database, database=None):
+        self.async_database = async_database
+        self.database = database
+        super().__init__()
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        data['db_scope'] = await self.async_database.open_scope()
+
+    async def on_post_process_update(self, update: types.Update, results, data: dict):
+        scope = data.pop('db_scope', None)
+        if scope is None:
+            return
+
+        # Drop the sync session registered for this update while its scope id is still set
+        if self.database is not None and hasattr(self.database.Session, 'remove'):
+            self.database.Session.remove()
+
+        # Called from a finally block, so an in-flight handler exception is still visible here
+        failed = sys.exc_info()[0] is not None
+        if failed:
+            logging.warning(f"Rolling back database scope of update {update.update_id}")
+        await self.async_database.close_scope(scope, failed=failed)
@@ -1,40 +1,40 @@
 import logging
 from aiogram.dispatcher.middlewares import BaseMiddleware
-from aiogram import types, Bot, Dispatcher
+from aiogram import types, Dispatcher
 from src.bot.config import ADMIN_CHAT_ID
-from src.bot.bot_setup import database
-from src.db.repositories.user_repositories import UserRepository
-from datetime import datetime
+from src.bot.bot_setup import async_database, user_touch_buffer, outbound, message_mappings
 import pytz
 
-# Dictionary to map forwarded admin messages to original user messages
-forwarded_message_mapping = {}
-
 class ForwardToAdminMiddleware(BaseMiddleware):
     def __init__(self):
         super(ForwardToAdminMiddleware, self).__init__()
 
+    async def close(self):
+        """Flushes buffered user touches; called from on_shutdown."""
+        await user_touch_buffer.stop()
+
     async def on_post_process_message(self, message: types.Message, results, data: dict):
         await self.update_user_and_forward(message)
 
     async def update_user_and_forward(self, message: types.Message):
         if message.from_user and message.chat.id != ADMIN_CHAT_ID:
-            session = database.Session()
             try:
-                user_repository = UserRepository(session)
-                user = user_repository.get_or_create_user(message)
-                if user:
-                    user['last_message_at'] = datetime.now(pytz.utc)
-                    session.commit()
+                # Shares the update's session opened by DBSessionMiddleware
+                async with async_database.get_user_repository() as user_repository:
+                    await user_repository.get_or_create_user(message)
+                # The timestamp bump is written in bulk by the write-behind buffer
+                user_touch_buffer.touch(message.from_user.id, message.chat.id, message.date.astimezone(pytz.utc))
                 await self.forward_message_to_admin(message)
             except Exception as e:
-                session.rollback()
                 logging.error(f"Error updating user and forwarding message: {e}")
-            finally:
-                session.close()
+
+    @staticmethod
+    def _track_forwarded(sent, message: types.Message):
+        if not sent.cancelled() and sent.exception() is None:
+            message_mappings.remember(sent.result().message_id, message.chat.id, message.message_id)
 
     async def forward_message_to_admin(self, message: types.Message):
-        bot = Bot.get_current()
+        # Queued rather than awaited so a busy admin chat doesn't hold up the update
         try:
             # Skip forwarding for messages from admin chat
             if message.chat.id == ADMIN_CHAT_ID:
@@ -52,36 +52,35 @@ class ForwardToAdminMiddleware(BaseMiddleware):
             forwarded_message = None
 
             if message.text:
-                forwarded_message = await bot.send_message(chat_id=ADMIN_CHAT_ID, text=f"{header_text}\n{message.text}")
+                forwarded_message = outbound.post('send_message', ADMIN_CHAT_ID, text=f"{header_text}\n{message.text}")
             elif message.photo:
                 photo = message.photo[-1]
-                forwarded_message = await bot.send_photo(chat_id=ADMIN_CHAT_ID, photo=photo.file_id, caption=header_text)
+                forwarded_message = outbound.post('send_photo', ADMIN_CHAT_ID, photo=photo.file_id, caption=header_text)
             elif message.document:
-                forwarded_message = await bot.send_document(chat_id=ADMIN_CHAT_ID, document=message.document.file_id, caption=header_text)
+                forwarded_message = outbound.post('send_document', ADMIN_CHAT_ID, document=message.document.file_id, caption=header_text)
             elif message.sticker:
-                forwarded_message = await bot.send_sticker(chat_id=ADMIN_CHAT_ID, sticker=message.sticker.file_id)
-                await bot.send_message(chat_id=ADMIN_CHAT_ID, text=header_text)
+                forwarded_message = outbound.post('send_sticker', ADMIN_CHAT_ID, sticker=message.sticker.file_id)
+                outbound.post('send_message', ADMIN_CHAT_ID, text=header_text)
             elif message.audio:
-                forwarded_message = await bot.send_audio(chat_id=ADMIN_CHAT_ID, audio=message.audio.file_id, caption=header_text)
+                forwarded_message = outbound.post('send_audio', ADMIN_CHAT_ID, audio=message.audio.file_id, caption=header_text)
             elif message.video:
-                forwarded_message = await bot.send_video(chat_id=ADMIN_CHAT_ID, video=message.video.file_id, caption=header_text)
+                forwarded_message = outbound.post('send_video', ADMIN_CHAT_ID, video=message.video.file_id, caption=header_text)
             elif message.voice:
-                forwarded_message = await bot.send_voice(chat_id=ADMIN_CHAT_ID, voice=message.voice.file_id, caption=header_text)
+                forwarded_message = outbound.post('send_voice', ADMIN_CHAT_ID, voice=message.voice.file_id, caption=header_text)
             elif message.contact:
-                forwarded_message = await bot.send_contact(chat_id=ADMIN_CHAT_ID, phone_number=message.contact.phone_number, first_name=message.contact.first_name, last_name=message.contact.last_name)
-                await bot.send_message(chat_id=ADMIN_CHAT_ID, text=header_text)
+                forwarded_message = outbound.post('send_contact', ADMIN_CHAT_ID, phone_number=message.contact.phone_number, first_name=message.contact.first_name, last_name=message.contact.last_name)
+                outbound.post('send_message', ADMIN_CHAT_ID, text=header_text)
             elif message.location:
-                forwarded_message = await bot.send_location(chat_id=ADMIN_CHAT_ID, latitude=message.location.latitude, longitude=message.location.longitude)
-                await bot.send_message(chat_id=ADMIN_CHAT_ID, text=header_text)
+                forwarded_message = outbound.post('send_location', ADMIN_CHAT_ID, latitude=message.location.latitude, longitude=message.location.longitude)
+                outbound.post('send_message', ADMIN_CHAT_ID, text=header_text)
             elif message.venue:
-                forwarded_message = await bot.send_venue(chat_id=ADMIN_CHAT_ID, latitude=message.venue.location.latitude, longitude=message.venue.location.longitude, title=message.venue.title, address=message.venue.address)
-                await bot.send_message(chat_id=ADMIN_CHAT_ID, text=header_text)
+                forwarded_message = outbound.post('send_venue', ADMIN_CHAT_ID, latitude=message.venue.location.latitude, longitude=message.venue.location.longitude, title=message.venue.title, address=message.venue.address)
+                outbound.post('send_message', ADMIN_CHAT_ID, text=header_text)
             else:
-                forwarded_message = await bot.send_message(chat_id=ADMIN_CHAT_ID, text=f"{header_text}\nUnsupported content type.")
+                forwarded_message = outbound.post('send_message', ADMIN_CHAT_ID, text=f"{header_text}\nUnsupported content type.")
 
-            # Track the forwarded message
-            if forwarded_message:
-                forwarded_message_mapping[forwarded_message.message_id] = message
+            # Track the forwarded message once it's delivered
+            forwarded_message.add_done_callback(lambda sent: self._track_forwarded(sent, message))
 
         except Exception as e:
             logging.exception(f"Error in ForwardToAdminMiddleware: {e}")
\ No newline at end of file
@@ -0,0 +1,70 @@
+import time
+
+from aiogram import types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from src.bot.router import resolved_handler
+from src.utils.metrics import UPDATES, UPDATE_SECONDS, HANDLER_SECONDS
+
+UPDATE_TYPES = (
+    'message', 'edited_message', 'channel_post', 'edited_channel_post', 'inline_query',
+    'chosen_inline_result', 'callback_query', 'shipping_query', 'pre_checkout_query', 'poll',
+    'poll_answer', 'my_chat_member', 'chat_member', 'chat_join_request',
+)
+
+
+def update_type(update: types.Update) -> str:
+    return next((name for name in UPDATE_TYPES if getattr(update, name, None) is not None), 'unknown')
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Records update counts and latencies by update type, and handler latencies, for /metrics.
+
+    aiogram runs pre- and post-process hooks alike in setup order, so the update clock is started
+    here and stopped by `finisher()`: set this middleware up first and the finisher last, and the
+    update latency covers every other middleware on both sides of the handler.
+    """
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        data['metrics_update'] = (update_type(update), time.perf_counter())
+
+    def finisher(self) -> 'UpdateMetricsFinisher':
+        return UpdateMetricsFinisher()
+
+    # current_handler is only set around the handler call, so pick it up in the process hooks;
+    # message and callback hooks share their data dict between process and post-process
+
+    @staticmethod
+    def _start_handler(data: dict):
+        handler = resolved_handler(data)
+        if handler is not None:
+            data['metrics_handler'] = (getattr(handler, '__qualname__', repr(handler)), time.perf_counter())
+
+    @staticmethod
+    def _finish_handler(data: dict):
+        handler = data.pop('metrics_handler', None)
+        if handler is not None:
+            name, started = handler
+            HANDLER_SECONDS.observe(time.perf_counter() - started, handler=name)
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        self._start_handler(data)
+
+    async def on_post_process_message(self, message: types.Message, results, data: dict):
+        self._finish_handler(data)
+
+    async def on_process_callback_query(self, callback_query: types.CallbackQuery, data: dict):
+        self._start_handler(data)
+
+    async def on_post_process_callback_query(self, callback_query: types.CallbackQuery, results, data: dict):
+        self._finish_handler(data)
+
+
+class UpdateMetricsFinisher(BaseMiddleware):
+    """Post-process half of MetricsMiddleware's update timing; set up after every other middleware."""
+
+    async def on_post_process_update(self, update: types.Update, results, data: dict):
+        kind, started = data.pop('metrics_update', (update_type(update), None))
+        UPDATES.inc(update_type=kind)
+        if started is not None:
+            UPDATE_SECONDS.observe(time.perf_counter() - started, update_type=kind)
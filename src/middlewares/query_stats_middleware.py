@@ -0,0 +1,37 @@
+from aiogram import types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from src.bot.router import resolved_handler
+from src.db.instrumentation import start_tracking, finish_tracking, current_stats
+
+
+class QueryStatsMiddleware(BaseMiddleware):
+    """Counts the SQL statements of every update and attributes them to the handler that ran.
+
+    Statements are collected by the engine listeners of src.db.instrumentation; repeated
+    statement shapes are reported as possible N+1 queries when the update is done.
+    """
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        data['query_stats'] = start_tracking()
+
+    @staticmethod
+    def _set_handler(data: dict):
+        # Message/callback hooks get their own data dict, the stats travel in a contextvar
+        handler = resolved_handler(data)
+        stats = current_stats()
+        if handler is not None and stats is not None:
+            stats.handler = getattr(handler, '__qualname__', repr(handler))
+
+    # current_handler is only set around the handler call, so record it from the process hooks
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        self._set_handler(data)
+
+    async def on_process_callback_query(self, callback_query: types.CallbackQuery, data: dict):
+        self._set_handler(data)
+
+    async def on_post_process_update(self, update: types.Update, results, data: dict):
+        stats = data.pop('query_stats', None)
+        if stats is not None:
+            finish_tracking(stats, update.update_id)
@@ -0,0 +1,242 @@
+import asyncio
+import itertools
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from aiogram.utils.exceptions import BotBlocked, ChatNotFound, UserDeactivated, CantInitiateConversation, MessageNotModified
+from sqlalchemy import select
+
+from src.bot.config import ADMIN_CHAT_ID, BROADCAST_BATCH_SIZE, BROADCAST_PROGRESS_INTERVAL
+from src.db.models.db_models import User, DBProxy, DBProxyConnection, current_datetime_utc
+from src.db.session_scope import detach_scope
+from src.utils.outbound import PRIORITY_BULK
+
+logger = logging.getLogger(__name__)
+
+# The recipient can't be reached any more; they are marked inactive
+UNREACHABLE_ERRORS = (BotBlocked, ChatNotFound, UserDeactivated, CantInitiateConversation)
+
+# Provider names admins type -> DBProxy.service_name
+PROVIDERS = {'iproxy': 'ipr', 'localtonet': 'ltn'}
+
+SEGMENT_USAGE = (
+    "Segments:\n"
+    "all - all active users\n"
+    "expiring <days> - users with a connection expiring within <days> days\n"
+    "provider <service> - users with a connection of a provider (iproxy, localtonet)"
+)
+
+
+class BroadcastSegment:
+    """A set of active users to broadcast to, expressed as extra criteria on Users."""
+
+    def __init__(self, kind: str, days: Optional[int] = None, service_name: Optional[str] = None):
+        self.kind = kind
+        self.days = days
+        self.service_name = service_name
+
+    @classmethod
+    def parse(cls, args: str) -> 'BroadcastSegment':
+        """Parses `all`, `expiring <days>` or `provider <service>`; raises ValueError otherwise."""
+        parts = args.split()
+        if parts == ['all']:
+            return cls('all')
+        if len(parts) == 2 and parts[0] == 'expiring' and parts[1].isdigit():
+            return cls('expiring', days=int(parts[1]))
+        if len(parts) == 2 and parts[0] == 'provider':
+            provider = parts[1].lower()
+            # The stored codes are accepted as well
+            service_name = PROVIDERS.get(provider, provider)
+            if service_name in PROVIDERS.values():
+                return cls('provider', service_name=service_name)
+        raise ValueError(SEGMENT_USAGE)
+
+    def criteria(self) -> list:
+        connections = select(DBProxyConnection.id).where(
+            DBProxyConnection.user_id == User.id, DBProxyConnection.deleted.is_(False)
+        )
+        if self.kind == 'expiring':
+            now = current_datetime_utc()
+            return [connections.where(
+                DBProxyConnection.expiration_date >= now,
+                DBProxyConnection.expiration_date < now + timedelta(days=self.days),
+            ).exists()]
+        if self.kind == 'provider':
+            return [connections.join(DBProxy, DBProxy.id == DBProxyConnection.proxy_id)
+                    .where(DBProxy.service_name == self.service_name).exists()]
+        return []
+
+    def __str__(self):
+        if self.kind == 'expiring':
+            return f"users with connections expiring within {self.days} days"
+        if self.kind == 'provider':
+            provider = next((name for name, code in PROVIDERS.items() if code == self.service_name), self.service_name)
+            return f"{provider} users"
+        return "all active users"
+
+
+class Broadcast:
+    """Copies one admin message to every user of a segment.
+
+    Recipients are read in keyset-paginated batches of `batch_size`; each batch is queued on
+    the outbound dispatcher at bulk priority, so delivery runs as fast as Telegram's limits
+    allow without delaying payment notifications. Unreachable users are marked inactive once
+    per batch, and the admin's status message is edited with the progress.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, async_database, outbound, segment: BroadcastSegment, from_chat_id: int, message_id: int,
+                 batch_size: int = BROADCAST_BATCH_SIZE):
+        self.id = next(self._ids)
+        self.async_database = async_database
+        self.outbound = outbound
+        self.segment = segment
+        self.from_chat_id = from_chat_id
+        self.message_id = message_id
+        self.batch_size = batch_size
+        self.total = 0
+        self.delivered = 0
+        self.failed = 0
+        self.blocked = 0
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+        # pending, running, finished, failed or cancelled; set by _run itself, which reports
+        # its final state while its task is still running
+        self.state = 'pending'
+        self.status_message_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_progress = 0.0
+
+    @property
+    def processed(self) -> int:
+        return self.delivered + self.failed + self.blocked
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def cancel(self) -> bool:
+        if not self.running:
+            return False
+        self._task.cancel()
+        return True
+
+    def summary(self) -> str:
+        state = f"failed: {self.error}" if self.state == 'failed' else self.state
+        lines = [
+            f"Broadcast #{self.id} to {self.segment} ({state})",
+            f"Progress: {self.processed}/{self.total}",
+            f"Delivered: {self.delivered}, failed: {self.failed}, blocked: {self.blocked}",
+        ]
+        if self.started_at:
+            end = self.finished_at or datetime.now()
+            lines.append(f"Elapsed: {(end - self.started_at).total_seconds():.0f}s")
+        return "\n".join(lines)
+
+    async def _run(self):
+        detach_scope()
+        self.started_at = datetime.now()
+        self.state = 'running'
+        try:
+            async with self.async_database.get_user_repository() as user_repo:
+                self.total = await user_repo.count_recipients(self.segment.criteria())
+            status = await self.outbound.send_message(ADMIN_CHAT_ID, self.summary())
+            self.status_message_id = status.message_id
+
+            after_id = 0
+            while True:
+                # A short session per batch, so no connection is held while messages go out
+                async with self.async_database.get_user_repository() as user_repo:
+                    batch = await user_repo.get_recipients_batch(self.segment.criteria(), after_id, self.batch_size)
+                if not batch:
+                    break
+                after_id = batch[-1].id
+                await self._send_batch(batch)
+                await self._report_progress()
+        except asyncio.CancelledError:
+            self.state = 'cancelled'
+            self.finished_at = datetime.now()
+            await self._report_progress(force=True)
+            raise
+        except Exception as e:
+            logger.exception(f"Broadcast #{self.id} failed: {e}")
+            self.error = str(e)
+            self.state = 'failed'
+        else:
+            self.state = 'finished'
+        self.finished_at = datetime.now()
+        await self._report_progress(force=True)
+
+    async def _send_batch(self, batch: list):
+        results = await asyncio.gather(*(self._send_one(recipient) for recipient in batch))
+        unreachable = [recipient for recipient, ok in zip(batch, results) if ok is None]
+        if unreachable:
+            async with self.async_database.get_user_repository() as user_repo:
+                await user_repo.deactivate_users(unreachable)
+
+    async def _send_one(self, recipient) -> Optional[bool]:
+        """True if delivered, False if it failed, None if the user is unreachable."""
+        try:
+            await self.outbound.send('copy_message', recipient.telegram_chat_id, PRIORITY_BULK,
+                                     from_chat_id=self.from_chat_id, message_id=self.message_id)
+        except UNREACHABLE_ERRORS:
+            self.blocked += 1
+            return None
+        except Exception as e:
+            logger.warning(f"Broadcast #{self.id} to chat {recipient.telegram_chat_id} failed: {e}")
+            self.failed += 1
+            return False
+        self.delivered += 1
+        return True
+
+    async def _report_progress(self, force: bool = False):
+        if self.status_message_id is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_progress < BROADCAST_PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        try:
+            await self.outbound.send('edit_message_text', ADMIN_CHAT_ID, text=self.summary(),
+                                     message_id=self.status_message_id)
+        except MessageNotModified:
+            pass
+        except Exception as e:
+            logger.error(f"Failed to update broadcast #{self.id} progress: {e}")
+
+
+class BroadcastManager:
+    def __init__(self):
+        self._broadcasts: Dict[int, Broadcast] = {}
+
+    def start(self, async_database, outbound, segment: BroadcastSegment, from_chat_id: int, message_id: int) -> Broadcast:
+        broadcast = Broadcast(async_database, outbound, segment, from_chat_id, message_id)
+        self._broadcasts[broadcast.id] = broadcast
+        broadcast.start()
+        return broadcast
+
+    def get(self, broadcast_id: int) -> Optional[Broadcast]:
+        return self._broadcasts.get(broadcast_id)
+
+    @property
+    def running(self) -> List[Broadcast]:
+        return [broadcast for broadcast in self._broadcasts.values() if broadcast.running]
+
+    def latest(self, count: int = 5) -> List[Broadcast]:
+        return sorted(self._broadcasts.values(), key=lambda broadcast: broadcast.id)[-count:]
+
+    async def stop(self):
+        tasks = [broadcast._task for broadcast in self.running]
+        for broadcast in self.running:
+            broadcast.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+broadcasts = BroadcastManager()
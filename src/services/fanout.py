@@ -0,0 +1,31 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+async def fan_out(items: Iterable[T], fetch: Callable[[T], Awaitable[R]],
+                  limit: int) -> AsyncIterator[Tuple[T, Optional[R], Optional[Exception]]]:
+    """Runs fetch(item) for every item with at most `limit` calls in flight.
+
+    Yields (item, result, error) in completion order, so the caller can consume results
+    while the slower fetches are still running. A failed fetch yields its exception
+    instead of aborting the others.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(item):
+        async with semaphore:
+            try:
+                return item, await fetch(item), None
+            except Exception as e:
+                return item, None, e
+
+    tasks = [asyncio.ensure_future(run(item)) for item in items]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -1,14 +1,17 @@
-import requests
+import logging
 import sys
 import os
 from dotenv import load_dotenv
 from datetime import datetime
-from typing import List
+from typing import Dict, Iterable, List, Optional
 import json
 from peewee import IntegrityError
-from time import time
+import time
 
 from .proxyServiceInterface import ProxyServiceInterface
+from .fanout import fan_out
+from .providerHttpClient import get_provider_client, ProviderHttpError
+from ..bot.config import LOCALTONET_BASE_URL, LOCALTONET_MAX_CONCURRENCY, LOCALTONET_EXPIRATION_TTL
 from ..bot.models.proxy_models import Proxy, ProxyConnection
 from src.db.models.db_models import DBProxy, DBProxyConnection, User, UserType
 from src.db.db_utils import *
@@ -19,204 +22,224 @@ load_dotenv(dotenv_path)
 # Now you can access the environment variables
 LOCALTONET_API_KEY = os.environ.get("LOCALTONET_API_KEY")
 
+class TunnelExpirationCache:
+    """Per-tunnel memo of expiration dates with a TTL.
+
+    Expiration dates only change when we set them, so entries are refreshed by
+    setExpirationDateForConnection and otherwise expire after `ttl` seconds.
+    """
+
+    def __init__(self, ttl: int = LOCALTONET_EXPIRATION_TTL):
+        self.ttl = ttl
+        self._entries: Dict[str, tuple] = {}
+
+    def get(self, tunnel_id, allow_stale: bool = False):
+        """Returns (found, expiration_date); allow_stale also returns entries past their TTL."""
+        entry = self._entries.get(str(tunnel_id))
+        if entry is None:
+            return False, None
+        expiration_date, expires_at = entry
+        if expires_at < time.monotonic() and not allow_stale:
+            return False, None
+        return True, expiration_date
+
+    def put(self, tunnel_id, expiration_date: Optional[datetime]):
+        self._entries[str(tunnel_id)] = (expiration_date, time.monotonic() + self.ttl)
+
+    def invalidate(self, tunnel_id):
+        self._entries.pop(str(tunnel_id), None)
+
+    def clear(self):
+        self._entries.clear()
+
+
 class LocaltonetManager(ProxyServiceInterface):
     def __init__(self, api_key):
         self.api_key = api_key
-        self.base_url = "https://localtonet.com/api"
+        self.base_url = LOCALTONET_BASE_URL
         self.service_name = "ltn"
+        self.max_concurrency = LOCALTONET_MAX_CONCURRENCY
+        self.expiration_cache = TunnelExpirationCache()
+        self.http = get_provider_client("localtonet", self.base_url, {
+            'Accept': 'application/json',
+            'Authorization': f'Bearer {self.api_key}'
+        })
 
-    async def getAllProxies(self) -> List[DBProxy]:
-        headers = {'Authorization': f'Bearer {self.api_key}'}
-        response = requests.get(f"{self.base_url}/GetTunnels", headers=headers)
-        if response.status_code == 200:
-            data = response.json()
-            if not data.get("hasError"):
-                tunnels = data.get("result", [])
-                connections = []
-                now = datetime.now()
-                for tunnel in tunnels:
-                    expiration_date = self.getConnectionExpirationDate(tunnel['id'])
-                    if expiration_date:
-                        days_left = (expiration_date - now).days
-                        hours_left = (expiration_date - now).seconds // 3600
-                    else:
-                        days_left = 0
-                        hours_left = 0
-                    name = tunnel.get('authenticationUsername') or 'N/A'
-                    external_user_id = tunnel.get('externalUserId', 'N/A') or 'N/A'
-                    user = external_user_id.split('---')[1] if '---' in external_user_id else 'N/A'
-                    connection = DBProxy(
-                        #id=tunnel['id'],
-                        id=tunnel.get('id', ''),
-                        name=name,
-                        description=name,
-                        authToken=tunnel.get('authToken', ''),
-                        proxies=[],  # Fetch and add actual proxies if needed
-                        user=user,
-                        expiration_date=expiration_date,
-                        days_left=days_left,
-                        hours_left=hours_left,
-                        tariff_plan="Unlimited",
-                        tariff_expiration_date=datetime(3000,1,1),
-                        tariff_days_left=None,
-                        deviceModel=tunnel['authTokenName'],
-                        active = True if tunnel.get('status') == 1 else False,
-                        service_name='ltn'
-                    )
-                    connections.append(connection)
-                # Sort connections by days left, if needed
-                #connections.sort(key=lambda x: x.days_left, reverse=True)
-                return connections
+    async def getAllProxies(self) -> List[Proxy]:
+        status, data = await self.http.get("GetTunnels")
+        if status != 200:
+            raise RuntimeError(f"Failed to fetch tunnels: {status}")
+        if data.get("hasError"):
+            raise RuntimeError(f"Error: {data.get('errors')}")
+
+        tunnels = data.get("result", [])
+        expiration_dates = await self.resolveExpirationDates(tunnel['id'] for tunnel in tunnels)
+        connections = []
+        now = datetime.now()
+        for tunnel in tunnels:
+            expiration_date = expiration_dates.get(str(tunnel['id']))
+            if expiration_date:
+                days_left = (expiration_date - now).days
+                hours_left = (expiration_date - now).seconds // 3600
             else:
-                return f"Error: {data.get('errors')}"
-        else:
-            return f"Failed to fetch tunnels: {response.status_code}"
-        
+                days_left = 0
+                hours_left = 0
+            name = tunnel.get('authenticationUsername') or 'N/A'
+            connection = Proxy(
+                id=tunnel.get('id', ''),
+                name=name,
+                description=name,
+                authToken=tunnel.get('authToken', ''),
+                proxies=[],  # Fetch and add actual proxies if needed
+                user=self._extract_user(tunnel),
+                expiration_date=expiration_date,
+                days_left=days_left,
+                hours_left=hours_left,
+                tariff_plan="Unlimited",
+                tariff_expiration_date=datetime(3000,1,1),
+                tariff_days_left=None,
+                deviceModel=tunnel['authTokenName'],
+                active = True if tunnel.get('status') == 1 else False,
+                service_name='ltn'
+            )
+            connections.append(connection)
+        # Sort connections by days left, if needed
+        #connections.sort(key=lambda x: x.days_left, reverse=True)
+        return connections
+
+    @staticmethod
+    def _extract_user(tunnel) -> str:
+        external_user_id = tunnel.get('externalUserId', 'N/A') or 'N/A'
+        return external_user_id.split('---')[1] if '---' in external_user_id else 'N/A'
+
     async def getTunnelsByAuthToken(self, authtoken):
         """
         Retrieves the list of tunnels associated with a specific authToken from LocalToneT.
         :param authtoken: The authToken to retrieve tunnels for.
         :return: The list of tunnels or an error message.
         """
-        url = f"{self.base_url}/GetTunnelsByAuthToken/{authtoken}"
-        headers = {
-            'Accept': 'application/json',
-            'Authorization': f'Bearer {self.api_key}'
-        }
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            data = response.json()
+        status, data = await self.http.get(f"GetTunnelsByAuthToken/{authtoken}")
+        if status == 200:
             if not data.get("hasError"):
                 return data.get("result", [])
             else:
                 return f"Error: {data.get('errors')}"
         else:
-            return f"Failed to fetch tunnels by authToken: {response.status_code}"      
-         
-    def getConnectionExpirationDate(self, tunnel_id):
+            return f"Failed to fetch tunnels by authToken: {status}"
+
+    async def getConnectionExpirationDate(self, tunnel_id) -> Optional[datetime]:
         """
-        Retrieves the expiration date of a tunnel from LocalToneT by its ID.
+        Retrieves the expiration date of a tunnel from LocalToneT by its ID, using the memo when possible.
         :param tunnel_id: The ID of the tunnel to retrieve the expiration date for.
-        :return: The expiration date of the tunnel as a string without fractional seconds, or an error message.
+        :return: The expiration date of the tunnel, or None if it is unknown or could not be fetched.
         """
-        url = f"{self.base_url}/GetExpirationDateByTunnelId/{tunnel_id}"
-        headers = {
-            'Accept': 'application/json',
-            'Authorization': f'Bearer {self.api_key}'
-        }
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            data = response.json()
-            if not data.get("hasError"):
-                expiration_date_str = data.get("result", {}).get("expirationDate", None)
-                if expiration_date_str:
-                    # Parse the date string into a datetime object
-                    #print(repr(expiration_date_str))
-                    #print(len(expiration_date_str))
-                    try:
-                        # Trim the last character if the string length is 27
-                        if len(expiration_date_str) == 27:
-                            expiration_date_str = expiration_date_str[:-1]
-                        expiration_date_obj = datetime.strptime(expiration_date_str, '%Y-%m-%d %H:%M:%S.%f')
-                        #print(expiration_date_obj)
-                    except ValueError as e:
-                        print(f"Error parsing date: {e}")
-                    #print(expiration_date_obj)
-                    # Format the datetime object back into a string without fractional seconds
-                    #formatted_expiration_date = expiration_date_obj.strftime('%Y-%m-%d %H:%M:%S')
-                    return expiration_date_obj
-                else:
-                    return None
+        dates = await self.resolveExpirationDates([tunnel_id])
+        return dates.get(str(tunnel_id))
+
+    async def resolveExpirationDates(self, tunnel_ids: Iterable) -> Dict[str, Optional[datetime]]:
+        """
+        Returns {tunnel_id: expiration_date} for the given tunnels. Memoized dates are served from
+        the cache, the others are fetched concurrently (at most max_concurrency requests at a time).
+        Tunnels whose lookup fails fall back to their expired memo entry, or are left out of the result.
+        """
+        dates = {}
+        missing = []
+        for tunnel_id in dict.fromkeys(str(tunnel_id) for tunnel_id in tunnel_ids):
+            found, expiration_date = self.expiration_cache.get(tunnel_id)
+            if found:
+                dates[tunnel_id] = expiration_date
             else:
-                return f"Error: {data.get('errors')}"
-        else:
-            return f"Failed to fetch tunnel expiration date: {response.status_code}"
-        
-    async def getConnectionsOfProxy(self, authToken):
+                missing.append(tunnel_id)
+
+        async for tunnel_id, expiration_date, error in fan_out(missing, self._fetchExpirationDate, self.max_concurrency):
+            if error is not None:
+                logging.error(f"Failed to fetch expiration date of tunnel {tunnel_id}: {error}")
+                found, expiration_date = self.expiration_cache.get(tunnel_id, allow_stale=True)
+                if found:
+                    dates[tunnel_id] = expiration_date
+                continue
+            self.expiration_cache.put(tunnel_id, expiration_date)
+            dates[tunnel_id] = expiration_date
+        return dates
+
+    async def _fetchExpirationDate(self, tunnel_id) -> Optional[datetime]:
+        status, data = await self.http.get(f"GetExpirationDateByTunnelId/{tunnel_id}")
+        if status != 200:
+            raise RuntimeError(f"HTTP {status}")
+        if data.get("hasError"):
+            raise RuntimeError(f"{data.get('errors')}")
+
+        expiration_date_str = (data.get("result") or {}).get("expirationDate", None)
+        if not expiration_date_str:
+            return None
+        try:
+            # Trim the last character if the string length is 27
+            if len(expiration_date_str) == 27:
+                expiration_date_str = expiration_date_str[:-1]
+            return datetime.strptime(expiration_date_str, '%Y-%m-%d %H:%M:%S.%f')
+        except ValueError as e:
+            logging.error(f"Error parsing date: {e}")
+            return None
+
+    async def getConnectionsOfProxy(self, authToken) -> List[ProxyConnection]:
         """
-        Fetches proxy details for a given authToken and returns a list of Proxy instances.
+        Fetches proxy details for a given authToken and returns a list of ProxyConnection instances.
+        Raises on HTTP or API errors instead of returning an empty list, so a sync keeps the connections it couldn't fetch.
         """
-        url = f"{self.base_url}/GetTunnelsByAuthToken/{authToken}"
-        headers = {
-            'Accept': 'application/json',
-            'Authorization': f'Bearer {self.api_key}'
-        }
-        response = requests.get(url, headers=headers)
-        proxies = []  # Initialize an empty list to hold the Proxy instances
+        path = f"GetTunnelsByAuthToken/{authToken}"
+        status, data = await self.http.get(path)
+        if status != 200:
+            raise ProviderHttpError(self.http.name, self.http.url(path), f"HTTP {status}")
+        if data.get("hasError"):
+            raise ProviderHttpError(self.http.name, self.http.url(path), f"{data.get('errors')}")
 
-        if response.status_code == 200:
-            data = response.json()
-            if not data.get("hasError"):
-                raw_proxies = data.get("result", [])
-                for proxy in raw_proxies:
-                    # Create a Proxy instance for each item in raw_proxies
-                    proxy_instance = DBProxyConnection(
-                        id=proxy['id'],
-                        userId=proxy.get('userId', ''),
-                        created_timestamp=proxy.get('createdTimestamp', 0),
-                        updated_timestamp=proxy.get('updatedTimestamp', 0),
-                        name=proxy.get('name', ''),
-                        description=proxy.get('description', ''),
-                        host=proxy.get('serverIp', ''),
-                        port=proxy.get('serverPort', 0),
-                        login=proxy.get('authenticationUsername', ''),  # Assuming this is the login
-                        password=proxy.get('authenticationPassword', ''),  # Assuming this is the password
-                        type=proxy.get('protocolType', ''),
-                        connectionId=proxy.get('guidId', ''),  # Assuming this is the connection ID
-                        active=proxy.get('status', False) == 1,  # Assuming status 1 means active
-                        #deviceModel=proxy.get('authTokenName', '')
-                    )
-                    proxies.append(proxy_instance)
-            else:
-                print(f"Error: {data.get('errors')}")
-        else:
-            print(f"Failed to fetch tunnels by authToken: {response.status_code}")
+        proxies = []  # Initialize an empty list to hold the ProxyConnection instances
+        raw_proxies = data.get("result", [])
+        for proxy in raw_proxies:
+            proxy_instance = ProxyConnection(
+                id=proxy['id'],
+                userId=proxy.get('userId', ''),
+                created_timestamp=proxy.get('createdTimestamp', 0),
+                updated_timestamp=proxy.get('updatedTimestamp', 0),
+                name=proxy.get('name', ''),
+                description=proxy.get('description', ''),
+                user=self._extract_user(proxy),
+                host=proxy.get('serverIp', ''),
+                port=proxy.get('serverPort', 0),
+                login=proxy.get('authenticationUsername', ''),  # Assuming this is the login
+                password=proxy.get('authenticationPassword', ''),  # Assuming this is the password
+                type=proxy.get('protocolType', ''),
+                connectionId=proxy.get('guidId', ''),  # Assuming this is the connection ID
+                active=proxy.get('status', False) == 1,  # Assuming status 1 means active
+            )
+            proxies.append(proxy_instance)
 
         return proxies
 
     async def setExpirationDateForConnection(self, tunnelId: str, new_expirationDate: datetime) -> str:
         """
-        Sets the expiration date for a specific tunnel and keeps track of the original expiration date.
+        Sets the expiration date for a specific tunnel.
 
         :param tunnelId: The ID of the tunnel to update.
         :param new_expirationDate: The new expiration date as a datetime object.
         :return: A message indicating the result of the operation.
         """
-        # Convert the new expiration date to the API's expected date-time format
-        #formatted_new_expirationDate = new_expirationDate.strftime('%Y-%m-%d %H:%M:%S')
-        formatted_new_expirationDate = new_expirationDate.isoformat()
-
-        # Fetch the current expiration date for comparison (implement this method)
-        """ current_expiration_date = self.getConnectionExpirationDate(tunnelId)
-        if current_expiration_date is None:
-            return "Failed to fetch current expiration date."
-
-        # Compare the current and new expiration dates
-        if new_expirationDate <= current_expiration_date:
-            return "The new expiration date must be later than the current expiration date." """
-
-        # Proceed to update the expiration date
-        url = f"{self.base_url}/SetExpirationDateForTunnel"
-        headers = {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json',
-            'Authorization': f'Bearer {self.api_key}'
-        }
         payload = {
             "tunnelId": tunnelId,
-            "expirationDate": formatted_new_expirationDate
+            "expirationDate": new_expirationDate.isoformat()
         }
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
+        status, data = await self.http.post("SetExpirationDateForTunnel", json=payload)
 
-        if response.status_code == 200:
-            data = response.json()
+        if status == 200:
             if not data.get("hasError"):
+                self.expiration_cache.put(tunnelId, new_expirationDate)
                 return "Expiration date updated successfully."
             else:
                 error_messages = ', '.join(data.get("errors", ["Unknown error."]))
                 return f"Error: {error_messages}"
         else:
-            return f"Failed to set expiration date: HTTP {response.status_code}"
+            self.expiration_cache.invalidate(tunnelId)
+            return f"Failed to set expiration date: HTTP {status}"
     
 """     async def sync_connections(self):
         proxies = await self.getAllProxies()
@@ -0,0 +1,72 @@
+import hashlib
+from typing import Iterable, List, Optional, Tuple
+
+from src.db.connection_snapshots import ConnectionRecord
+
+
+class StalePaymentSession(ValueError):
+    """The connections of a checkout changed in the database since it started."""
+
+
+class PaymentSession:
+    """The connections a checkout works on, loaded once when the user presses "💳 Pay".
+
+    The session is kept in the FSM data for the whole checkout, so selecting connections,
+    the payment method and the periods is served without the database. `version` stamps the
+    records; the final commit re-reads only the selected rows and rejects the payment if
+    any of them was renewed, deleted or reassigned meanwhile.
+    """
+
+    STATE_KEY = 'payment_session'
+
+    __slots__ = ('user_id', 'telegram_user_id', 'connections', 'version')
+
+    def __init__(self, user_id: int, telegram_user_id: int, connections: Iterable[ConnectionRecord],
+                 version: Optional[str] = None):
+        self.user_id = user_id
+        self.telegram_user_id = telegram_user_id
+        self.connections: Tuple[ConnectionRecord, ...] = tuple(connections)
+        self.version = version or self.stamp(self.connections)
+
+    @staticmethod
+    def stamp(records: Iterable[ConnectionRecord]) -> str:
+        digest = hashlib.sha1()
+        for record in sorted(records, key=lambda record: record.id):
+            expiration = record.expiration_date.isoformat() if record.expiration_date else ''
+            digest.update(f"{record.id}|{expiration}\n".encode())
+        return digest.hexdigest()[:16]
+
+    def to_state(self) -> dict:
+        return {
+            'user_id': self.user_id,
+            'telegram_user_id': self.telegram_user_id,
+            'connections': [list(record) for record in self.connections],
+            'version': self.version,
+        }
+
+    @classmethod
+    def from_state(cls, data: dict) -> Optional['PaymentSession']:
+        """The session stored in FSM data, or None if there is none (or it doesn't match its stamp)."""
+        stored = data.get(cls.STATE_KEY)
+        if not stored:
+            return None
+        session = cls(
+            stored['user_id'], stored['telegram_user_id'],
+            (ConnectionRecord(*record) for record in stored['connections']),
+        )
+        return session if session.version == stored['version'] else None
+
+    def select(self, connection_ids: Iterable[str]) -> List[ConnectionRecord]:
+        """The records of `connection_ids` that belong to this session, in session order."""
+        wanted = set(connection_ids)
+        return [record for record in self.connections if record.id in wanted]
+
+    async def revalidate(self, connection_repository, connection_ids: List[str]) -> list:
+        """Re-reads the selected connections; raises StalePaymentSession if they changed since the session started."""
+        expected = self.select(connection_ids)
+        rows = await connection_repository.get_connections_by_ids([record.id for record in expected])
+        current = [row for row in rows if row.user_id == self.user_id and not row.deleted]
+        if (not expected or len(current) != len(expected)
+                or self.stamp(ConnectionRecord.from_connection(row) for row in current) != self.stamp(expected)):
+            raise StalePaymentSession("The selected connections changed, please start the payment again.")
+        return current
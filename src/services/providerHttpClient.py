@@ -0,0 +1,290 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import aiohttp
+
+from src.bot.config import (
+    PROVIDER_HTTP_TIMEOUT, PROVIDER_HTTP_CONNECT_TIMEOUT, PROVIDER_HTTP_POOL_SIZE, PROVIDER_DNS_TTL,
+    PROVIDER_RATE_LIMIT, PROVIDER_RATE_BURST, PROVIDER_MAX_RETRIES, PROVIDER_BACKOFF_BASE, PROVIDER_BACKOFF_MAX,
+    PROVIDER_BREAKER_THRESHOLD, PROVIDER_BREAKER_RESET
+)
+from src.utils.metrics import PROVIDER_REQUEST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ProviderHttpError(Exception):
+    """Raised when a provider request fails at the transport level (timeout, connection reset, ...),
+    or by a provider manager for an error answer that must not be mistaken for an empty result."""
+
+    def __init__(self, provider: str, url: str, message: str):
+        self.provider = provider
+        self.url = url
+        super().__init__(f"{provider} request to {url} failed: {message}")
+
+
+class CircuitOpenError(ProviderHttpError):
+    """Raised without touching the network while a provider's circuit breaker is open."""
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average and bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class CircuitBreaker:
+    """Stops calling a provider after `failure_threshold` consecutive failures.
+
+    After `reset_timeout` seconds one probe request is let through (half-open): its success
+    closes the circuit, its failure opens it again for another `reset_timeout`.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self, error: str):
+        self.failures += 1
+        self.last_error = error
+        if self._probing or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._probing:
+                logger.warning(f"Circuit opened after {self.failures} failures: {error}")
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release_probe(self):
+        # The probe was cancelled before it got an answer; let the next call probe instead
+        self._probing = False
+
+    def retry_in(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+
+class ProviderHttpClient:
+    """Keep-alive HTTP client for one provider API.
+
+    A single aiohttp.ClientSession is shared by every call to the provider, so TCP/TLS
+    connections and DNS lookups are reused instead of being paid on every request. Calls go
+    through a token bucket and a circuit breaker; 429/5xx answers and transport errors are
+    retried with exponential backoff and jitter.
+    """
+
+    def __init__(self, name: str, base_url: str, headers: Optional[Dict[str, str]] = None,
+                 pool_size: int = PROVIDER_HTTP_POOL_SIZE, timeout: float = PROVIDER_HTTP_TIMEOUT,
+                 max_retries: int = PROVIDER_MAX_RETRIES):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.headers = headers or {}
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=PROVIDER_HTTP_CONNECT_TIMEOUT)
+        self.max_retries = max_retries
+        self.rate_limiter = TokenBucket(PROVIDER_RATE_LIMIT, PROVIDER_RATE_BURST)
+        self.breaker = CircuitBreaker(PROVIDER_BREAKER_THRESHOLD, PROVIDER_BREAKER_RESET)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created lazily so the session binds to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size,
+                ttl_dns_cache=PROVIDER_DNS_TTL,
+                keepalive_timeout=30,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers,
+                timeout=self.timeout,
+                json_serialize=json.dumps,
+            )
+        return self._session
+
+    def url(self, path: str) -> str:
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    async def request(self, method: str, path: str, timeout: Optional[float] = None, **kwargs) -> Tuple[int, Any]:
+        """Sends a request and returns (status, payload); payload is parsed JSON when possible, else text.
+
+        Raises CircuitOpenError while the provider is considered down, and ProviderHttpError when
+        the request still fails at the transport level after the retries.
+        """
+        url = self.url(path)
+        if timeout is not None:
+            kwargs['timeout'] = aiohttp.ClientTimeout(total=timeout)
+
+        # The breaker counts logical requests: one failure once the retries are used up
+        if not self.breaker.allow():
+            raise CircuitOpenError(self.name, url, f"circuit open, retry in {self.breaker.retry_in():.0f}s")
+        attempt = 0
+        try:
+            while True:
+                await self.rate_limiter.acquire()
+                try:
+                    status, payload, retry_after = await self._send(method, url, **kwargs)
+                except ProviderHttpError as e:
+                    if attempt >= self.max_retries:
+                        self.breaker.record_failure(str(e))
+                        raise
+                    delay = self._backoff(attempt)
+                else:
+                    if status not in RETRY_STATUSES:
+                        self.breaker.record_success()
+                        return status, payload
+                    if attempt >= self.max_retries:
+                        self.breaker.record_failure(f"HTTP {status}")
+                        return status, payload
+                    delay = retry_after if retry_after is not None else self._backoff(attempt)
+
+                attempt += 1
+                logger.warning(f"{self.name} {method} {url} failed, retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                if self.breaker.state == CircuitBreaker.OPEN:
+                    # Other requests gave up on the provider meanwhile
+                    raise CircuitOpenError(self.name, url, f"circuit open, retry in {self.breaker.retry_in():.0f}s")
+        except asyncio.CancelledError:
+            self.breaker.release_probe()
+            raise
+
+    async def _send(self, method: str, url: str, **kwargs) -> Tuple[int, Any, Optional[float]]:
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            async with self._get_session().request(method, url, **kwargs) as response:
+                status = response.status
+                body = await response.text()
+                try:
+                    payload = json.loads(body) if body else None
+                except ValueError:
+                    payload = body
+                return response.status, payload, self._retry_after(response)
+        except asyncio.TimeoutError:
+            status = 'timeout'
+            raise ProviderHttpError(self.name, url, "timed out")
+        except aiohttp.ClientError as e:
+            raise ProviderHttpError(self.name, url, str(e))
+        finally:
+            PROVIDER_REQUEST_SECONDS.observe(time.perf_counter() - started, provider=self.name, status=status)
+
+    @staticmethod
+    def _retry_after(response) -> Optional[float]:
+        value = response.headers.get('Retry-After')
+        try:
+            return min(float(value), PROVIDER_BACKOFF_MAX) if value is not None else None
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        # Full jitter: a random delay up to the exponential cap
+        return random.uniform(0, min(PROVIDER_BACKOFF_MAX, PROVIDER_BACKOFF_BASE * 2 ** attempt))
+
+    async def get(self, path: str, **kwargs) -> Tuple[int, Any]:
+        return await self.request('GET', path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> Tuple[int, Any]:
+        return await self.request('POST', path, **kwargs)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'state': self.breaker.state,
+            'failures': self.breaker.failures,
+            'last_error': self.breaker.last_error,
+            'retry_in': self.breaker.retry_in() if self.breaker.state == CircuitBreaker.OPEN else None,
+            'tokens': round(self.rate_limiter.tokens, 1),
+        }
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+_clients: Dict[str, ProviderHttpClient] = {}
+
+
+def get_provider_client(name: str, base_url: str, headers: Optional[Dict[str, str]] = None,
+                        max_retries: int = PROVIDER_MAX_RETRIES) -> ProviderHttpClient:
+    """Returns the shared client of a provider, creating it on first use."""
+    client = _clients.get(name)
+    if client is None:
+        client = ProviderHttpClient(name, base_url, headers, max_retries=max_retries)
+        _clients[name] = client
+    return client
+
+
+def provider_clients_status():
+    return [client.status() for client in _clients.values()]
+
+
+async def close_provider_clients():
+    for client in list(_clients.values()):
+        try:
+            await client.close()
+        except Exception as e:
+            logger.error(f"Failed to close {client.name} HTTP client: {e}")
+    _clients.clear()
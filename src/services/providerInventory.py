@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.bot.config import PROVIDER_INVENTORY_TTL
+from src.bot.models.proxy_models import Proxy, ProxyConnection
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize_username(username: Optional[str]) -> Optional[str]:
+    if not username:
+        return None
+    username = username.strip().lstrip('@')
+    return username or None
+
+
+class _Snapshot:
+    """Everything we know about one provider at a point in time."""
+
+    __slots__ = ('proxies', 'connections', 'user_ids', 'by_username', 'by_user_id', 'loaded_at')
+
+    def __init__(self):
+        self.proxies: Dict[str, Proxy] = {}  # authToken -> Proxy
+        self.connections: Dict[str, List[ProxyConnection]] = {}  # authToken -> connections
+        self.user_ids: Dict[str, int] = {}  # username -> Users.id
+        self.by_username: Dict[str, List[Proxy]] = {}
+        self.by_user_id: Dict[int, List[Proxy]] = {}
+        self.loaded_at = time.monotonic()
+
+
+class ProviderInventory:
+    """Read-through in-memory copy of the proxies and connections of every provider.
+
+    The background sync refreshes it with what it fetched; handlers read from it. A provider
+    that has no snapshot yet, or whose snapshot is older than `ttl`, is fetched live once
+    (concurrent readers wait for the same fetch) and cached.
+    """
+
+    def __init__(self, ttl: int = PROVIDER_INVENTORY_TTL):
+        self.ttl = ttl
+        self._snapshots: Dict[str, _Snapshot] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    # Writing
+
+    def refresh(self, service_name: str, inventory: Iterable[Tuple[Proxy, Optional[List[ProxyConnection]]]],
+                user_ids: Optional[Dict[str, int]] = None):
+        """Replaces the snapshot of a provider.
+
+        connections=None keeps the previously known connections, user_ids=None the previously known user ids.
+        """
+        previous = self._snapshots.get(service_name)
+        snapshot = _Snapshot()
+        if user_ids is None and previous is not None:
+            user_ids = previous.user_ids
+        snapshot.user_ids = dict(user_ids or {})
+        for proxy, connections in inventory:
+            token = str(proxy.authToken)
+            snapshot.proxies[token] = proxy
+            if connections is None and previous is not None:
+                connections = previous.connections.get(token)
+            if connections is not None:
+                snapshot.connections[token] = connections
+        self._index(snapshot)
+        self._snapshots[service_name] = snapshot
+
+    def _index(self, snapshot: _Snapshot):
+        for proxy in snapshot.proxies.values():
+            username = _normalize_username(proxy.user)
+            if username is None:
+                continue
+            snapshot.by_username.setdefault(username, []).append(proxy)
+            user_id = snapshot.user_ids.get(username)
+            if user_id is not None:
+                snapshot.by_user_id.setdefault(user_id, []).append(proxy)
+
+    def invalidate(self, service_name: Optional[str] = None):
+        if service_name is None:
+            self._snapshots.clear()
+        else:
+            self._snapshots.pop(service_name, None)
+
+    # Reading
+
+    async def _snapshot(self, manager) -> _Snapshot:
+        snapshot = self._snapshots.get(manager.service_name)
+        if snapshot is not None and time.monotonic() - snapshot.loaded_at < self.ttl:
+            return snapshot
+
+        lock = self._locks.setdefault(manager.service_name, asyncio.Lock())
+        async with lock:
+            snapshot = self._snapshots.get(manager.service_name)
+            if snapshot is not None and time.monotonic() - snapshot.loaded_at < self.ttl:
+                return snapshot
+            try:
+                proxies = await manager.getAllProxies()
+            except Exception as e:
+                if snapshot is None:
+                    raise
+                # Serve the stale snapshot rather than failing the user
+                logger.warning(f"Failed to refresh {manager.service_name} inventory, serving stale data: {e}")
+                return snapshot
+            self.refresh(manager.service_name, [(proxy, None) for proxy in proxies])
+            return self._snapshots[manager.service_name]
+
+    async def get_proxies(self, manager) -> List[Proxy]:
+        return list((await self._snapshot(manager)).proxies.values())
+
+    async def get_user_proxies(self, managers, username: Optional[str] = None,
+                               user_id: Optional[int] = None) -> List[Proxy]:
+        """Proxies of a user across providers, looked up by Telegram username or DB user id."""
+        username = _normalize_username(username)
+        proxies = []
+        for manager in managers:
+            snapshot = await self._snapshot(manager)
+            if user_id is not None and user_id in snapshot.by_user_id:
+                proxies.extend(snapshot.by_user_id[user_id])
+            elif username is not None:
+                proxies.extend(snapshot.by_username.get(username, []))
+        return proxies
+
+    async def get_connections(self, manager, auth_token: str) -> List[ProxyConnection]:
+        snapshot = await self._snapshot(manager)
+        token = str(auth_token)
+        if token in snapshot.connections:
+            return snapshot.connections[token]
+
+        # Raises on provider errors, so a failed fetch is not cached as "no connections"
+        connections = await manager.getConnectionsOfProxy(auth_token)
+        snapshot.connections[token] = connections
+        return connections
+
+
+provider_inventory = ProviderInventory()
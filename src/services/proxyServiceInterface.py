@@ -1,22 +1,116 @@
+import asyncio
+import logging
+import time
 from typing import Tuple
+
+from src.bot.config import SYNC_FANOUT_WIDTH, SYNC_FULL_RECONCILE_INTERVAL
+from src.services.fanout import fan_out
+from src.services.providerInventory import provider_inventory
+
 class ProxyServiceInterface:
+    service_name = None
+    database = None
+    max_concurrency = None  # Concurrent per-proxy fetches during a sync, SYNC_FANOUT_WIDTH if unset
+    _sync_lock = None
+
     def getAllProxies(self):
         raise NotImplementedError
 
     def getProxyExpirationDate(self, connection_id):
         raise NotImplementedError
-    
+
     def getConnectionsOfProxy(self, connection_id):
         raise NotImplementedError
-    
+
     def updateProxyUser(self, connection_id, user):
         raise NotImplementedError
-    
+
     def setExpirationDateForConnection(self, connection_id, expirationDate):
         raise NotImplementedError
-    
+
     async def getTrafficData(self, connection_id: str, from_timestamp: int, to_timestamp: int) -> Tuple[int, int, str, bytes]:
         raise NotImplementedError
 
+    async def sync_connections(self, full: bool = True):
+        """Pulls every proxy and connection from the provider and writes the difference to the DB.
+
+        The DB state is loaded while the proxy list is fetched, then the connection lists of all
+        proxies are fetched concurrently (at most `max_concurrency` at a time) and staged as they
+        arrive. The diff is applied in one transaction at the end.
+
+        With full=False only connections updated since the last sync are written, unless the last
+        full reconcile is older than SYNC_FULL_RECONCILE_INTERVAL.
+        """
+        if self._sync_lock is None:
+            self._sync_lock = asyncio.Lock()
+        async with self._sync_lock:
+            return await self._sync_connections(full)
+
+    async def _sync_connections(self, full: bool):
+        from src.services.syncEngine import ProxySyncEngine
+
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        session = self._new_session()
+        try:
+            # The DB phases are blocking SQLAlchemy work, keep them off the event loop
+            engine = ProxySyncEngine(session, self.service_name, incremental=not full,
+                                     full_sync_interval=SYNC_FULL_RECONCILE_INTERVAL)
+            load = loop.run_in_executor(None, engine.load)
+            try:
+                api_proxies = await self.getAllProxies()
+            finally:
+                await load
+
+            failed = 0
+            inventory = []
+            limit = self.max_concurrency or SYNC_FANOUT_WIDTH
+            fetches = fan_out(api_proxies, lambda api_proxy: self.getConnectionsOfProxy(api_proxy.authToken), limit)
+            async for api_proxy, api_connections, error in fetches:
+                if error is not None:
+                    # Keep the proxy's connections as they are rather than deleting them
+                    failed += 1
+                    logging.warning(f"Failed to fetch {self.service_name} connections of proxy {api_proxy.id}: {error}")
+                    api_connections = None
+                engine.stage(api_proxy, api_connections)
+                inventory.append((api_proxy, api_connections))
+            fetched = time.monotonic()
+
+            stats = await loop.run_in_executor(None, self._apply_sync, engine)
+            provider_inventory.refresh(self.service_name, inventory, engine.user_ids)
+            stats.proxies_fetched = len(api_proxies)
+            stats.proxies_failed = failed
+            stats.fetch_seconds = round(fetched - started, 3)
+            stats.apply_seconds = round(time.monotonic() - fetched, 3)
+            logging.info(
+                f"{self.service_name} {'incremental' if stats.incremental else 'full'} sync done: "
+                f"{len(api_proxies) - failed}/{len(api_proxies)} proxies fetched "
+                f"in {stats.fetch_seconds}s (concurrency {limit}), applied in {stats.apply_seconds}s"
+            )
+            return stats
+        except Exception as e:
+            logging.error(f"An error occurred while syncing {self.service_name} connections: {e}")
+            return None
+        finally:
+            await loop.run_in_executor(None, session.close)
+
+    @staticmethod
+    def _apply_sync(engine):
+        try:
+            stats = engine.apply()
+            engine.session.commit()
+            return stats
+        except:
+            engine.session.rollback()
+            raise
+
+    def _new_session(self):
+        database = self.database
+        if database is None:
+            from src.bot.bot_setup import database
+        # Bypass the scoped registry: this runs in an executor thread, outside of any update
+        session_factory = getattr(database.Session, 'session_factory', database.Session)
+        return session_factory()
+
 
-    # Add other common methods that proxy services should have
\ No newline at end of file
+    # Add other common methods that proxy services should have
@@ -0,0 +1,403 @@
+import logging
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, insert, update
+
+from src.bot.models.proxy_models import Proxy, ProxyConnection
+from src.db.bulk_upsert import bulk_upsert
+from src.db.models.db_models import (
+    DBProxy,
+    DBProxyConnection,
+    DBHost,
+    User,
+    UserType,
+    ChangeType,
+    ConnectionDataChange,
+    UserConnectionChange,
+    UserConnectionChangeType,
+    ProviderSyncWatermark,
+)
+
+logger = logging.getLogger(__name__)
+
+IN_CHUNK_SIZE = 1000
+
+PROXY_UPDATE_FIELDS = ['name', 'tariff_plan', 'tariff_expiration_date', 'device_model', 'active']
+CONNECTION_COMPARE_FIELDS = ['name', 'description', 'host_id', 'port', 'login', 'password', 'connection_type', 'user_id', 'active', 'deleted']
+CONNECTION_UPDATE_FIELDS = CONNECTION_COMPARE_FIELDS + ['proxy_id', 'updated_datetime']
+
+# Fields that get a ConnectionDataChange row when they change
+DATA_CHANGE_TYPES = {
+    'name': ChangeType.NAME,
+    'description': ChangeType.DESCRIPTION,
+    'host_id': ChangeType.HOST,
+    'port': ChangeType.PORT,
+    'login': ChangeType.LOGIN,
+    'password': ChangeType.PASSWORD,
+    'connection_type': ChangeType.CONNECTION_TYPE,
+    'active': ChangeType.ACTIVE,
+}
+
+CONNECTION_VALIDITY_DAYS = 30
+
+
+@dataclass
+class SyncStats:
+    proxies_inserted: int = 0
+    proxies_updated: int = 0
+    proxies_deactivated: int = 0
+    connections_inserted: int = 0
+    connections_updated: int = 0
+    connections_deleted: int = 0
+    hosts_inserted: int = 0
+    users_inserted: int = 0
+    data_changes: int = 0
+    user_changes: int = 0
+    proxies_fetched: int = 0
+    proxies_failed: int = 0
+    fetch_seconds: float = 0.0
+    apply_seconds: float = 0.0
+    incremental: bool = False
+    connections_skipped: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _chunks(items: list, size: int = IN_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _from_millis(timestamp: Optional[int]) -> Optional[datetime]:
+    return datetime.fromtimestamp(timestamp / 1000) if timestamp else None
+
+
+def _normalize_username(username: Optional[str]) -> Optional[str]:
+    if not username:
+        return None
+    username = username.strip().lstrip('@')
+    return username or None
+
+
+class ProxySyncEngine:
+    """Set-based synchronisation of one provider's proxies and connections with the database.
+
+    Usage: load() the current DB state in a few bulk queries, stage() every provider proxy
+    with its connections, then apply() the in-memory diff as bulk upserts and bulk inserts.
+    The caller owns the session and commits once, so the whole sync is one transaction.
+
+    In incremental mode only connections whose updatedTimestamp is past the proxy's stored
+    high-water mark are loaded and compared, and nothing is marked deleted. load() falls back
+    to a full reconcile when the last one is older than `full_sync_interval` seconds.
+    """
+
+    def __init__(self, session, service_name: str, incremental: bool = False,
+                 full_sync_interval: Optional[int] = None):
+        self.session = session
+        self.service_name = service_name
+        self.incremental = incremental
+        self.full_sync_interval = full_sync_interval
+        self.now = datetime.now(timezone.utc).replace(microsecond=0, tzinfo=None)
+        self.stats = SyncStats()
+
+        self._db_proxies: Dict[str, tuple] = {}
+        self._db_connections: Dict[str, dict] = {}
+        self._hosts: Dict[str, int] = {}
+        self._users: Dict[str, int] = {}
+
+        self._staged_proxies: Dict[str, Proxy] = {}
+        self._staged_connections: Dict[str, Tuple[str, ProxyConnection]] = {}
+        self._partial_proxies = set()  # Proxies whose connection list could not be fetched
+        self._watermarks: Dict[str, tuple] = {}  # proxy_id -> (high_water_mark, reconciled_at)
+        self._new_watermarks: Dict[str, int] = {}
+
+    @property
+    def user_ids(self) -> Dict[str, int]:
+        """Username -> Users.id of every user referenced by the staged connections."""
+        return dict(self._users)
+
+    # Loading
+
+    def load(self):
+        proxy_rows = self.session.execute(
+            select(DBProxy.id, DBProxy.name, DBProxy.tariff_plan, DBProxy.tariff_expiration_date,
+                   DBProxy.device_model, DBProxy.active)
+            .where(DBProxy.service_name == self.service_name)
+        ).all()
+        self._db_proxies = {row.id: row for row in proxy_rows}
+
+        self._load_watermarks()
+        if self.incremental and self._reconcile_due():
+            logger.info(f"{self.service_name} full reconcile is due, running a full sync")
+            self.incremental = False
+        self.stats.incremental = self.incremental
+
+        # Incremental runs only load the connections that changed, in _load_missing_connections
+        if self._db_proxies and not self.incremental:
+            self._load_connections(DBProxyConnection.proxy_id.in_(list(self._db_proxies)))
+
+        self._hosts = {ip: host_id for host_id, ip in self.session.execute(select(DBHost.id, DBHost.ip_address))}
+
+    def _load_watermarks(self):
+        rows = self.session.execute(
+            select(ProviderSyncWatermark.proxy_id, ProviderSyncWatermark.high_water_mark,
+                   ProviderSyncWatermark.reconciled_at)
+            .where(ProviderSyncWatermark.service_name == self.service_name)
+        )
+        self._watermarks = {proxy_id: (mark, reconciled_at) for proxy_id, mark, reconciled_at in rows}
+
+    def _reconcile_due(self) -> bool:
+        if not self._watermarks:
+            return True
+        if self.full_sync_interval is None:
+            return False
+        reconciled = [reconciled_at for _, reconciled_at in self._watermarks.values()]
+        if any(reconciled_at is None for reconciled_at in reconciled):
+            return True
+        return min(reconciled) < self.now - timedelta(seconds=self.full_sync_interval)
+
+    def _load_connections(self, criterion):
+        columns = [getattr(DBProxyConnection, field) for field in CONNECTION_COMPARE_FIELDS]
+        rows = self.session.execute(
+            select(DBProxyConnection.id, DBProxyConnection.proxy_id, DBProxyConnection.expiration_date,
+                   DBProxyConnection.created_datetime, *columns)
+            .where(criterion)
+        ).mappings().all()
+        for row in rows:
+            self._db_connections[row['id']] = dict(row)
+
+    # Staging
+
+    def stage(self, api_proxy: Proxy, api_connections: Optional[List[ProxyConnection]]):
+        """Stages a provider proxy; api_connections=None means its connections are unknown and left untouched."""
+        proxy_id = str(api_proxy.id)
+        self._staged_proxies[proxy_id] = api_proxy
+        if api_connections is None:
+            self._partial_proxies.add(proxy_id)
+            return
+
+        high_water_mark = self._watermarks.get(proxy_id, (0, None))[0]
+        new_mark = max([api_connection.updated_timestamp or 0 for api_connection in api_connections] + [high_water_mark])
+        self._new_watermarks[proxy_id] = new_mark
+        for api_connection in api_connections:
+            # Connections without a timestamp can't be skipped safely
+            if self.incremental and api_connection.updated_timestamp and api_connection.updated_timestamp <= high_water_mark:
+                self.stats.connections_skipped += 1
+                continue
+            self._staged_connections[str(api_connection.id)] = (proxy_id, api_connection)
+
+    # Applying
+
+    def apply(self) -> SyncStats:
+        self._load_missing_connections()
+        self._resolve_users()
+        self._resolve_hosts()
+
+        self._apply_proxies()
+        self._apply_connections()
+        self._apply_watermarks()
+
+        logger.info(f"{self.service_name} sync applied: {self.stats.to_dict()}")
+        return self.stats
+
+    def _load_missing_connections(self):
+        # Connections that moved here from a proxy we did not load
+        missing = [cid for cid in self._staged_connections if cid not in self._db_connections]
+        for chunk in _chunks(missing):
+            self._load_connections(DBProxyConnection.id.in_(chunk))
+
+    def _resolve_users(self):
+        usernames = {
+            _normalize_username(api_connection.user)
+            for _, api_connection in self._staged_connections.values()
+        }
+        usernames.discard(None)
+        if not usernames:
+            return
+
+        self._load_users(list(usernames))
+        missing = [name for name in usernames if name not in self._users]
+        if missing:
+            self.session.execute(
+                insert(User),
+                [{'username': name, 'user_type': UserType.TELEGRAM.value} for name in missing],
+            )
+            self.stats.users_inserted = len(missing)
+            self._load_users(missing)
+
+    def _load_users(self, usernames: List[str]):
+        for chunk in _chunks(usernames):
+            rows = self.session.execute(
+                select(User.id, User.username).where(User.username.in_(chunk)).order_by(User.id)
+            )
+            for user_id, username in rows:
+                self._users.setdefault(username, user_id)
+
+    def _resolve_hosts(self):
+        ips = {api_connection.host for _, api_connection in self._staged_connections.values() if api_connection.host}
+        missing = [ip for ip in ips if ip not in self._hosts]
+        if not missing:
+            return
+
+        self.session.execute(insert(DBHost), [{'ip_address': ip, 'country_code': 'Unknown'} for ip in missing])
+        self.stats.hosts_inserted = len(missing)
+        for chunk in _chunks(missing):
+            for host_id, ip in self.session.execute(select(DBHost.id, DBHost.ip_address).where(DBHost.ip_address.in_(chunk))):
+                self._hosts[ip] = host_id
+
+    def _apply_proxies(self):
+        rows = []
+        for proxy_id, api_proxy in self._staged_proxies.items():
+            row = {
+                'id': proxy_id,
+                'name': api_proxy.name,
+                'tariff_plan': api_proxy.tariff_plan,
+                'tariff_expiration_date': api_proxy.tariff_expiration_date,
+                'device_model': api_proxy.deviceModel,
+                'active': bool(api_proxy.active),
+            }
+            current = self._db_proxies.get(proxy_id)
+            if current is None:
+                self.stats.proxies_inserted += 1
+            elif any(getattr(current, field) != row[field] for field in PROXY_UPDATE_FIELDS):
+                self.stats.proxies_updated += 1
+            else:
+                continue
+            row.update(service_name=self.service_name, created_at=self.now, updated_at=self.now)
+            rows.append(row)
+
+        bulk_upsert(self.session, DBProxy, rows, PROXY_UPDATE_FIELDS + ['updated_at'])
+
+        gone = [pid for pid, row in self._db_proxies.items() if pid not in self._staged_proxies and row.active]
+        for chunk in _chunks(gone):
+            self.session.execute(update(DBProxy).where(DBProxy.id.in_(chunk)).values(active=False, updated_at=self.now))
+        self.stats.proxies_deactivated = len(gone)
+
+    def _apply_connections(self):
+        rows = []
+        data_changes = []
+        user_changes = []
+
+        for connection_id, (proxy_id, api_connection) in self._staged_connections.items():
+            row = self._connection_row(connection_id, proxy_id, api_connection)
+            current = self._db_connections.get(connection_id)
+
+            if current is None:
+                self.stats.connections_inserted += 1
+                if row['user_id'] is not None:
+                    user_changes.append(self._user_change(connection_id, None, row['user_id']))
+            else:
+                changed = [f for f in CONNECTION_COMPARE_FIELDS + ['proxy_id'] if current[f] != row[f]]
+                if not changed:
+                    continue
+                self.stats.connections_updated += 1
+                # Keep the paid period and creation time of existing connections
+                row['expiration_date'] = current['expiration_date']
+                row['created_datetime'] = current['created_datetime']
+                for field in changed:
+                    if field in DATA_CHANGE_TYPES:
+                        data_changes.append({
+                            'connection_id': connection_id,
+                            'user_id': row['user_id'],
+                            'change_type': DATA_CHANGE_TYPES[field],
+                            'old_value': str(current[field]),
+                            'new_value': str(row[field]),
+                            'change_date': self.now,
+                        })
+                if current['user_id'] != row['user_id']:
+                    user_changes.append(self._user_change(connection_id, current['user_id'], row['user_id']))
+            rows.append(row)
+
+        bulk_upsert(self.session, DBProxyConnection, rows, CONNECTION_UPDATE_FIELDS)
+
+        # Connections of synced proxies that disappeared upstream, and all connections of vanished proxies
+        deleted = [
+            (connection_id, current)
+            for connection_id, current in self._db_connections.items()
+            if connection_id not in self._staged_connections and not current['deleted']
+            and current['proxy_id'] in self._db_proxies and current['proxy_id'] not in self._partial_proxies
+        ]
+        if self.incremental:
+            # Only changed connections were loaded; deletions are left to the next full reconcile
+            deleted = []
+        for chunk in _chunks([connection_id for connection_id, _ in deleted]):
+            self.session.execute(
+                update(DBProxyConnection).where(DBProxyConnection.id.in_(chunk)).values(deleted=True, updated_datetime=self.now)
+            )
+        for connection_id, current in deleted:
+            if current['user_id'] is not None:
+                user_changes.append(self._user_change(connection_id, current['user_id'], None))
+        self.stats.connections_deleted = len(deleted)
+
+        user_changes = [change for change in user_changes if change is not None]
+        if data_changes:
+            self.session.execute(insert(ConnectionDataChange), data_changes)
+        if user_changes:
+            self.session.execute(insert(UserConnectionChange), user_changes)
+        self.stats.data_changes = len(data_changes)
+        self.stats.user_changes = len(user_changes)
+
+    def _apply_watermarks(self):
+        rows = []
+        for proxy_id, mark in self._new_watermarks.items():
+            current = self._watermarks.get(proxy_id)
+            if self.incremental and current is not None and current[0] == mark:
+                continue
+            # A proxy seen for the first time had all of its connections compared
+            reconciled_at = current[1] if self.incremental and current is not None else self.now
+            rows.append({
+                'service_name': self.service_name,
+                'proxy_id': proxy_id,
+                'high_water_mark': mark,
+                'updated_at': self.now,
+                'reconciled_at': reconciled_at,
+            })
+        bulk_upsert(self.session, ProviderSyncWatermark, rows, ['high_water_mark', 'updated_at', 'reconciled_at'])
+
+        if not self.incremental:
+            # Proxies that vanished upstream must not hold the reconcile schedule back
+            self.session.execute(
+                update(ProviderSyncWatermark)
+                .where(ProviderSyncWatermark.service_name == self.service_name)
+                .values(reconciled_at=self.now)
+            )
+
+    def _connection_row(self, connection_id: str, proxy_id: str, api_connection: ProxyConnection) -> dict:
+        return {
+            'id': connection_id,
+            'proxy_id': proxy_id,
+            'user_id': self._users.get(_normalize_username(api_connection.user)),
+            'host_id': self._hosts.get(api_connection.host),
+            'created_datetime': _from_millis(api_connection.created_timestamp) or self.now,
+            'updated_datetime': self.now,
+            'expiration_date': self.now + timedelta(days=CONNECTION_VALIDITY_DAYS),
+            'name': api_connection.name,
+            'description': api_connection.description,
+            'port': api_connection.port,
+            'login': api_connection.login,
+            'password': api_connection.password,
+            'connection_type': api_connection.type,
+            'active': bool(api_connection.active),
+            'deleted': False,
+        }
+
+    def _user_change(self, connection_id: str, old_user_id: Optional[int], new_user_id: Optional[int]) -> Optional[dict]:
+        if old_user_id is None and new_user_id is None:
+            return None
+        if old_user_id is None:
+            # old_user_id is NOT NULL in the schema; a first assignment records the new owner on both sides
+            change_type, old_user_id = UserConnectionChangeType.ASSIGNED, new_user_id
+        elif new_user_id is None:
+            change_type = UserConnectionChangeType.UNASSIGNED
+        else:
+            change_type = UserConnectionChangeType.REASSIGNED
+        return {
+            'connection_id': connection_id,
+            'old_user_id': old_user_id,
+            'new_user_id': new_user_id,
+            'change_type': change_type,
+            'change_date': self.now,
+        }
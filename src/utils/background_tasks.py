@@ -1,16 +1,34 @@
-import asyncio
-from src.services.iproxyService import IProxyManager
-from src.services.localtonetService import LocaltonetManager
-from src.bot.config import IPROXY_API_KEY, LOCALTONET_API_KEY
-import logging
+from src.bot.bot_setup import iproxy_manager, localtonet_manager
+from src.bot.config import (
+    IPROXY_SYNC_INTERVAL, LOCALTONET_SYNC_INTERVAL, SYNC_JITTER,
+    FORWARD_MAPPING_CLEANUP_INTERVAL
+)
+from src.utils.scheduler import scheduler
 
-iproxy_manager = IProxyManager(IPROXY_API_KEY)
-localtonet_manager = LocaltonetManager(LOCALTONET_API_KEY)
 
-async def sync_proxy_connections():
-    while True:
-        print("Syncing db with services...")
-        #await iproxy_manager.sync_connections()
-        #await localtonet_manager.sync_connections()
-        print("Db synced!")
-        await asyncio.sleep(3600)  # Synchronize every hour
+def _sync_job(manager):
+    async def sync():
+        # Incremental; the engine switches to a full reconcile when one is due
+        stats = await manager.sync_connections(full=False)
+        if stats is None:
+            raise RuntimeError(f"{manager.service_name} sync failed, see the logs")
+        return stats.to_dict()
+    return sync
+
+
+def register_sync_jobs():
+    """Registers one sync job per provider; each runs on its own cadence."""
+    scheduler.add_job('sync_ipr', _sync_job(iproxy_manager), IPROXY_SYNC_INTERVAL, jitter=SYNC_JITTER)
+    # Offset the first Localtonet run so both providers don't hit the DB at the same moment
+    scheduler.add_job('sync_ltn', _sync_job(localtonet_manager), LOCALTONET_SYNC_INTERVAL, jitter=SYNC_JITTER,
+                      initial_delay=60)
+
+
+def register_cleanup_jobs(message_mappings, fsm_storage):
+    """Registers the housekeeping jobs: trimming expired forwarded-message mappings and FSM states."""
+    scheduler.add_job('forward_cleanup', message_mappings.cleanup, FORWARD_MAPPING_CLEANUP_INTERVAL,
+                      jitter=SYNC_JITTER, initial_delay=300)
+    # Redis expires states by itself
+    if hasattr(fsm_storage, 'cleanup'):
+        scheduler.add_job('fsm_cleanup', fsm_storage.cleanup, FORWARD_MAPPING_CLEANUP_INTERVAL,
+                          jitter=SYNC_JITTER, initial_delay=600)
@@ -0,0 +1,331 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import hmac
+import logging
+import re
+import secrets
+import time
+from collections import OrderedDict, namedtuple
+from typing import Dict, Optional, Set, Tuple
+
+from src.bot.config import TG_BOT_TOKEN, CALLBACK_SECRET, CALLBACK_DATA_TTL, CALLBACK_TOKEN_CACHE_SIZE
+
+# Telegram's limit for InlineKeyboardButton.callback_data, in bytes
+MAX_CALLBACK_DATA = 64
+
+# Issue times are stored relative to 2024-01-01 so they fit a 4-byte varint
+_EPOCH = 1704067200
+_MAC_SIZE = 6
+_TOKEN_MARK = '~'
+# No Telegram chat has id 0; shared token payloads are kept under it in the FSM storage
+_TOKEN_CHAT_ID = 0
+_HEX = re.compile(r'(?:[0-9a-f]{2})+')
+
+logger = logging.getLogger(__name__)
+
+_KEY = (CALLBACK_SECRET.encode() if CALLBACK_SECRET
+        else hashlib.sha256(b'callback-data:' + (TG_BOT_TOKEN or '').encode()).digest())
+
+
+class CallbackDataError(ValueError):
+    """Callback data that doesn't decode or was tampered with."""
+
+
+class StaleCallbackData(CallbackDataError):
+    """Callback data that was valid once but has expired."""
+
+
+def _write_varint(out: bytearray, value: int):
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+class _Reader:
+    __slots__ = ('data', 'pos')
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def varint(self) -> int:
+        value = shift = 0
+        while True:
+            if self.pos >= len(self.data) or shift > 63:
+                raise CallbackDataError("Truncated callback data")
+            byte = self.data[self.pos]
+            self.pos += 1
+            value |= (byte & 0x7f) << shift
+            if not byte & 0x80:
+                return value
+            shift += 7
+
+    def take(self, size: int) -> bytes:
+        if self.pos + size > len(self.data):
+            raise CallbackDataError("Truncated callback data")
+        chunk = self.data[self.pos:self.pos + size]
+        self.pos += size
+        return chunk
+
+
+def _pack_int(out: bytearray, value: int):
+    # Zigzag, so small negative numbers stay one byte
+    _write_varint(out, value << 1 if value >= 0 else (-value << 1) - 1)
+
+
+def _unpack_int(reader: _Reader) -> int:
+    value = reader.varint()
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def _pack_bool(out: bytearray, value: bool):
+    out.append(1 if value else 0)
+
+
+def _unpack_bool(reader: _Reader) -> bool:
+    return reader.take(1) != b'\x00'
+
+
+def _pack_str(out: bytearray, value: str):
+    # Provider ids are mostly lowercase hex, which is stored as half as many raw bytes
+    if _HEX.fullmatch(value):
+        raw = bytes.fromhex(value)
+        _write_varint(out, len(raw) << 1 | 1)
+    else:
+        raw = value.encode()
+        _write_varint(out, len(raw) << 1)
+    out += raw
+
+
+def _unpack_str(reader: _Reader) -> str:
+    header = reader.varint()
+    raw = reader.take(header >> 1)
+    if header & 1:
+        return raw.hex()
+    try:
+        return raw.decode()
+    except UnicodeDecodeError:
+        raise CallbackDataError("Malformed string in callback data")
+
+
+def _pack_strs(out: bytearray, values):
+    _write_varint(out, len(values))
+    for value in values:
+        _pack_str(out, value)
+
+
+def _unpack_strs(reader: _Reader) -> Tuple[str, ...]:
+    return tuple(_unpack_str(reader) for _ in range(reader.varint()))
+
+
+_CODECS = {
+    'int': (_pack_int, _unpack_int),
+    'bool': (_pack_bool, _unpack_bool),
+    'str': (_pack_str, _unpack_str),
+    'strs': (_pack_strs, _unpack_strs),
+}
+
+
+class CallbackTokenRegistry:
+    """Server-side payloads for callback data that doesn't fit in 64 bytes.
+
+    The button then carries a random token instead of the payload. Tokens live in process
+    memory, bounded by `maxsize` (least recently used go first) and `ttl` seconds; a token
+    that is gone decodes as stale, so the user is asked to reopen the menu.
+
+    Once bound to a shared FSM storage (Redis or SQL), issued payloads are also written there
+    in the background, and load() fetches tokens issued by another replica or before a restart.
+    """
+
+    def __init__(self, maxsize: int = CALLBACK_TOKEN_CACHE_SIZE, ttl: int = CALLBACK_DATA_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._payloads: 'OrderedDict[str, Tuple[str, bytes, float]]' = OrderedDict()
+        self._storage = None
+        self._writes: Set[asyncio.Task] = set()
+
+    def bind(self, storage):
+        """Shares payloads through `storage`, an aiogram FSM storage all replicas use."""
+        self._storage = storage
+
+    def issue(self, action: str, payload: bytes) -> str:
+        token = secrets.token_urlsafe(9)
+        self._remember(token, action, payload, time.monotonic() + self.ttl)
+        if self._storage is not None:
+            self._share(token, action, payload)
+        return token
+
+    def _remember(self, token: str, action: str, payload: bytes, expires_at: float):
+        self._payloads[token] = (action, payload, expires_at)
+        self._payloads.move_to_end(token)
+        while len(self._payloads) > self.maxsize:
+            self._payloads.popitem(last=False)
+
+    @staticmethod
+    def _storage_user(token: str) -> int:
+        # The 9 random bytes of the token, as a positive BIGINT
+        return int.from_bytes(base64.urlsafe_b64decode(token)[:8], 'big') >> 1
+
+    def _share(self, token: str, action: str, payload: bytes):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        data = {'action': action, 'payload': payload.hex(), 'expires_at': int(time.time()) + self.ttl}
+        task = loop.create_task(self._storage.set_data(chat=_TOKEN_CHAT_ID, user=self._storage_user(token), data=data))
+        self._writes.add(task)
+        task.add_done_callback(self._shared)
+
+    def _shared(self, task: asyncio.Task):
+        self._writes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Failed to share a callback token: {task.exception()}")
+
+    async def load(self, data: Optional[str]):
+        """Makes the token in callback `data`, if any, resolvable here when another replica issued it."""
+        action, _, body = (data or '').partition(':')
+        if self._storage is None or not body.startswith(_TOKEN_MARK):
+            return
+        token = body[1:]
+        if token in self._payloads:
+            return
+        try:
+            stored = await self._storage.get_data(chat=_TOKEN_CHAT_ID, user=self._storage_user(token))
+        except (binascii.Error, ValueError):
+            return
+        except Exception as e:
+            logger.error(f"Failed to load callback token: {e}")
+            return
+        remaining = (stored or {}).get('expires_at', 0) - time.time()
+        if remaining <= 0 or stored.get('action') != action:
+            return
+        self._remember(token, action, bytes.fromhex(stored['payload']), time.monotonic() + remaining)
+
+    def resolve(self, action: str, token: str) -> bytes:
+        entry = self._payloads.get(token)
+        if entry is None or entry[2] < time.monotonic():
+            self._payloads.pop(token, None)
+            raise StaleCallbackData("Unknown or expired callback token")
+        if entry[0] != action:
+            raise CallbackDataError("Callback token issued for another action")
+        self._payloads.move_to_end(token)
+        return entry[1]
+
+    def __len__(self):
+        return len(self._payloads)
+
+
+token_registry = CallbackTokenRegistry()
+
+
+class CallbackSchema:
+    """Typed callback data of one button action.
+
+    `pack()` turns field values into `<action>:<base64>` of varint-packed fields, the issue
+    time and a truncated HMAC; payloads too large for Telegram's 64 bytes are kept in the
+    token registry and the button gets `<action>:~<token>`. `unpack()` returns a namedtuple
+    of the fields and raises CallbackDataError for foreign or tampered data, and
+    StaleCallbackData once the button is older than `ttl` seconds.
+    """
+
+    _actions: Dict[str, 'CallbackSchema'] = {}
+
+    def __init__(self, action: str, *fields: Tuple[str, str], ttl: int = None):
+        if not re.fullmatch(r'[a-z0-9]+', action):
+            raise ValueError(f"Callback action '{action}' must be lowercase letters and digits")
+        if action in self._actions:
+            raise ValueError(f"Callback action '{action}' is already used by another schema")
+        for name, kind in fields:
+            if kind not in _CODECS:
+                raise ValueError(f"Unsupported callback field type '{kind}' for '{name}'")
+        self._actions[action] = self
+        self.action = action
+        self.prefix = f"{action}:"
+        self.fields = fields
+        self.ttl = ttl
+        self.Data = namedtuple(f"{action.capitalize()}CallbackData", [name for name, _ in fields])
+
+    def _mac(self, payload: bytes) -> bytes:
+        return hmac.new(_KEY, self.prefix.encode() + payload, hashlib.sha256).digest()[:_MAC_SIZE]
+
+    def pack(self, *args, **kwargs) -> str:
+        values = self.Data(*args, **kwargs)
+        payload = bytearray()
+        _write_varint(payload, max(0, int(time.time()) - _EPOCH))
+        for (_, kind), value in zip(self.fields, values):
+            _CODECS[kind][0](payload, value)
+        payload = bytes(payload)
+
+        encoded = base64.urlsafe_b64encode(payload + self._mac(payload)).rstrip(b'=').decode()
+        data = self.prefix + encoded
+        if len(data) <= MAX_CALLBACK_DATA:
+            return data
+        return self.prefix + _TOKEN_MARK + token_registry.issue(self.action, payload)
+
+    def unpack(self, data: str):
+        if not data or not data.startswith(self.prefix):
+            raise CallbackDataError(f"Not a '{self.action}' callback")
+        body = data[len(self.prefix):]
+        if body.startswith(_TOKEN_MARK):
+            payload = token_registry.resolve(self.action, body[1:])
+        else:
+            try:
+                raw = base64.urlsafe_b64decode(body + '=' * (-len(body) % 4))
+            except (binascii.Error, ValueError):
+                raise CallbackDataError("Callback data is not valid base64")
+            payload, mac = raw[:-_MAC_SIZE], raw[-_MAC_SIZE:]
+            if len(mac) != _MAC_SIZE or not hmac.compare_digest(mac, self._mac(payload)):
+                raise CallbackDataError("Callback data signature mismatch")
+
+        reader = _Reader(payload)
+        issued_at = reader.varint() + _EPOCH
+        values = [_CODECS[kind][1](reader) for _, kind in self.fields]
+        if reader.pos != len(payload):
+            raise CallbackDataError("Trailing bytes in callback data")
+        if self.ttl is not None and time.time() - issued_at > self.ttl:
+            raise StaleCallbackData(f"'{self.action}' button expired")
+        return self.Data(*values)
+
+    def __repr__(self):
+        return f"<CallbackSchema {self.action}>"
+
+
+def callback_identity(data: Optional[str]):
+    """What a button does, without the issue time, signature or token that change with every pack()."""
+    action, sep, body = (data or '').partition(':')
+    if not sep or action not in CallbackSchema._actions:
+        return data
+    try:
+        if body.startswith(_TOKEN_MARK):
+            payload = token_registry.resolve(action, body[1:])
+        else:
+            payload = base64.urlsafe_b64decode(body + '=' * (-len(body) % 4))[:-_MAC_SIZE]
+        reader = _Reader(payload)
+        reader.varint()
+    except (CallbackDataError, binascii.Error, ValueError):
+        return data
+    return action, payload[reader.pos:]
+
+
+# Client
+CONNECTION = CallbackSchema('cn', ('connection_id', 'str'))
+RESTART_CONNECTION = CallbackSchema('rc', ('connection_id', 'str'), ('proxy_id', 'str'))
+
+# Payment flow; the selection travels with the buttons instead of being read back from the FSM
+SELECT_CONNECTION_FOR_PAYMENT = CallbackSchema(
+    'sp', ('connection_id', 'str'), ('user_id', 'int'), ('selected', 'strs'), ttl=CALLBACK_DATA_TTL
+)
+PAY_SELECTED = CallbackSchema('ps', ('connection_ids', 'strs'), ttl=CALLBACK_DATA_TTL)
+TOGGLE_CONNECTION = CallbackSchema('tc', ('connection_id', 'str'), ttl=CALLBACK_DATA_TTL)
+CHANGE_DAYS = CallbackSchema('cd', ('days', 'int'), ttl=CALLBACK_DATA_TTL)
+
+# Admin
+PAYMENT_DECISION = CallbackSchema('pd', ('payment_id', 'int'), ('confirm', 'bool'))
+# Keyset cursors: the page after `after_id`, or before `before_id`, of the clients matching `search`
+CLIENT_PAGE = CallbackSchema(
+    'cp', ('is_active', 'bool'), ('page', 'int'), ('after_id', 'int'), ('before_id', 'int'), ('search', 'str')
+)
+CLIENT = CallbackSchema('cl', ('client_id', 'int'))
@@ -1,7 +1,7 @@
 # src/utils/helpers.py
 
 from src.db.models.db_models import User
-from src.bot.bot_setup import bot, client_message_mapping
+from src.bot.bot_setup import outbound, message_mappings
 from ..bot.config import ADMIN_CHAT_ID
 import logging
 import pytz
@@ -17,17 +17,17 @@ async def forward_message_to_admin(message):
         else:
             forwarded_message_text = f"{client_name} (Chat ID: {client_chat_id})\n{message.text}"
 
-        forwarded_message = await bot.send_message(chat_id=ADMIN_CHAT_ID, text=forwarded_message_text)
-        client_message_mapping[forwarded_message.message_id] = message
+        forwarded_message = await outbound.send_message(ADMIN_CHAT_ID, forwarded_message_text)
+        message_mappings.remember(forwarded_message.message_id, message.chat.id, message.message_id)
     except Exception as e:
         logging.exception(f"Error forwarding message to admin: {e}")
 
 async def send_reply_to_client(message):
     try:
-        if message.reply_to_message and message.reply_to_message.message_id in client_message_mapping:
-            client_message = client_message_mapping[message.reply_to_message.message_id]
+        client_message = await message_mappings.get(message.reply_to_message.message_id) if message.reply_to_message else None
+        if client_message:
             reply_text = f"Admin: {message.text}"
-            await bot.send_message(chat_id=client_message.chat.id, text=reply_text)
+            await outbound.send_message(client_message.user_chat_id, reply_text)
         else:
             logging.warning("Received admin message without a valid reply_to_message")
     except Exception as e:
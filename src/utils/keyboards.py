@@ -1,11 +1,64 @@
+import functools
 import types
-from typing import Dict, List
+from typing import Dict, List, Optional
 
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton, Message
+from aiogram.utils.exceptions import MessageNotModified
 
 from src.db.models.db_models import DBProxyConnection
 from src.utils.payment_utils import calculate_payment_amount
+from src.utils.callback_data import (
+    RESTART_CONNECTION, SELECT_CONNECTION_FOR_PAYMENT, PAY_SELECTED, TOGGLE_CONNECTION, CHANGE_DAYS, callback_identity
+)
+from src.utils.metrics import registry
+
+KEYBOARD_EDITS = registry.counter(
+    'bot_keyboard_edits_total', 'Inline keyboard re-renders, by whether the edit was sent or skipped as unchanged', ['result']
+)
+
+
+def prebuilt(builder):
+    """Builds a static keyboard once and serves it as the JSON the Bot API receives.
+
+    The markup is neither rebuilt nor re-serialized per message; aiogram passes a string
+    reply_markup through as is.
+    """
+    serialized = None
+
+    @functools.wraps(builder)
+    def wrapper():
+        nonlocal serialized
+        if serialized is None:
+            serialized = builder().as_json()
+        return serialized
+    return wrapper
+
+
+def markup_fingerprint(markup: Optional[InlineKeyboardMarkup]):
+    """What an inline keyboard shows and does, ignoring the parts of callback data that change per render."""
+    if markup is None:
+        return None
+    return tuple(
+        tuple((button.text, callback_identity(button.callback_data), button.url) for button in row)
+        for row in markup.inline_keyboard
+    )
+
+
+async def edit_reply_markup(message: Message, markup: InlineKeyboardMarkup) -> bool:
+    """Replaces the inline keyboard of a message unless nothing visible changed; True if it was edited."""
+    if markup_fingerprint(message.reply_markup) == markup_fingerprint(markup):
+        KEYBOARD_EDITS.inc(result='skipped')
+        return False
+    try:
+        await message.edit_reply_markup(reply_markup=markup)
+    except MessageNotModified:
+        KEYBOARD_EDITS.inc(result='skipped')
+        return False
+    KEYBOARD_EDITS.inc(result='edited')
+    return True
+
 
+@prebuilt
 def client_main_menu():
     keyboard = ReplyKeyboardMarkup(
         resize_keyboard=True,
@@ -19,6 +72,7 @@ def client_main_menu():
     )
     return keyboard
 
+@prebuilt
 def admin_main_menu():
     keyboard = ReplyKeyboardMarkup(
         resize_keyboard=True,
@@ -31,6 +85,7 @@ def admin_main_menu():
     )
     return keyboard
 
+@prebuilt
 def info_keyboard():
     keyboard = InlineKeyboardMarkup(row_width=1)
     keyboard.add(
@@ -102,7 +157,7 @@ def generate_days_keyboard(
         is_selected = CHECK_MARK if connection_id in selected_connection_ids else CROSS_MARK
         connection_price = calculate_payment_amount(days)  # Assuming this function returns the price for the given days
         button_text = f"{is_selected} {login}: {current_end_date.strftime('%Y-%m-%d')} -> {new_end_date.strftime('%Y-%m-%d')} ({days} days, Price: {connection_price}$)"
-        keyboard.add(InlineKeyboardButton(text=button_text, callback_data=f'toggle_connection:{connection_id}'))
+        keyboard.add(InlineKeyboardButton(text=button_text, callback_data=TOGGLE_CONNECTION.pack(connection_id)))
 
     # Define button texts and values
     button_texts = [
@@ -116,13 +171,13 @@ def generate_days_keyboard(
 
     # Add buttons in two-column format
     for i in range(0, len(button_texts) - 1, 2):
-        button_left = InlineKeyboardButton(text=button_texts[i][0], callback_data=f'change_days:{button_texts[i][1]}')
-        button_right = InlineKeyboardButton(text=button_texts[i + 1][0], callback_data=f'change_days:{button_texts[i + 1][1]}')
+        button_left = InlineKeyboardButton(text=button_texts[i][0], callback_data=CHANGE_DAYS.pack(button_texts[i][1]))
+        button_right = InlineKeyboardButton(text=button_texts[i + 1][0], callback_data=CHANGE_DAYS.pack(button_texts[i + 1][1]))
         keyboard.row(button_left, button_right)
 
     # If there's an odd number of buttons, add the last one centered
     if len(button_texts) % 2 != 0:
-        last_button = InlineKeyboardButton(text=button_texts[-1][0], callback_data=f'change_days:{button_texts[-1][1]}')
+        last_button = InlineKeyboardButton(text=button_texts[-1][0], callback_data=CHANGE_DAYS.pack(button_texts[-1][1]))
         keyboard.add(last_button)
 
     # Add the reset button
@@ -138,7 +193,7 @@ def generate_days_keyboard(
 def generate_connection_menu_keyboard(connection_id: str, proxy_id: str) -> InlineKeyboardMarkup:
     keyboard = InlineKeyboardMarkup(row_width=1)
     # Add Restart Connection button with callback data containing connection_id and proxy_id
-    keyboard.add(InlineKeyboardButton(text="🔄 Restart Connection", callback_data=f"restart_connection:{connection_id}:{proxy_id}"))
+    keyboard.add(InlineKeyboardButton(text="🔄 Restart Connection", callback_data=RESTART_CONNECTION.pack(connection_id, proxy_id or '')))
     
     # You can add more buttons here
     # keyboard.add(InlineKeyboardButton(text="Another Action", callback_data=f"another_action:{connection_id}:{proxy_id}"))
@@ -153,18 +208,18 @@ def generate_connection_selection_keyboard(connections: List[DBProxyConnection],
     keyboard = InlineKeyboardMarkup(row_width=1)
     for connection in connections:
         is_selected = '✅' if connection.id in selected_ids else '❌'
-        callback_data = f"select_connection_for_payment:{connection.id}:{user_id}"
+        callback_data = SELECT_CONNECTION_FOR_PAYMENT.pack(connection.id, user_id, selected_ids)
         button_text = f"{is_selected} {connection.login} ({connection.connection_type})"
         keyboard.add(InlineKeyboardButton(text=button_text, callback_data=callback_data))
 
-    keyboard.add(InlineKeyboardButton(text="Pay", callback_data="pay_selected_connections"))
+    keyboard.add(InlineKeyboardButton(text="Pay", callback_data=PAY_SELECTED.pack(selected_ids)))
     return keyboard
 
 def generate_connection_selection_for_period_keyboard(connections: List[DBProxyConnection], selected_ids: List[str]) -> InlineKeyboardMarkup:
     keyboard = InlineKeyboardMarkup(row_width=1)
     for connection in connections:
         is_selected = '✅' if connection.id in selected_ids else '❌'
-        callback_data = f"toggle_connection:{connection.id}"
+        callback_data = TOGGLE_CONNECTION.pack(connection.id)
         button_text = f"{is_selected} {connection.login} ({connection.connection_type})"
         keyboard.add(InlineKeyboardButton(text=button_text, callback_data=callback_data))
 
@@ -0,0 +1,244 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.utils.exceptions import RetryAfter
+
+from src.bot.config import (
+    OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_INTERVAL, OUTBOUND_GROUP_INTERVAL, OUTBOUND_CONCURRENCY,
+    OUTBOUND_MAX_RETRIES, OUTBOUND_DRAIN_TIMEOUT
+)
+from src.services.providerHttpClient import TokenBucket
+from src.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first
+PRIORITY_PAYMENT = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_BULK = 2
+
+OUTBOUND_SENT = registry.counter('bot_outbound_messages_total', 'Outbound Telegram calls, by result', ['result'])
+OUTBOUND_RETRY_AFTER = registry.counter('bot_outbound_retry_after_total', 'RetryAfter (flood control) responses')
+
+
+class OutboundJob:
+    __slots__ = ('priority', 'seq', 'chat_id', 'method', 'kwargs', 'future', 'attempts')
+
+    def __init__(self, priority: int, seq: int, chat_id: int, method: str, kwargs: Dict[str, Any], future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.method = method
+        self.kwargs = kwargs
+        self.future = future
+        self.attempts = 0
+
+    def __lt__(self, other: 'OutboundJob') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundDispatcher:
+    """Sends Bot API calls through a priority queue under Telegram's flood limits.
+
+    Every chat has its own queue, ordered by priority and then arrival, and at most one call in
+    flight; after a call the chat cools down for `chat_interval` seconds (`group_interval` for
+    groups). Chats whose next call may go out are served in priority order, and all calls share
+    a global token bucket. A RetryAfter pauses sending for the requested time and the call is
+    retried, so callers only see it after `max_retries` attempts.
+
+    `send` waits for the call and returns its result; `post` queues it and returns the future.
+    """
+
+    def __init__(self, bot: Bot, global_rate: float = OUTBOUND_GLOBAL_RATE, chat_interval: float = OUTBOUND_CHAT_INTERVAL,
+                 group_interval: float = OUTBOUND_GROUP_INTERVAL, concurrency: int = OUTBOUND_CONCURRENCY,
+                 max_retries: int = OUTBOUND_MAX_RETRIES):
+        self.bot = bot
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(global_rate, max(1, int(global_rate)))
+        self.concurrency = concurrency
+        self._seq = itertools.count()
+        self._queues: Dict[int, List[OutboundJob]] = {}
+        # (priority, seq, chat_id) of chats that may send now; an entry is valid while it matches _tickets
+        self._ready: List[Tuple[int, int, int]] = []
+        self._tickets: Dict[int, Tuple[int, int, int]] = {}
+        # Chats with a call in flight or cooling down, and (until, chat_id) of the cooling ones
+        self._busy: Set[int] = set()
+        self._cooling: List[Tuple[float, int]] = []
+        self._cooling_until: Dict[int, float] = {}
+        self._paused_until = 0.0
+        self._pending = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: Set[asyncio.Task] = set()
+        registry.gauge('bot_outbound_queue_size', 'Outbound calls waiting to be sent',
+                       callback=lambda: {(): self._pending})
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def post(self, method: str, chat_id: int, priority: int = PRIORITY_DEFAULT, **kwargs) -> asyncio.Future:
+        """Queues `bot.<method>(chat_id=chat_id, **kwargs)` without waiting; failures are logged."""
+        future = self._enqueue(method, chat_id, priority, kwargs)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    async def send(self, method: str, chat_id: int, priority: int = PRIORITY_DEFAULT, **kwargs):
+        """Queues `bot.<method>(chat_id=chat_id, **kwargs)` and returns its result once sent."""
+        return await self._enqueue(method, chat_id, priority, kwargs)
+
+    async def send_message(self, chat_id: int, text: str, priority: int = PRIORITY_DEFAULT, **kwargs):
+        return await self.send('send_message', chat_id, priority, text=text, **kwargs)
+
+    def _enqueue(self, method: str, chat_id: int, priority: int, kwargs: Dict[str, Any]) -> asyncio.Future:
+        self._ensure_worker()
+        job = OutboundJob(priority, next(self._seq), chat_id, method, kwargs, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queues.setdefault(chat_id, []), job)
+        self._pending += 1
+        self._schedule(chat_id)
+        return job.future
+
+    def _schedule(self, chat_id: int):
+        """Makes the head of the chat's queue eligible, unless the chat is busy or cooling down."""
+        queue = self._queues.get(chat_id)
+        if not queue or chat_id in self._busy:
+            return
+        head = queue[0]
+        ticket = (head.priority, head.seq, chat_id)
+        current = self._tickets.get(chat_id)
+        if current is None or ticket < current:
+            self._tickets[chat_id] = ticket
+            heapq.heappush(self._ready, ticket)
+            self._wakeup.set()
+
+    def _ensure_worker(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._task = asyncio.create_task(self._run())
+
+    def _release_cooled(self, now: float):
+        while self._cooling and self._cooling[0][0] <= now:
+            until, chat_id = heapq.heappop(self._cooling)
+            if self._cooling_until.get(chat_id) != until:
+                continue  # Superseded by a longer cooldown
+            del self._cooling_until[chat_id]
+            self._busy.discard(chat_id)
+            if self._queues.get(chat_id):
+                self._schedule(chat_id)
+            else:
+                self._queues.pop(chat_id, None)
+
+    def _next_job(self) -> Optional[OutboundJob]:
+        while self._ready:
+            ticket = heapq.heappop(self._ready)
+            chat_id = ticket[2]
+            if self._tickets.get(chat_id) != ticket:
+                continue
+            del self._tickets[chat_id]
+            self._busy.add(chat_id)
+            self._pending -= 1
+            return heapq.heappop(self._queues[chat_id])
+        return None
+
+    def _cool_down(self, chat_id: int, seconds: float):
+        until = time.monotonic() + seconds
+        if until > self._cooling_until.get(chat_id, 0.0):
+            self._cooling_until[chat_id] = until
+            heapq.heappush(self._cooling, (until, chat_id))
+        self._busy.add(chat_id)
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._release_cooled(now)
+            job = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                timeout = self._cooling[0][0] - now if self._cooling else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self.bucket.acquire()
+            await self._slots.acquire()
+            task = asyncio.create_task(self._deliver(job))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _deliver(self, job: OutboundJob):
+        cool_down = 0.0
+        try:
+            if job.future.cancelled():
+                return
+            job.attempts += 1
+            cool_down = self.group_interval if job.chat_id < 0 else self.chat_interval
+            try:
+                result = await getattr(self.bot, job.method)(chat_id=job.chat_id, **job.kwargs)
+            except RetryAfter as e:
+                OUTBOUND_RETRY_AFTER.inc()
+                cool_down = e.timeout
+                if job.attempts > self.max_retries:
+                    OUTBOUND_SENT.inc(result='failed')
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                    return
+                logger.warning(f"Flood control on chat {job.chat_id}, pausing outbound calls for {e.timeout}s")
+                self._paused_until = max(self._paused_until, time.monotonic() + e.timeout)
+                # Back to the front of the chat's queue, the chat waits out the same delay
+                heapq.heappush(self._queues.setdefault(job.chat_id, []), job)
+                self._pending += 1
+            except Exception as e:
+                OUTBOUND_SENT.inc(result='failed')
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                OUTBOUND_SENT.inc(result='sent')
+                if not job.future.done():
+                    job.future.set_result(result)
+        finally:
+            # Every path has to release the chat, or its queue never drains
+            self._cool_down(job.chat_id, cool_down)
+            self._slots.release()
+
+    @staticmethod
+    def _log_failure(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Outbound call failed: {future.exception()}")
+
+    async def stop(self, timeout: float = OUTBOUND_DRAIN_TIMEOUT):
+        """Gives queued calls up to `timeout` seconds to go out, then cancels the rest."""
+        if self._task is None:
+            return
+        deadline = time.monotonic() + timeout
+        while (self._pending or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        self._task.cancel()
+        await asyncio.gather(self._task, *self._in_flight, return_exceptions=True)
+        self._task = None
+        for queue in self._queues.values():
+            for job in queue:
+                job.future.cancel()
+        if self._pending:
+            logger.warning(f"Dropped {self._pending} outbound calls on shutdown")
+        self._queues.clear()
+        self._ready.clear()
+        self._tickets.clear()
+        self._busy.clear()
+        self._cooling.clear()
+        self._cooling_until.clear()
+        self._pending = 0
@@ -2,8 +2,10 @@ from typing import Dict, List, Tuple
 from aiogram import Bot, types
 from datetime import datetime, timedelta
 from src.bot.config import ADMIN_CHAT_ID
-from src.bot.bot_setup import database
+from src.bot.bot_setup import database, outbound
 from src.db.models.db_models import DBProxyConnection, Payment
+from src.utils.outbound import PRIORITY_PAYMENT
+from src.utils.callback_data import PAYMENT_DECISION
 from aiogram.dispatcher import FSMContext
 
 from typing import List, Dict
@@ -14,8 +16,6 @@ from aiogram.dispatcher import FSMContext
 admin_state_data = {}
 
 async def send_payment_confirmation_message_to_admin(payment_list: List[Payment], txid: str, selected_connection_days: Dict[int, int]):
-    bot = Bot.get_current()
-
     if not payment_list:
         return
 
@@ -28,7 +28,7 @@ async def send_payment_confirmation_message_to_admin(payment_list: List[Payment]
         message_text += f"Payment ID: {payment.id}\n"
         message_text += f"Connection login: {connection.login}\n"
         message_text += f"Amount: {payment.amount}\n"
-        message_text += f"User: {payment.user_payments.username}\n"
+        message_text += f"User: {payment.user.username}\n"
         message_text += f"Connection ID: {connection.id}\n"
         message_text += f"Current Expiration Date: {connection.expiration_date.strftime('%d/%m/%Y') if connection.expiration_date else 'N/A'}\n"
         message_text += f"New Expiration Date: {new_expiration_date.strftime('%d/%m/%Y')}\n\n"
@@ -43,14 +43,14 @@ async def send_payment_confirmation_message_to_admin(payment_list: List[Payment]
         payment_ids.append(payment.id)
         markup.add(
             types.InlineKeyboardButton(
-                text=f"Confirm Payment {payment.id}", callback_data=f"confirm_payment:{payment.id}"
+                text=f"Confirm Payment {payment.id}", callback_data=PAYMENT_DECISION.pack(payment.id, True)
             ),
             types.InlineKeyboardButton(
-                text=f"Decline Payment {payment.id}", callback_data=f"decline_payment:{payment.id}"
+                text=f"Decline Payment {payment.id}", callback_data=PAYMENT_DECISION.pack(payment.id, False)
             ),
         )
 
-    sent_message = await bot.send_message(admin_chat_id, message_text, reply_markup=markup)
+    sent_message = await outbound.send_message(admin_chat_id, message_text, PRIORITY_PAYMENT, reply_markup=markup)
 
     # Store the message ID, chat ID, original message text, and payment IDs in the shared storage
     admin_state_data['admin_message_id'] = sent_message.message_id
@@ -64,27 +64,24 @@ async def send_payment_confirmation_message_to_admin(payment_list: List[Payment]
 
 
 async def send_payment_status_message_to_user(user, payment):
-    bot = Bot.get_current()
     if payment.status == 'confirmed':
         message_text = f"✅ Payment {payment.id} confirmed.\nConnection: {payment.connection.login}\nPrice: {payment.amount}\nExpiration date: {payment.start_date.strftime('%d/%m/%Y')} -> {payment.end_date.strftime('%d/%m/%Y')}"
     elif payment.status == 'declined':
         message_text = f"❌ Payment {payment.id} declined.\nConnection: {payment.connection.login}\nPrice: {payment.amount}"
     else:
         message_text = f"The status of your payment of {payment.amount} is {payment.status}."
-    await bot.send_message(user.telegram_chat_id, message_text)
+    await outbound.send_message(user.telegram_chat_id, message_text, PRIORITY_PAYMENT)
 
 async def send_final_decision_to_admin(payment, final_status):
     admin_chat_id = ADMIN_CHAT_ID
-    bot = Bot.get_current()
 
     message_text = f"Final decision:\n"
     message_text += f"{final_status} Payment {payment.id}.\n"
 
-    await bot.send_message(admin_chat_id, message_text)
+    await outbound.send_message(admin_chat_id, message_text, PRIORITY_PAYMENT)
 
 async def send_payment_notification_to_admin(payment, status):
     admin_chat_id = ADMIN_CHAT_ID
-    bot = Bot.get_current()
 
     if status == 'confirmed':
         message_text = f"✅ Payment {payment.id} confirmed.\n"
@@ -102,7 +99,7 @@ async def send_payment_notification_to_admin(payment, status):
         message_text += f"Start Date: {payment.start_date.strftime('%d/%m/%Y')}\n"
         message_text += f"End Date: {payment.end_date.strftime('%d/%m/%Y')}\n"
 
-    await bot.send_message(admin_chat_id, message_text)
+    await outbound.send_message(admin_chat_id, message_text, PRIORITY_PAYMENT)
 
 def calculate_payment_amount(days):
     # Define the prices for different durations
@@ -125,6 +122,10 @@ def calculate_payment_amount(days):
 
     return round(total_cost, 2)
 
+def calculate_selection_amount(connection_ids: List[str], days: Dict[str, int]) -> float:
+    """Total price of the selected connections; prices only depend on the days, so no rows are needed."""
+    return sum(calculate_payment_amount(days.get(connection_id, 0)) for connection_id in connection_ids)
+
 def calculate_total_payment_amount(connections: List[DBProxyConnection], days: Dict[str, int]) -> Tuple[float, List[Tuple[DBProxyConnection, float]]]:
     total_amount = 0.0
     payment_items = []
@@ -1,16 +1,19 @@
 from datetime import datetime
 from typing import List, Tuple
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-import requests
 
 from src.bot.bot_setup import bot
 from src.bot.config import BASE_API_URL, AUTH_HEADER
+from src.services.providerHttpClient import get_provider_client
+from src.utils.callback_data import CONNECTION
 from src.db.repositories.connection_repositories import ConnectionRepository 
 from src.db.models.db_models import User, DBProxy, DBProxyConnection
 from src.db.repositories.user_repositories import UserRepository
 
 user_selections = {}  # Store user proxy selections
 
+iproxy_client = get_provider_client("iproxy-token", BASE_API_URL, AUTH_HEADER)
+
 # async def send_proxies(chat_id: int, proxies: List[DBProxy]):
 #     buttons = [
 #         InlineKeyboardButton(
@@ -27,14 +30,13 @@ user_selections = {}  # Store user proxy selections
 async def send_proxies(chat_id: int, connections: List[DBProxyConnection]):  
     buttons = []
     for connection in connections:
-        proxy = connection.proxy 
         days_left = (connection.expiration_date - datetime.now()).days  # Calculate days left
         button_text = (
             f"{connection.login} | "
             f"{connection.expiration_date.strftime('%d/%m/%Y')} | "
             f"{days_left} days left" 
         )
-        callback_data = f"connection_{connection.id}"  # Include connection ID
+        callback_data = CONNECTION.pack(connection.id)
 
         button = InlineKeyboardButton(text=button_text, callback_data=callback_data)
         buttons.append(button)
@@ -43,16 +45,16 @@ async def send_proxies(chat_id: int, connections: List[DBProxyConnection]):
     await bot.send_message(chat_id=chat_id, text="Your Connections:", reply_markup=keyboard)
 
 async def get_connections():
-    response = requests.get(f"{BASE_API_URL}/connections", headers=AUTH_HEADER)
-    return response.json()["result"]
+    _, payload = await iproxy_client.get("connections")
+    return payload["result"]
 
 async def get_connection_info(connection_id):
-    response = requests.get(f"{BASE_API_URL}/connections/{connection_id}", headers=AUTH_HEADER)
-    return response.json()["result"]
+    _, payload = await iproxy_client.get(f"connections/{connection_id}")
+    return payload["result"]
 
 async def get_proxies(connection_id):
-    response = requests.get(f"{BASE_API_URL}/connections/{connection_id}/proxies", headers=AUTH_HEADER)
-    return response.json()["result"]
+    _, payload = await iproxy_client.get(f"connections/{connection_id}/proxies")
+    return payload["result"]
 
 def toggle_proxy_selection(user_id, proxy_id):
     """Toggles proxy selection for a user."""
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledJob:
+    """A coroutine function run every `interval` seconds, +/- `jitter` (a fraction of the interval)."""
+
+    def __init__(self, name: str, func: Callable[[], Awaitable[Any]], interval: float,
+                 jitter: float = 0.0, initial_delay: float = 0.0):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.initial_delay = initial_delay
+
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.last_started_at: Optional[datetime] = None
+        self.last_duration: Optional[float] = None
+        self.last_outcome: Optional[str] = None
+        self.last_result: Any = None
+        self.next_run_at: Optional[float] = None  # time.monotonic() of the next planned run
+
+        self._trigger = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def next_delay(self) -> float:
+        spread = self.interval * self.jitter
+        return max(0.0, self.interval + random.uniform(-spread, spread))
+
+    def status(self) -> Dict[str, Any]:
+        next_in = None
+        if self.next_run_at is not None and not self.running:
+            next_in = max(0.0, self.next_run_at - time.monotonic())
+        return {
+            'name': self.name,
+            'interval': self.interval,
+            'running': self.running,
+            'runs': self.runs,
+            'failures': self.failures,
+            'last_started_at': self.last_started_at,
+            'last_duration': self.last_duration,
+            'last_outcome': self.last_outcome,
+            'last_result': self.last_result,
+            'next_in': next_in,
+        }
+
+
+class JobScheduler:
+    """Minimal in-process scheduler for periodic background jobs.
+
+    Every job has its own loop task, so jobs with different intervals never queue behind each
+    other, and a job never overlaps with itself: the next run is planned only once the current
+    one has finished. run_now() wakes a job up early; stop() cancels everything.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, ScheduledJob] = {}
+        self._started = False
+
+    def add_job(self, name: str, func: Callable[[], Awaitable[Any]], interval: float,
+                jitter: float = 0.0, initial_delay: float = 0.0) -> ScheduledJob:
+        if name in self._jobs:
+            raise ValueError(f"Job '{name}' is already registered")
+        job = ScheduledJob(name, func, interval, jitter, initial_delay)
+        self._jobs[name] = job
+        if self._started:
+            job._task = asyncio.create_task(self._loop(job))
+        return job
+
+    def get_job(self, name: str) -> Optional[ScheduledJob]:
+        return self._jobs.get(name)
+
+    @property
+    def jobs(self) -> List[ScheduledJob]:
+        return list(self._jobs.values())
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        for job in self._jobs.values():
+            job._task = asyncio.create_task(self._loop(job))
+
+    async def stop(self):
+        self._started = False
+        tasks = [job._task for job in self._jobs.values() if job._task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for job in self._jobs.values():
+            job._task = None
+
+    def run_now(self, name: str) -> bool:
+        """Triggers a job immediately. Returns False if it is unknown or already running."""
+        job = self._jobs.get(name)
+        if job is None or job.running:
+            return False
+        job._trigger.set()
+        return True
+
+    def status(self) -> List[Dict[str, Any]]:
+        return [job.status() for job in self._jobs.values()]
+
+    async def _loop(self, job: ScheduledJob):
+        delay = job.initial_delay
+        while True:
+            job.next_run_at = time.monotonic() + delay
+            try:
+                await asyncio.wait_for(job._trigger.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            job._trigger.clear()
+            await self._run(job)
+            delay = job.next_delay()
+
+    async def _run(self, job: ScheduledJob):
+        job.running = True
+        job.last_started_at = datetime.now()
+        started = time.monotonic()
+        try:
+            job.last_result = await job.func()
+            job.last_outcome = 'ok'
+        except asyncio.CancelledError:
+            job.last_outcome = 'cancelled'
+            raise
+        except Exception as e:
+            job.failures += 1
+            job.last_result = None
+            job.last_outcome = f"error: {e}"
+            logger.exception(f"Job {job.name} failed")
+        finally:
+            job.running = False
+            job.runs += 1
+            job.last_duration = time.monotonic() - started
+            logger.info(f"Job {job.name} finished in {job.last_duration:.2f}s: {job.last_outcome}")
+
+
+scheduler = JobScheduler()
@@ -0,0 +1,9 @@
+import os
+
+# src.bot.config reads these at import time
+os.environ.setdefault('DATABASE_TYPE', 'aws')
+os.environ.setdefault('ADMIN_CHAT_ID', '1000')
+os.environ.setdefault('TG_BOT_TOKEN', '123456:test')
+os.environ.setdefault('IPROXY_API_KEY', 'test')
+os.environ.setdefault('LOCALTONET_API_KEY', 'test')
+os.environ.setdefault('PROVIDER_RATE_LIMIT', '0')
@@ -0,0 +1,93 @@
+import asyncio
+import types
+from contextlib import asynccontextmanager
+
+import pytest
+
+from src.services.broadcast import Broadcast, BroadcastSegment
+
+
+class FakeUserRepository:
+    def __init__(self, recipients):
+        self.recipients = recipients
+
+    async def count_recipients(self, criteria):
+        return len(self.recipients)
+
+    async def get_recipients_batch(self, criteria, after_id, limit):
+        return [recipient for recipient in self.recipients if recipient.id > after_id][:limit]
+
+    async def deactivate_users(self, users):
+        return len(users)
+
+
+class FakeDatabase:
+    def __init__(self, recipients):
+        self.repository = FakeUserRepository(recipients)
+
+    @asynccontextmanager
+    async def get_user_repository(self):
+        yield self.repository
+
+
+class FakeOutbound:
+    """Records the admin's status texts; copies wait for `gate`."""
+
+    def __init__(self):
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.statuses = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.statuses.append(text)
+        return types.SimpleNamespace(message_id=1)
+
+    async def send(self, method, chat_id, priority=None, **kwargs):
+        if method == 'edit_message_text':
+            self.statuses.append(kwargs['text'])
+        else:
+            await self.gate.wait()
+
+
+def _recipients(count):
+    return [types.SimpleNamespace(id=n, telegram_chat_id=100 + n) for n in range(1, count + 1)]
+
+
+@pytest.mark.parametrize('args, service_name', [('provider iproxy', 'ipr'), ('provider Localtonet', 'ltn'), ('provider ipr', 'ipr')])
+def test_provider_segments_use_stored_codes(args, service_name):
+    assert BroadcastSegment.parse(args).service_name == service_name
+
+
+def test_unknown_provider_is_rejected():
+    with pytest.raises(ValueError):
+        BroadcastSegment.parse('provider foo')
+
+
+def test_final_status_is_finished():
+    async def scenario():
+        outbound = FakeOutbound()
+        broadcast = Broadcast(FakeDatabase(_recipients(3)), outbound, BroadcastSegment('all'), 1, 1, batch_size=2)
+        broadcast.start()
+        await broadcast._task
+        return broadcast, outbound
+
+    broadcast, outbound = asyncio.run(scenario())
+    assert broadcast.delivered == 3
+    assert '(finished)' in outbound.statuses[-1]
+    assert '(finished)' in broadcast.summary()
+
+
+def test_final_status_is_cancelled():
+    async def scenario():
+        outbound = FakeOutbound()
+        outbound.gate.clear()
+        broadcast = Broadcast(FakeDatabase(_recipients(3)), outbound, BroadcastSegment('all'), 1, 1)
+        broadcast.start()
+        while not outbound.statuses:
+            await asyncio.sleep(0)
+        broadcast.cancel()
+        await asyncio.gather(broadcast._task, return_exceptions=True)
+        return outbound
+
+    outbound = asyncio.run(scenario())
+    assert '(cancelled)' in outbound.statuses[-1]
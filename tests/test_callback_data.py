@@ -0,0 +1,111 @@
+import asyncio
+import base64
+
+import pytest
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+from src.utils import callback_data
+from src.utils.callback_data import (
+    MAX_CALLBACK_DATA, CallbackDataError, CallbackSchema, CallbackTokenRegistry, StaleCallbackData,
+    callback_identity, token_registry
+)
+
+SAMPLE = CallbackSchema('tsample', ('count', 'int'), ('flag', 'bool'), ('name', 'str'), ('ids', 'strs'))
+SHORT_LIVED = CallbackSchema('tshort', ('count', 'int'), ttl=60)
+
+
+def test_round_trip():
+    data = SAMPLE.pack(-3, True, 'Zoë', ('0a1b2c3d', 'plain'))
+    assert len(data) <= MAX_CALLBACK_DATA
+    assert SAMPLE.unpack(data) == SAMPLE.Data(-3, True, 'Zoë', ('0a1b2c3d', 'plain'))
+
+
+def test_tampered_data_is_rejected():
+    data = SAMPLE.pack(1, False, 'a', ())
+    prefix, body = data.split(':')
+    raw = bytearray(base64.urlsafe_b64decode(body + '=' * (-len(body) % 4)))
+    raw[1] ^= 1
+    tampered = f"{prefix}:{base64.urlsafe_b64encode(bytes(raw)).rstrip(b'=').decode()}"
+    with pytest.raises(CallbackDataError):
+        SAMPLE.unpack(tampered)
+
+
+@pytest.mark.parametrize('data', ['tsample:', 'tsample:!!!', 'tshort:AAAA', 'other:AAAA', None])
+def test_garbage_is_rejected(data):
+    with pytest.raises(CallbackDataError):
+        SAMPLE.unpack(data)
+
+
+def test_data_of_another_action_is_rejected():
+    with pytest.raises(CallbackDataError):
+        SAMPLE.unpack(SHORT_LIVED.pack(1).replace('tshort:', 'tsample:'))
+
+
+def test_expired_buttons_are_stale(monkeypatch):
+    data = SHORT_LIVED.pack(5)
+    now = callback_data.time.time()
+    monkeypatch.setattr(callback_data.time, 'time', lambda: now + 120)
+    with pytest.raises(StaleCallbackData):
+        SHORT_LIVED.unpack(data)
+
+
+def test_duplicate_actions_are_refused():
+    with pytest.raises(ValueError):
+        CallbackSchema('tsample', ('count', 'int'))
+
+
+def test_oversized_payloads_use_a_token():
+    ids = tuple(f"connection-{n}" for n in range(10))
+    data = SAMPLE.pack(1, True, 'x', ids)
+    assert data.startswith('tsample:~')
+    assert len(data) <= MAX_CALLBACK_DATA
+    assert SAMPLE.unpack(data).ids == ids
+
+
+def test_identity_ignores_issue_time_and_token():
+    ids = tuple(f"connection-{n}" for n in range(10))
+    assert callback_identity(SAMPLE.pack(1, True, 'x', ids)) == callback_identity(SAMPLE.pack(1, True, 'x', ids))
+    assert callback_identity(SAMPLE.pack(1, True, 'x', ())) != callback_identity(SAMPLE.pack(2, True, 'x', ()))
+    assert callback_identity('plain_data') == 'plain_data'
+
+
+def test_evicted_tokens_are_stale():
+    registry = CallbackTokenRegistry(maxsize=1)
+    first = registry.issue('tsample', b'one')
+    registry.issue('tsample', b'two')
+    with pytest.raises(StaleCallbackData):
+        registry.resolve('tsample', first)
+
+
+def test_shared_tokens_resolve_on_another_replica():
+    async def scenario():
+        storage = MemoryStorage()
+        issuer, other = CallbackTokenRegistry(), CallbackTokenRegistry()
+        issuer.bind(storage)
+        other.bind(storage)
+        token = issuer.issue('tsample', b'payload')
+        await asyncio.gather(*issuer._writes)
+
+        await other.load(f"tsample:~{token}")
+        return other.resolve('tsample', token)
+
+    assert asyncio.run(scenario()) == b'payload'
+
+
+def test_shared_tokens_survive_a_restart():
+    ids = tuple(f"connection-{n}" for n in range(10))
+
+    async def scenario():
+        token_registry.bind(MemoryStorage())
+        try:
+            data = SAMPLE.pack(1, True, 'x', ids)
+            await asyncio.gather(*token_registry._writes)
+            token_registry._payloads.clear()
+            with pytest.raises(StaleCallbackData):
+                SAMPLE.unpack(data)
+            await token_registry.load(data)
+            return SAMPLE.unpack(data)
+        finally:
+            token_registry.bind(None)
+
+    assert asyncio.run(scenario()).ids == ids
@@ -0,0 +1,102 @@
+import asyncio
+import types
+from contextlib import asynccontextmanager
+
+from sqlalchemy import select
+
+from src.bot.fsm_storage import SQLStorage, dumps, loads
+from src.db.async_db import AsyncDatabaseService
+from src.db.models.db_models import FSMRecord, RUNTIME_MODELS
+
+
+class GatedSessions:
+    """Stands in for async_database.Session, which flushes use, so a flush can be held at the database or made to fail."""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.entered = asyncio.Event()
+        self.failures = 0
+
+    @asynccontextmanager
+    async def __call__(self):
+        self.entered.set()
+        await self.gate.wait()
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database unavailable")
+        async with self.factory() as session:
+            yield session
+
+
+async def _storage(tmp_path):
+    async_database = AsyncDatabaseService(url=f"sqlite+aiosqlite:///{tmp_path}/fsm.db")
+    await async_database.create_missing_tables(RUNTIME_MODELS)
+    sessions = GatedSessions(async_database.Session)
+    # Reads keep going through get_session
+    gated_database = types.SimpleNamespace(
+        Session=sessions, get_session=async_database.get_session, engine=async_database.engine
+    )
+    return async_database, sessions, SQLStorage(gated_database, flush_interval=0.01)
+
+
+async def _stored_state(async_database, sessions):
+    async with sessions.factory() as session:
+        return (await session.execute(select(FSMRecord.state))).scalar_one_or_none()
+
+
+def test_changes_stored_during_a_flush_are_flushed(tmp_path):
+    async def scenario():
+        async_database, sessions, storage = await _storage(tmp_path)
+        sessions.gate.clear()
+        sessions.entered.clear()
+        await storage.set_state(chat=1, user=1, state='A')
+        await sessions.entered.wait()
+        # The flush of 'A' is waiting for the database
+        await storage.set_state(chat=1, user=1, state='B')
+        sessions.gate.set()
+        await asyncio.sleep(0.2)
+        state, pending = await _stored_state(async_database, sessions), dict(storage._pending)
+        await storage.close()
+        await async_database.close()
+        return state, pending
+
+    state, pending = asyncio.run(scenario())
+    assert state == 'B'
+    assert pending == {}
+
+
+def test_failed_flush_is_retried(tmp_path):
+    async def scenario():
+        async_database, sessions, storage = await _storage(tmp_path)
+        sessions.failures = 1
+        await storage.set_state(chat=1, user=1, state='A')
+        await asyncio.sleep(0.2)
+        state = await _stored_state(async_database, sessions)
+        await storage.close()
+        await async_database.close()
+        return state
+
+    assert asyncio.run(scenario()) == 'A'
+
+
+def test_reads_see_unflushed_data(tmp_path):
+    async def scenario():
+        async_database, sessions, storage = await _storage(tmp_path)
+        await storage.update_data(chat=1, user=1, data={'step': 1})
+        await storage.update_data(chat=1, user=1, step=2, extra='x')
+        data = await storage.get_data(chat=1, user=1)
+        await storage.close()
+        await async_database.close()
+        return data
+
+    assert asyncio.run(scenario()) == {'step': 2, 'extra': 'x'}
+
+
+def test_dumps_round_trips_datetimes_and_decimals():
+    from datetime import date, datetime
+    from decimal import Decimal
+
+    data = {'when': datetime(2024, 5, 1, 12, 30), 'day': date(2024, 5, 1), 'amount': Decimal('9.90'), 'ids': ['a']}
+    assert loads(dumps(data)) == data
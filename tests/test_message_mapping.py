@@ -0,0 +1,120 @@
+import asyncio
+import logging
+from datetime import timedelta
+
+from sqlalchemy import insert
+
+from src.db.async_db import AsyncDatabaseService
+from src.db.message_mapping import MessageMappingStore
+from src.db.models.db_models import Base, ForwardedMessage, current_datetime_utc
+
+ADMIN_CHAT = 1000
+
+
+async def _database(tmp_path, create=True):
+    async_database = AsyncDatabaseService(url=f"sqlite+aiosqlite:///{tmp_path}/mappings.db")
+    if create:
+        await _create(async_database)
+    return async_database
+
+
+async def _create(async_database):
+    async with async_database.engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+def test_recent_forwards_are_served_from_the_lru():
+    async def scenario():
+        # No database: a hit must not query it
+        store = MessageMappingStore(async_database=None, maxsize=2)
+        store.remember(1, user_chat_id=10, user_message_id=100, admin_chat_id=ADMIN_CHAT)
+        store.remember(2, user_chat_id=20, admin_chat_id=ADMIN_CHAT)
+        first = await store.get(1, admin_chat_id=ADMIN_CHAT)
+        # 1 was used last, so 2 is evicted
+        store.remember(3, user_chat_id=30, admin_chat_id=ADMIN_CHAT)
+        return first, list(store._entries)
+
+    first, keys = asyncio.run(scenario())
+    assert (first.user_chat_id, first.user_message_id) == (10, 100)
+    assert keys == [(ADMIN_CHAT, 1), (ADMIN_CHAT, 3)]
+
+
+def test_miss_falls_back_to_the_database(tmp_path):
+    async def scenario():
+        async_database = await _database(tmp_path)
+        store = MessageMappingStore(async_database)
+        store.remember(1, user_chat_id=10, user_message_id=100, admin_chat_id=ADMIN_CHAT)
+        flushed = await store.flush()
+
+        # A restarted bot has an empty LRU
+        restarted = MessageMappingStore(async_database)
+        record = await restarted.get(1, admin_chat_id=ADMIN_CHAT)
+        missing = await restarted.get(2, admin_chat_id=ADMIN_CHAT)
+        cached = len(restarted)
+        await async_database.close()
+        return flushed, record, missing, cached
+
+    flushed, record, missing, cached = asyncio.run(scenario())
+    assert flushed == 1
+    assert (record.user_chat_id, record.user_message_id) == (10, 100)
+    assert missing is None
+    assert cached == 1
+
+
+def test_expired_mappings_are_ignored_and_cleaned_up(tmp_path):
+    async def scenario():
+        async_database = await _database(tmp_path)
+        now = current_datetime_utc()
+        async with async_database.engine.begin() as conn:
+            await conn.execute(insert(ForwardedMessage), [
+                {'admin_chat_id': ADMIN_CHAT, 'admin_message_id': 1, 'user_chat_id': 10, 'created_at': now - timedelta(days=8)},
+                {'admin_chat_id': ADMIN_CHAT, 'admin_message_id': 2, 'user_chat_id': 20, 'created_at': now - timedelta(days=6)},
+            ])
+        store = MessageMappingStore(async_database, ttl_days=7)
+        expired = await store.get(1, admin_chat_id=ADMIN_CHAT)
+        fresh = await store.get(2, admin_chat_id=ADMIN_CHAT)
+        removed = await store.cleanup()
+        await async_database.close()
+        return expired, fresh, removed
+
+    expired, fresh, removed = asyncio.run(scenario())
+    assert expired is None
+    assert fresh.user_chat_id == 20
+    assert removed == 1
+
+
+def test_failed_flush_is_retried(tmp_path):
+    async def scenario():
+        # The table doesn't exist yet, so the first flush fails
+        async_database = await _database(tmp_path, create=False)
+        store = MessageMappingStore(async_database)
+        store.remember(1, user_chat_id=10, admin_chat_id=ADMIN_CHAT)
+        failed = await store.flush()
+        store.remember(2, user_chat_id=20, admin_chat_id=ADMIN_CHAT)
+
+        await _create(async_database)
+        flushed = await store.flush()
+        record = await MessageMappingStore(async_database).get(1, admin_chat_id=ADMIN_CHAT)
+        await async_database.close()
+        return failed, flushed, record
+
+    failed, flushed, record = asyncio.run(scenario())
+    assert failed == 0
+    assert flushed == 2
+    assert record.user_chat_id == 10
+
+
+def test_failed_flush_drops_the_oldest_beyond_maxsize(tmp_path, caplog):
+    async def scenario():
+        async_database = await _database(tmp_path, create=False)
+        store = MessageMappingStore(async_database, maxsize=2)
+        for message_id in (1, 2, 3):
+            store.remember(message_id, user_chat_id=message_id * 10, admin_chat_id=ADMIN_CHAT)
+        await store.flush()
+        await async_database.close()
+        return [mapping['admin_message_id'] for mapping in store._pending]
+
+    with caplog.at_level(logging.WARNING, logger='src.db.message_mapping'):
+        pending = asyncio.run(scenario())
+    assert pending == [2, 3]
+    assert "Dropping 1 oldest forwarded message mappings" in caplog.text
@@ -0,0 +1,63 @@
+import asyncio
+
+from aiogram.utils.exceptions import RetryAfter
+
+from src.utils.outbound import OutboundDispatcher
+
+
+class FloodedBot:
+    """Answers the first `floods` calls with RetryAfter; calls wait for `gate` before answering."""
+
+    def __init__(self, floods: int):
+        self.floods = floods
+        self.calls = 0
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls += 1
+        await self.gate.wait()
+        if self.floods:
+            self.floods -= 1
+            raise RetryAfter(0)
+        self.sent.append((chat_id, text))
+        return text
+
+
+def _dispatcher(bot, max_retries):
+    return OutboundDispatcher(bot, global_rate=0, chat_interval=0, group_interval=0, max_retries=max_retries)
+
+
+def test_cancelled_caller_does_not_block_the_chat():
+    async def scenario():
+        bot = FloodedBot(floods=1)
+        outbound = _dispatcher(bot, max_retries=0)
+        bot.gate.clear()
+        future = outbound.post('send_message', 5, text='first')
+        while not bot.calls:
+            await asyncio.sleep(0)
+        # The caller gives up while the call is in flight; the final RetryAfter then finds it cancelled
+        future.cancel()
+        bot.gate.set()
+
+        result = await asyncio.wait_for(outbound.send_message(5, 'second'), timeout=1)
+        await outbound.stop(timeout=0)
+        return bot, result
+
+    bot, result = asyncio.run(scenario())
+    assert result == 'second'
+    assert bot.sent == [(5, 'second')]
+
+
+def test_retry_after_is_retried_until_sent():
+    async def scenario():
+        bot = FloodedBot(floods=2)
+        outbound = _dispatcher(bot, max_retries=3)
+        result = await asyncio.wait_for(outbound.send_message(5, 'hello'), timeout=1)
+        await outbound.stop(timeout=0)
+        return bot, result
+
+    bot, result = asyncio.run(scenario())
+    assert result == 'hello'
+    assert bot.calls == 3
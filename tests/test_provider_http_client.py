@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from src.services.providerHttpClient import (
+    CircuitBreaker, CircuitOpenError, ProviderHttpClient, ProviderHttpError, TokenBucket
+)
+
+
+class ScriptedClient(ProviderHttpClient):
+    """ProviderHttpClient whose _send plays back `answers` (status codes, or exceptions) instead of the network."""
+
+    def __init__(self, answers, max_retries=2, threshold=5, reset=60):
+        super().__init__('test', 'https://provider.test')
+        self.answers = list(answers)
+        self.sent = 0
+        self.max_retries = max_retries
+        self.breaker = CircuitBreaker(threshold, reset)
+        self.rate_limiter = TokenBucket(0, 1)
+
+    async def _send(self, method, url, **kwargs):
+        self.sent += 1
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer, {'status': answer}, 0.0
+
+    @staticmethod
+    def _backoff(attempt):
+        return 0.0
+
+
+def test_retries_5xx_until_success():
+    client = ScriptedClient([503, 502, 200])
+    assert asyncio.run(client.get('x')) == (200, {'status': 200})
+    assert client.sent == 3
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_gives_up_after_max_retries():
+    client = ScriptedClient([503, 503, 503, 200], max_retries=2)
+    status, _ = asyncio.run(client.get('x'))
+    assert status == 503
+    assert client.sent == 3
+
+
+def test_client_errors_are_not_retried():
+    client = ScriptedClient([404, 200])
+    status, _ = asyncio.run(client.get('x'))
+    assert status == 404
+    assert client.sent == 1
+
+
+def test_transport_errors_raise_after_retries():
+    error = ProviderHttpError('test', 'https://provider.test/x', 'timed out')
+    client = ScriptedClient([error, error], max_retries=1)
+    with pytest.raises(ProviderHttpError):
+        asyncio.run(client.get('x'))
+    assert client.sent == 2
+
+
+def test_proxy_restart_push_is_sent_once():
+    from src.services.iproxyService import IProxyManager
+
+    assert IProxyManager('key').push_http.max_retries == 0
+
+
+def test_breaker_opens_and_short_circuits():
+    client = ScriptedClient([503] * 3, max_retries=0, threshold=3)
+    for _ in range(3):
+        asyncio.run(client.get('x'))
+    assert client.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(client.get('x'))
+    assert client.sent == 3
+
+
+def test_retried_request_counts_as_one_failure():
+    client = ScriptedClient([503] * 3, max_retries=2, threshold=2)
+    status, _ = asyncio.run(client.get('x'))
+    assert status == 503
+    assert client.sent == 3
+    assert client.breaker.failures == 1
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_probe_may_retry():
+    client = ScriptedClient([503, 200], max_retries=1, threshold=1, reset=0)
+    client.breaker.record_failure('HTTP 503')
+    assert client.breaker.state == CircuitBreaker.HALF_OPEN
+    assert asyncio.run(client.get('x')) == (200, {'status': 200})
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_probe_closes_or_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure('HTTP 503')
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    # Only one probe at a time
+    assert not breaker.allow()
+    breaker.record_failure('HTTP 503')
+    assert breaker.opened_at is not None
+
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_token_bucket_limits_the_rate():
+    async def acquire_all():
+        bucket = TokenBucket(rate=100, capacity=2)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for _ in range(5):
+            await bucket.acquire()
+        return loop.time() - started
+
+    # Two from the burst, three more at 100/s
+    assert asyncio.run(acquire_all()) >= 0.025
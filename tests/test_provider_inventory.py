@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from src.bot.models.proxy_models import Proxy, ProxyConnection
+from src.services.providerHttpClient import ProviderHttpError
+from src.services.providerInventory import ProviderInventory
+
+
+def _proxy(token: str, user: str) -> Proxy:
+    return Proxy(
+        id=token, name=token, authToken=token, proxies=[], user=user, expiration_date=None, days_left=0,
+        hours_left=0, tariff_plan='plan', tariff_expiration_date=None, tariff_days_left=0, deviceModel='phone',
+        active=True, service_name='ipr', description='',
+    )
+
+
+def _connection(connection_id: str) -> ProxyConnection:
+    return ProxyConnection(
+        id=connection_id, userId='', created_timestamp=0, updated_timestamp=0, name='', description='', user='',
+        host='10.0.0.1', port=8000, login='login', password='secret', type='http', connectionId='', active=True,
+    )
+
+
+class FakeManager:
+    service_name = 'ipr'
+
+    def __init__(self):
+        self.proxies = [_proxy('t1', '@alice'), _proxy('t2', '@bob')]
+        self.fail = False
+        self.connection_calls = 0
+
+    async def getAllProxies(self):
+        return self.proxies
+
+    async def getConnectionsOfProxy(self, auth_token):
+        self.connection_calls += 1
+        if self.fail:
+            raise ProviderHttpError('iproxy', f"connections/{auth_token}/proxies", "HTTP 503")
+        return [_connection(f"{auth_token}-1")]
+
+
+def test_live_refresh_keeps_the_user_id_index():
+    inventory = ProviderInventory(ttl=0)
+    manager = FakeManager()
+    inventory.refresh('ipr', [(proxy, None) for proxy in manager.proxies], {'alice': 7})
+
+    # ttl=0: every read refreshes the snapshot from the provider
+    proxies = asyncio.run(inventory.get_user_proxies([manager], user_id=7))
+
+    assert [proxy.authToken for proxy in proxies] == ['t1']
+
+
+def test_failed_connection_fetch_is_not_cached():
+    inventory = ProviderInventory()
+    manager = FakeManager()
+    inventory.refresh('ipr', [(proxy, None) for proxy in manager.proxies])
+
+    manager.fail = True
+    with pytest.raises(ProviderHttpError):
+        asyncio.run(inventory.get_connections(manager, 't1'))
+
+    manager.fail = False
+    connections = asyncio.run(inventory.get_connections(manager, 't1'))
+    assert [connection.id for connection in connections] == ['t1-1']
+    asyncio.run(inventory.get_connections(manager, 't1'))
+    assert manager.connection_calls == 2
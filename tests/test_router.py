@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+from aiogram import Bot, Dispatcher
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher.filters.state import State, StatesGroup
+
+from src.bot.router import Router, RouteConflict
+from src.utils.callback_data import CallbackSchema
+
+
+class Flow(StatesGroup):
+    waiting = State()
+
+
+ITEM = CallbackSchema('rtitem', ('item_id', 'int'))
+
+
+async def handler(obj):
+    pass
+
+
+@pytest.fixture
+def router():
+    async def make():
+        bot = Bot('123456:TEST', validate_token=False)
+        return Router(Dispatcher(bot, storage=MemoryStorage()))
+    return asyncio.run(make())
+
+
+def _name(route):
+    return route.handler.__name__ if route else None
+
+
+def test_longest_prefix_and_exact_routes(router):
+    @router.callback('pay')
+    async def pay(query):
+        pass
+
+    @router.callback('pay_card')
+    async def pay_card(query):
+        pass
+
+    @router.callback('pay_card', exact=True)
+    async def pay_card_exact(query):
+        pass
+
+    assert _name(router.resolve_callback('pay_cash', None)) == 'pay'
+    assert _name(router.resolve_callback('pay_card_visa', None)) == 'pay_card'
+    assert _name(router.resolve_callback('pay_card', None)) == 'pay_card_exact'
+    assert router.resolve_callback('pa', None) is None
+    assert router.resolve_callback('', None) is None
+
+
+def test_routes_are_keyed_by_state(router):
+    @router.callback('next')
+    async def idle(query):
+        pass
+
+    @router.callback('next', state=Flow.waiting)
+    async def waiting(query):
+        pass
+
+    @router.callback('cancel', state='*')
+    async def cancel(query):
+        pass
+
+    assert _name(router.resolve_callback('next', None)) == 'idle'
+    assert _name(router.resolve_callback('next', Flow.waiting.state)) == 'waiting'
+    assert router.resolve_callback('next', 'Other:state') is None
+    assert _name(router.resolve_callback('cancel', Flow.waiting.state)) == 'cancel'
+    assert _name(router.resolve_callback('cancel', None)) == 'cancel'
+
+
+def test_text_routes(router):
+    @router.text("💳 Pay")
+    async def pay(message):
+        pass
+
+    assert _name(router.resolve_text("💳 Pay", None)) == 'pay'
+    assert router.resolve_text("💳 Pay later", None) is None
+    assert router.resolve_text("💳 Pay", Flow.waiting.state) is None
+
+
+def test_duplicate_routes_conflict(router):
+    router.text("Support")(handler)
+    with pytest.raises(RouteConflict):
+        router.text("Support")(handler)
+
+    router.callback('info_', exact=True)(handler)
+    with pytest.raises(RouteConflict):
+        router.callback('info_', exact=True)(handler)
+    # A prefix and an exact route on the same key don't clash, nor do different states
+    router.callback('info_')(handler)
+    router.callback('info_', exact=True, state=Flow.waiting)(handler)
+
+
+def test_state_groups_are_rejected(router):
+    with pytest.raises(TypeError):
+        router.callback('group', state=Flow)(handler)
+
+
+def test_schema_routes_match_their_prefix(router):
+    @router.callback(ITEM)
+    async def item(query, callback_data):
+        pass
+
+    assert _name(router.resolve_callback(ITEM.pack(42), None)) == 'item'
+
+
+def test_admin_only_routes():
+    from src.bot.config import ADMIN_CHAT_ID
+    from src.bot.router import Route
+
+    route = Route(handler, True, 'x')
+    assert route.accepts(ADMIN_CHAT_ID)
+    assert not route.accepts(ADMIN_CHAT_ID + 1)
+
+
+def test_route_passes_only_the_arguments_a_handler_takes():
+    from src.bot.router import Route
+
+    received = {}
+
+    async def needs_state(obj, state):
+        received['state'] = state
+
+    asyncio.run(Route(needs_state, False, 'x')(object(), {'state': 'S', 'raw_state': None, 'route': None}))
+    assert received == {'state': 'S'}
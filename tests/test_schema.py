@@ -0,0 +1,42 @@
+import asyncio
+
+from sqlalchemy import inspect, text
+
+from src.db.models.db_models import RUNTIME_INDEXES, RUNTIME_MODELS, User
+from src.db.async_db import AsyncDatabaseService
+
+
+def test_runtime_tables_are_created_once(tmp_path):
+    async_database = AsyncDatabaseService(url=f"sqlite+aiosqlite:///{tmp_path}/bot.db")
+
+    async def create_and_inspect():
+        # The second call finds the tables and leaves them alone
+        await async_database.create_missing_tables(RUNTIME_MODELS)
+        await async_database.create_missing_tables(RUNTIME_MODELS)
+        async with async_database.engine.connect() as conn:
+            names = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names())
+        await async_database.close()
+        return names
+
+    names = asyncio.run(create_and_inspect())
+    assert {model.__tablename__ for model in RUNTIME_MODELS} <= set(names)
+
+
+def test_runtime_indexes_are_added_to_existing_tables(tmp_path):
+    async_database = AsyncDatabaseService(url=f"sqlite+aiosqlite:///{tmp_path}/bot.db")
+
+    async def create_and_inspect():
+        # A Users table deployed before the indexes existed
+        await async_database.create_missing_tables([User])
+        async with async_database.engine.begin() as conn:
+            for index in RUNTIME_INDEXES:
+                await conn.execute(text(f"DROP INDEX {index.name}"))
+        await async_database.create_missing_indexes(RUNTIME_INDEXES)
+        await async_database.create_missing_indexes(RUNTIME_INDEXES)
+        async with async_database.engine.connect() as conn:
+            names = await conn.run_sync(lambda sync_conn: [index['name'] for index in inspect(sync_conn).get_indexes('Users')])
+        await async_database.close()
+        return names
+
+    names = asyncio.run(create_and_inspect())
+    assert {'ix_Users_is_active_id', 'ix_Users_username', 'ix_Users_first_name', 'ix_Users_last_name'} <= set(names)
@@ -0,0 +1,53 @@
+import asyncio
+
+from sqlalchemy import select
+
+from src.db.async_db import AsyncDatabaseService
+from src.db.models.db_models import Base, User
+from src.db.session_scope import after_commit
+
+
+def test_scope_checks_out_nothing_until_first_query(tmp_path):
+    async def scenario():
+        async_database = AsyncDatabaseService(url=f"sqlite+aiosqlite:///{tmp_path}/scope.db")
+        ran = []
+
+        scope = await async_database.open_scope()
+        after_commit(lambda: ran.append(True))
+        checked_out = async_database.engine.pool.checkedout()
+        await async_database.close_scope(scope)
+
+        await async_database.close()
+        return checked_out, scope.session, ran
+
+    checked_out, session, ran = asyncio.run(scenario())
+    assert checked_out == 0
+    assert session is None
+    assert ran == [True]
+
+
+def test_commit_scope_releases_connection_and_keeps_earlier_work(tmp_path):
+    async def scenario():
+        async_database = AsyncDatabaseService(url=f"sqlite+aiosqlite:///{tmp_path}/scope.db")
+        async with async_database.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        scope = await async_database.open_scope()
+        async with async_database.get_session() as session:
+            session.add(User(telegram_user_id=1, telegram_chat_id=1, username='first'))
+        await async_database.commit_scope()
+        released = async_database.engine.pool.checkedout() == 0
+
+        # Work after the early commit reopens the scope and is rolled back with it
+        async with async_database.get_session() as session:
+            session.add(User(telegram_user_id=2, telegram_chat_id=2, username='second'))
+        await async_database.close_scope(scope, failed=True)
+
+        async with async_database.get_session() as session:
+            usernames = (await session.execute(select(User.username))).scalars().all()
+        await async_database.close()
+        return released, usernames
+
+    released, usernames = asyncio.run(scenario())
+    assert released
+    assert usernames == ['first']
@@ -0,0 +1,115 @@
+import asyncio
+import types
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.bot.models.proxy_models import Proxy
+from src.db.models.db_models import Base, DBProxyConnection, UserConnectionChange, UserConnectionChangeType
+from src.services.iproxyService import IProxyManager
+from src.services.localtonetService import LocaltonetManager
+from src.services.providerHttpClient import ProviderHttpError
+
+
+class FakeHttp:
+    """Stands in for the iProxy ProviderHttpClient; `failing` proxies answer 503."""
+
+    name = 'iproxy'
+
+    def __init__(self, connections_per_proxy: int = 2):
+        self.connections_per_proxy = connections_per_proxy
+        self.failing = set()
+
+    def url(self, path):
+        return f"https://iproxy.test/{path}"
+
+    async def get(self, path, **kwargs):
+        proxy_id = path.split('/')[1]
+        if proxy_id in self.failing:
+            return 503, {'error': 'Injected failure'}
+        return 200, {'result': [
+            {
+                'id': f"{proxy_id}-{n}", 'createdTimestamp': 1700000000000, 'updatedTimestamp': 1700000000000,
+                'name': f"conn {n}", 'description': f"@user_{proxy_id}", 'ip': '10.0.0.1', 'port': 8000 + n,
+                'login': 'login', 'password': 'secret', 'type': 'http', 'active': True,
+            }
+            for n in range(self.connections_per_proxy)
+        ]}
+
+
+def _proxy(proxy_id: str) -> Proxy:
+    return Proxy(
+        id=proxy_id, name=proxy_id, authToken=proxy_id, proxies=[], user=f"@user_{proxy_id}",
+        expiration_date=None, days_left=0, hours_left=0, tariff_plan='plan', tariff_expiration_date=None,
+        tariff_days_left=0, deviceModel='phone', active=True, service_name='ipr', description='',
+    )
+
+
+@pytest.fixture
+def manager():
+    engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+    Base.metadata.create_all(engine)
+    database = types.SimpleNamespace(Session=sessionmaker(bind=engine))
+    manager = IProxyManager('test', database=database)
+    manager.http = FakeHttp()
+    proxies = [_proxy(f"p{n}") for n in range(5)]
+
+    async def get_all_proxies():
+        return proxies
+
+    manager.getAllProxies = get_all_proxies
+    yield manager
+    engine.dispose()
+
+
+def _connections(manager):
+    with manager.database.Session() as session:
+        return {row.id: row.deleted for row in session.execute(select(DBProxyConnection.id, DBProxyConnection.deleted))}
+
+
+def test_error_answer_raises_instead_of_empty_list(manager):
+    manager.http.failing.add('p0')
+    with pytest.raises(ProviderHttpError):
+        asyncio.run(manager.getConnectionsOfProxy('p0'))
+
+
+def test_localtonet_api_error_raises():
+    class ErrorHttp(FakeHttp):
+        async def get(self, path, **kwargs):
+            return 200, {'hasError': True, 'errors': ['AuthToken not found.'], 'result': None}
+
+    manager = LocaltonetManager('test')
+    manager.http = ErrorHttp()
+    with pytest.raises(ProviderHttpError):
+        asyncio.run(manager.getConnectionsOfProxy('token'))
+
+
+def test_failed_proxy_keeps_its_connections(manager):
+    stats = asyncio.run(manager.sync_connections(full=True))
+    assert stats.connections_inserted == 10
+    assert not any(_connections(manager).values())
+
+    manager.http.failing.update({'p1', 'p3'})
+    stats = asyncio.run(manager.sync_connections(full=True))
+
+    assert stats.proxies_failed == 2
+    assert stats.connections_deleted == 0
+    assert not any(_connections(manager).values())
+    with manager.database.Session() as session:
+        unassigned = session.execute(
+            select(UserConnectionChange).where(UserConnectionChange.change_type == UserConnectionChangeType.UNASSIGNED)
+        ).first()
+    assert unassigned is None
+
+
+def test_connections_gone_upstream_are_deleted(manager):
+    asyncio.run(manager.sync_connections(full=True))
+
+    manager.http.connections_per_proxy = 1
+    stats = asyncio.run(manager.sync_connections(full=True))
+
+    assert stats.proxies_failed == 0
+    assert stats.connections_deleted == 5
+    assert sum(_connections(manager).values()) == 5
@@ -0,0 +1,106 @@
+import asyncio
+import types
+from datetime import datetime, timezone
+
+import pytest
+
+from src.db.async_db import AsyncDatabaseService
+from src.db.models.db_models import Base, User
+from src.db.repositories.user_repositories import AsyncUserRepository
+from src.db.user_cache import UserIdentityCache, client_count_cache
+
+
+def _message(telegram_user_id: int):
+    return types.SimpleNamespace(
+        from_user=types.SimpleNamespace(id=telegram_user_id, username='alice', first_name='Alice', last_name=None),
+        chat=types.SimpleNamespace(id=telegram_user_id),
+        date=datetime(2024, 5, 1, tzinfo=timezone.utc),
+    )
+
+
+@pytest.mark.parametrize('failed, cached', [(False, True), (True, False)])
+def test_new_users_are_cached_only_once_committed(tmp_path, failed, cached):
+    async def scenario():
+        async_database = AsyncDatabaseService(url=f"sqlite+aiosqlite:///{tmp_path}/users.db")
+        async with async_database.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        cache = UserIdentityCache()
+
+        scope = await async_database.open_scope()
+        async with async_database.get_session() as session:
+            user = await AsyncUserRepository(session, cache).get_or_create_user(_message(42))
+        assert user is not None
+        # Nothing is committed yet
+        assert cache.get(42) is None
+        await async_database.close_scope(scope, failed=failed)
+
+        entry = cache.get(42)
+        await async_database.close()
+        return entry
+
+    entry = asyncio.run(scenario())
+    assert (entry is not None) == cached
+
+
+async def _users_database(tmp_path, users):
+    async_database = AsyncDatabaseService(url=f"sqlite+aiosqlite:///{tmp_path}/users.db")
+    async with async_database.engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_database.get_session() as session:
+        session.add_all(users)
+        await session.commit()
+    return async_database
+
+
+def test_clients_are_paged_forward_and_backward(tmp_path):
+    async def scenario():
+        users = [User(id=user_id, telegram_user_id=user_id, username=f"user{user_id}", is_active=True) for user_id in range(1, 6)]
+        users.append(User(id=6, telegram_user_id=6, username='gone', is_active=False))
+        async_database = await _users_database(tmp_path, users)
+        pages = []
+        async with async_database.get_user_repository() as user_repository:
+            for kwargs in ({}, {'after_id': 2}, {'after_id': 4}, {'before_id': 5}, {'before_id': 3}):
+                page, more = await user_repository.get_clients_page(True, 2, **kwargs)
+                pages.append(([user.id for user in page], more))
+        await async_database.close()
+        return pages
+
+    assert asyncio.run(scenario()) == [
+        ([1, 2], True),
+        ([3, 4], True),
+        ([5], False),
+        ([3, 4], True),
+        ([1, 2], False),
+    ]
+
+
+def test_client_search_escapes_like_wildcards(tmp_path):
+    async def scenario():
+        usernames = ['a_b', 'axb', '50%off', '50off']
+        users = [User(telegram_user_id=index, username=username, is_active=True) for index, username in enumerate(usernames)]
+        async_database = await _users_database(tmp_path, users)
+        found = {}
+        async with async_database.get_user_repository() as user_repository:
+            for search in ('a_b', '50%', '@axb'):
+                page, _ = await user_repository.get_clients_page(True, 10, search=search)
+                found[search] = [user.username for user in page]
+        await async_database.close()
+        return found
+
+    assert asyncio.run(scenario()) == {'a_b': ['a_b'], '50%': ['50%off'], '@axb': ['axb']}
+
+
+def test_deactivating_users_clears_the_client_counts(tmp_path):
+    async def scenario():
+        client_count_cache.clear()
+        users = [User(telegram_user_id=user_id, telegram_chat_id=user_id, is_active=True) for user_id in range(1, 4)]
+        async_database = await _users_database(tmp_path, users)
+        async with async_database.get_user_repository() as user_repository:
+            before = await user_repository.count_clients(True)
+            recipients = await user_repository.get_recipients_batch([], after_id=0, limit=1)
+            await user_repository.deactivate_users(recipients)
+            after = await user_repository.count_clients(True)
+        await async_database.close()
+        return before, after
+
+    assert asyncio.run(scenario()) == (3, 2)
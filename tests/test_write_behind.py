@@ -0,0 +1,103 @@
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import select
+
+from src.db import write_behind
+from src.db.async_db import AsyncDatabaseService
+from src.db.models.db_models import Base, User
+from src.db.write_behind import UserTouchBuffer
+
+EARLY = datetime(2024, 5, 1, 10, 0)
+LATE = datetime(2024, 5, 1, 12, 0)
+
+
+async def _database(tmp_path, users=(), create=True):
+    async_database = AsyncDatabaseService(url=f"sqlite+aiosqlite:///{tmp_path}/touches.db")
+    if create:
+        await _create(async_database, users)
+    return async_database
+
+
+async def _create(async_database, users):
+    async with async_database.engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_database.get_session() as session:
+        session.add_all([User(telegram_user_id=user_id, telegram_chat_id=0, last_message_at=EARLY) for user_id in users])
+        await session.commit()
+
+
+async def _rows(async_database):
+    async with async_database.get_session() as session:
+        result = await session.execute(select(User.telegram_user_id, User.telegram_chat_id, User.last_message_at))
+        return {row.telegram_user_id: (row.telegram_chat_id, row.last_message_at) for row in result}
+
+
+def test_touches_of_the_same_user_are_coalesced():
+    buffer = UserTouchBuffer(async_database=None)
+    buffer.touch(1, 10, EARLY)
+    buffer.touch(1, 11, LATE)
+    # An older touch arriving late doesn't win
+    buffer.touch(1, 12, EARLY)
+
+    assert buffer._pending == {1: (11, LATE)}
+
+
+def test_flush_writes_chat_id_and_timestamp_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(write_behind, 'FLUSH_CHUNK_SIZE', 2)
+
+    async def scenario():
+        async_database = await _database(tmp_path, users=[1, 2, 3, 4])
+        buffer = UserTouchBuffer(async_database)
+        for user_id in (1, 2, 3):
+            buffer.touch(user_id, user_id * 100, LATE)
+        flushed = await buffer.flush()
+        rows = await _rows(async_database)
+        await async_database.close()
+        return flushed, rows, buffer._pending
+
+    flushed, rows, pending = asyncio.run(scenario())
+    assert flushed == 3
+    assert pending == {}
+    assert rows == {1: (100, LATE), 2: (200, LATE), 3: (300, LATE), 4: (0, EARLY)}
+
+
+def test_failed_flush_requeues_without_overwriting_newer_touches(tmp_path):
+    async def scenario():
+        # The Users table doesn't exist yet, so the first flush fails
+        async_database = await _database(tmp_path, create=False)
+        buffer = UserTouchBuffer(async_database)
+        buffer.touch(1, 100, EARLY)
+        buffer.touch(2, 200, EARLY)
+        failed = await buffer.flush()
+        buffer.touch(2, 201, LATE)
+        requeued = dict(buffer._pending)
+
+        await _create(async_database, users=[1, 2])
+        flushed = await buffer.flush()
+        rows = await _rows(async_database)
+        await async_database.close()
+        return failed, requeued, flushed, rows
+
+    failed, requeued, flushed, rows = asyncio.run(scenario())
+    assert failed == 0
+    assert requeued == {1: (100, EARLY), 2: (201, LATE)}
+    assert flushed == 2
+    assert rows == {1: (100, EARLY), 2: (201, LATE)}
+
+
+def test_stop_flushes_what_is_left(tmp_path):
+    async def scenario():
+        async_database = await _database(tmp_path, users=[1])
+        # The periodic flush never gets to run; on_shutdown's stop() writes the touch
+        buffer = UserTouchBuffer(async_database, flush_interval=3600)
+        buffer.start()
+        buffer.touch(1, 100, LATE)
+        await buffer.stop()
+        rows = await _rows(async_database)
+        await async_database.close()
+        return buffer._task, rows
+
+    task, rows = asyncio.run(scenario())
+    assert task is None
+    assert rows == {1: (100, LATE)}